@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Runs Table.process_table end to end on synthetic Terra tables and reports the time and memory of every stage
+
+Reads and assemblies are local files and the "bucket" is a local directory, so no gcloud or network access is needed.
+
+Example:
+  python3 benchmarks/benchmark.py --sizes 1000 10000 --organisms sars-cov-2 mpox flu --save_baseline baseline.json
+  python3 benchmarks/benchmark.py --sizes 1000 10000 --compare baseline.json
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import tempfile
+import logging
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mercury"))
+
+# the number of distinct read and assembly files; rows reuse them so large tables do not need millions of files
+FILE_POOL_SIZE = 50
+
+def write_file_pool(directory):
+  """This function writes a small pool of assemblies and read files that the synthetic rows point to
+  """
+  for index in range(FILE_POOL_SIZE):
+    with open(os.path.join(directory, f"assembly_{index}.fasta"), "w") as assembly:
+      assembly.write(f">consensus_{index}\n" + "ACGTN" * 200 + "\n")
+    for read in ("R1", "R2"):
+      with open(os.path.join(directory, f"reads_{index}_{read}.fastq.gz"), "w") as reads:
+        reads.write(f"@read_{index}\nACGT\n+\nIIII\n")
+
+def make_table(size, organism, directory, missing_fraction, vadr_fraction, bad_date_fraction, seed):
+  """This function writes a synthetic Terra table
+
+  Returns:
+    String: The path of the table
+    List: The sample names
+  """
+  import numpy as np
+  import pandas as pd
+
+  random = np.random.default_rng(seed)
+  samples = np.char.add("sample_", np.arange(size).astype(str))
+  pool = np.arange(size) % FILE_POOL_SIZE
+  table = pd.DataFrame({
+    "sample_id": samples,
+    "submission_id": samples,
+    "collection_date": np.where(random.random(size) < bad_date_fraction, "03/04/2021", "2021-03-01"),
+    "organism": {"sars-cov-2": "SARS-CoV-2", "mpox": "Mpox", "flu": "Influenza A virus"}[organism],
+    "country": "USA",
+    "state": "NY",
+    "county": np.where(random.random(size) < 0.5, "Kings", ""),
+    "continent": "North America",
+    "collecting_lab": "Collecting Lab",
+    "collected_by": "Collecting Lab",
+    "collecting_lab_address": "1 Main St",
+    "submitting_lab": "Submitting Lab",
+    "submitting_lab_address": "2 Side St",
+    "authors": "A. Author, B. Author",
+    "gisaid_submitter": "submitter",
+    "host_disease": "COVID-19",
+    "isolation_source": "clinical",
+    "isolation_type": "clinical",
+    "lat_lon": "40.7 N 74.0 W",
+    "geo_loc_name": "USA: NY",
+    "host": "Human",
+    "purpose_of_sequencing": "baseline surveillance",
+    "library_id": np.char.add(samples, "_library"),
+    "library_strategy": "WGS",
+    "library_source": "VIRAL RNA",
+    "library_selection": "RT-PCR",
+    "library_layout": "paired",
+    "instrument_model": "NextSeq 2000",
+    "seq_platform": "Illumina",
+    "platform": "Illumina",
+    "assembly_method": "ivar",
+    "assembly_mean_coverage": random.integers(50, 2000, size),
+    "bioproject_accession": "PRJNA000000",
+    "vadr_num_alerts": np.where(random.random(size) < vadr_fraction, "2", "0").astype(object),
+    "number_n": random.integers(0, 1000, size),
+    "patient_age": random.integers(1, 90, size),
+    "patient_gender": "unknown",
+    "abricate_flu_type": "Type_A",
+    "abricate_flu_subtype": "H3N2",
+    "assembly_fasta": [os.path.join(directory, f"assembly_{index}.fasta") for index in pool],
+    "read1_dehosted": [os.path.join(directory, f"reads_{index}_R1.fastq.gz") for index in pool],
+    "read2_dehosted": [os.path.join(directory, f"reads_{index}_R2.fastq.gz") for index in pool],
+  })
+  # some VADR failures are skipped assemblies instead of alerts
+  skipped = (table["vadr_num_alerts"] == "2") & (random.random(size) < 0.2)
+  table.loc[skipped, "vadr_num_alerts"] = "VADR skipped due to poor assembly"
+  # blank out one required column in a fraction of the rows
+  required_columns = ["collecting_lab", "country", "bioproject_accession", "library_id", "submitting_lab_address", "isolation_source"]
+  missing_rows = np.flatnonzero(random.random(size) < missing_fraction)
+  missing_columns = random.integers(0, len(required_columns), len(missing_rows))
+  for column_index, column in enumerate(required_columns):
+    table.loc[table.index[missing_rows[missing_columns == column_index]], column] = np.nan
+
+  path = os.path.join(directory, "table.tsv")
+  table.to_csv(path, sep="\t", index=False)
+  return path, list(samples)
+
+def run_case(organism, size, arguments):
+  """This function runs one benchmark case in a fresh process and returns its run report
+  """
+  from Metadata import Metadata
+  from RunReport import RunReport
+  from Table import Table
+
+  logging.basicConfig(level=logging.ERROR, stream=sys.stderr)
+  logger = logging.getLogger("benchmark")
+  with tempfile.TemporaryDirectory() as directory:
+    write_file_pool(directory)
+    table_path, samples = make_table(size, organism, directory, arguments.missing_fraction, arguments.vadr_fraction, arguments.bad_date_fraction, arguments.seed)
+    bucket = os.path.join(directory, "bucket")
+    os.makedirs(bucket)
+
+    run_report = RunReport(logger)
+    metadata_list = Metadata(logger, organism, arguments.skip_ncbi, "assembly_mean_coverage").get_metadata()
+    table = Table(logger, organism, table_path, "sample_id", samples, False, arguments.skip_ncbi, False, metadata_list,
+                  0, 5000, "assembly_fasta", os.path.join(directory, "benchmark"), bucket, False, "read1_dehosted",
+                  "assembly_mean_coverage", "", "", "", "", "", "", "", "", "", "", "", "", "", "", "", "", "", "", "", "", "", "read2_dehosted",
+                  transfer_concurrency=arguments.transfer_concurrency, cache_directory=os.path.join(directory, "cache"), run_report=run_report)
+    table.process_table()
+    return run_report.to_dict()
+
+def summarize(organism, size, report):
+  """This function turns a run report into per-stage throughput rows
+  """
+  rows = []
+  for stage in report["stages"]:
+    rows_in = stage["rows_in"] or size
+    throughput = rows_in / stage["seconds"] if stage["seconds"] > 0 else None
+    rows.append({"organism": organism, "size": size, "stage": stage["stage"], "seconds": stage["seconds"],
+                 "rows_per_second": round(throughput) if throughput else None, "peak_rss_mb": stage["peak_rss_mb"],
+                 "peak_rss_increase_mb": stage["peak_rss_increase_mb"]})
+  rows.append({"organism": organism, "size": size, "stage": "total", "seconds": report["total_seconds"],
+               "rows_per_second": round(size / report["total_seconds"]), "peak_rss_mb": report["peak_rss_mb"], "peak_rss_increase_mb": None})
+  return rows
+
+def compare(results, baseline, tolerance):
+  """This function prints every stage that is slower (or uses more memory) than the baseline by more than the tolerance;
+  the memory of a stage is how far its peak rose above the memory in use when it started, so the memory kept by earlier
+  stages is not counted again, and the peak memory is only compared for the whole run
+
+  Returns:
+    Int: The number of regressions
+  """
+  baseline_rows = {(row["organism"], row["size"], row["stage"]): row for row in baseline["results"]}
+  regressions = 0
+  for row in results:
+    previous = baseline_rows.get((row["organism"], row["size"], row["stage"]))
+    if previous is None:
+      continue
+    for metric in ("seconds", "peak_rss_mb" if row["stage"] == "total" else "peak_rss_increase_mb"):
+      # very short stages, and memory growth of a few MB, are too noisy to compare
+      if metric == "seconds" and previous[metric] < 0.05:
+        continue
+      if metric != "seconds" and (row[metric] or 0) - (previous.get(metric) or 0) < 5:
+        continue
+      if previous.get(metric) and row[metric] and row[metric] > previous[metric] * (1 + tolerance):
+        regressions += 1
+        print(f"REGRESSION {row['organism']} {row['size']} {row['stage']} {metric}: {previous[metric]} -> {row[metric]}")
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(prog="benchmark", description="Benchmarks Mercury on synthetic Terra tables")
+  parser.add_argument("--sizes", help="The numbers of rows to benchmark (default: 1000 10000)", nargs="+", type=int, default=[1000, 10000])
+  parser.add_argument("--organisms", help="The organisms to benchmark (default: sars-cov-2 flu mpox)", nargs="+", default=["sars-cov-2", "flu", "mpox"])
+  parser.add_argument("--missing_fraction", help="The fraction of rows missing a required value (default: 0.02)", type=float, default=0.02)
+  parser.add_argument("--vadr_fraction", help="The fraction of rows failing VADR (default: 0.05)", type=float, default=0.05)
+  parser.add_argument("--bad_date_fraction", help="The fraction of rows with an incorrectly formatted date (default: 0.02)", type=float, default=0.02)
+  parser.add_argument("--skip_ncbi", help="Add to benchmark only the GISAID outputs", action="store_true", default=False)
+  parser.add_argument("--transfer_concurrency", help="The number of concurrent read copies (default: 8)", type=int, default=8)
+  parser.add_argument("--seed", help="The random seed (default: 0)", type=int, default=0)
+  parser.add_argument("--save_baseline", help="Write the results to this JSON file", type=str)
+  parser.add_argument("--compare", help="Compare the results to this baseline JSON file", type=str)
+  parser.add_argument("--tolerance", help="The allowed slowdown before a stage is reported as a regression (default: 0.2)", type=float, default=0.2)
+  arguments = parser.parse_args()
+
+  results = []
+  for organism in arguments.organisms:
+    for size in arguments.sizes:
+      # every case runs in its own process so the peak memory of one case does not hide that of the next
+      with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        report = executor.submit(run_case, organism, size, arguments).result()
+      rows = summarize(organism, size, report)
+      results.extend(rows)
+      for row in rows:
+        print(f"{row['organism']:<12}{row['size']:>10}  {row['stage']:<28}{row['seconds']:>10.3f}s{str(row['rows_per_second']):>14} rows/s{str(row['peak_rss_mb']):>10} MB{str(row['peak_rss_increase_mb']):>10} MB")
+
+  if arguments.save_baseline:
+    with open(arguments.save_baseline, "w") as baseline_file:
+      json.dump({"arguments": vars(arguments), "results": results}, baseline_file, indent=2)
+  if arguments.compare:
+    with open(arguments.compare) as baseline_file:
+      regressions = compare(results, json.load(baseline_file), arguments.tolerance)
+    print(f"{regressions} regression(s) found")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+  main()
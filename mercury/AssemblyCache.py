@@ -0,0 +1,261 @@
+from Storage import get_storage, is_remote
+from Transfer import TransferScheduler, TransferError, merge_statistics
+import contextlib
+import threading
+import tempfile
+import hashlib
+import fcntl
+import json
+import time
+import os
+
+
+def get_default_cache_directory():
+  """This function returns the default assembly cache directory ($XDG_CACHE_HOME/mercury or ~/.cache/mercury)
+  """
+  return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "mercury")
+
+
+class AssemblyCache:
+  """This class keeps downloaded assemblies in a local directory so each one is fetched at most once; the directory may
+  be shared by runs in other processes (e.g., batch jobs), so the index is only changed under a file lock and every run
+  holds a lease on the assemblies it uses, which keeps the other runs from evicting them
+  """
+
+  def __init__(self, logger, cache_directory, max_size_bytes, transfer_concurrency=8, transfer_retries=3, run_manifest=None, transfer_batch_size=1000,
+               storage_backend="auto", limiter=None):
+    self.logger = logger
+    self.cache_directory = cache_directory
+    self.max_size_bytes = max_size_bytes
+    self.transfer_concurrency = transfer_concurrency
+    self.transfer_retries = transfer_retries
+    # completed downloads are recorded in the run manifest (optional)
+    self.run_manifest = run_manifest
+    # the maximum number of assemblies downloaded by one gcloud call; 0 downloads every assembly with its own call
+    self.transfer_batch_size = transfer_batch_size
+    self.storage_backend = storage_backend
+    # bounds the transfers running at the same time across every transfer scheduler of the run (optional)
+    self.limiter = limiter
+    self.index_path = os.path.join(self.cache_directory, "index.json")
+    self.lock_path = os.path.join(self.cache_directory, "index.lock")
+    self.lease_directory = os.path.join(self.cache_directory, "leases")
+    # the local paths of the assemblies fetched during this run, an event set once each one is available
+    # (so fasta files can be written while the remaining assemblies download), and the assemblies that failed
+    self.paths = {}
+    self.ready = {}
+    self.failed = set()
+    # prefetches started at the same time (e.g., by writers running concurrently) plan their downloads one after the other
+    self.lock = threading.Lock()
+
+    os.makedirs(self.lease_directory, exist_ok=True)
+    self.index = {}
+    # the lease is created under the index lock so evict never mistakes it for the lease of a run that ended
+    with self.locked_index():
+      lease_descriptor, self.lease_path = tempfile.mkstemp(prefix=f"{os.getpid()}.", suffix=".lease", dir=self.lease_directory)
+      self.lease = os.fdopen(lease_descriptor, "w")
+      fcntl.flock(self.lease, fcntl.LOCK_EX)
+
+  def get_key(self, uri, version):
+    return hashlib.sha256(f"{uri}#{version}".encode()).hexdigest()
+
+  @contextlib.contextmanager
+  def locked_index(self):
+    """This function locks the index against the other processes sharing the cache and reads its latest copy; the
+    index is written back when the block ends without an error. Callers also hold self.lock once the cache is created
+    """
+    with open(self.lock_path, "a") as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      self.index = self.read_index()
+      yield
+      self.write_index()
+
+  def read_index(self):
+    if not os.path.exists(self.index_path):
+      return {}
+    try:
+      with open(self.index_path) as index_file:
+        return json.load(index_file)
+    except (OSError, ValueError):
+      self.logger.warning("CACHE:Warning: the assembly cache index could not be read; starting with an empty cache")
+      return {}
+
+  def write_index(self):
+    temporary_path = self.index_path + ".tmp"
+    with open(temporary_path, "w") as index_file:
+      json.dump(self.index, index_file)
+    os.replace(temporary_path, self.index_path)
+
+  def get_leased_keys(self):
+    """This function reads the leases of the other runs using the cache (called with the index locked); the leases
+    of runs that ended without releasing them are removed
+
+    Returns:
+      Set: The keys of the assemblies used by the other runs
+    """
+    keys = set()
+    for entry in os.scandir(self.lease_directory):
+      if entry.path == self.lease_path:
+        continue
+      try:
+        with open(entry.path) as lease:
+          try:
+            fcntl.flock(lease, fcntl.LOCK_SH | fcntl.LOCK_NB)
+          except BlockingIOError:
+            keys.update(lease.read().split())
+          else:
+            os.remove(entry.path)
+      except FileNotFoundError:
+        continue
+    return keys
+
+  def evict(self):
+    """This function removes the least recently used assemblies until the cache is below its size limit (called with
+    the index locked); assemblies used during this run or leased by another run are kept
+    """
+    total_size = sum(entry["size"] for entry in self.index.values())
+    if total_size <= self.max_size_bytes:
+      return
+    in_use = set(self.paths.values()) | {os.path.join(self.cache_directory, key) for key in self.get_leased_keys()}
+    for key, entry in sorted(self.index.items(), key=lambda item: item[1]["last_used"]):
+      if total_size <= self.max_size_bytes:
+        break
+      path = os.path.join(self.cache_directory, key)
+      if path in in_use:
+        continue
+      self.logger.debug(f"CACHE:Evicting {entry['uri']} from the assembly cache")
+      if os.path.exists(path):
+        os.remove(path)
+      total_size -= entry["size"]
+      del self.index[key]
+
+  def prefetch(self, uris):
+    """This function makes every assembly available locally, downloading only those that are not cached yet;
+    local assemblies are used in place
+
+    Args:
+      uris (List): The assembly URIs or local paths
+
+    Returns:
+      Dict: The number of files and bytes downloaded and the elapsed seconds, or None if nothing had to be checked
+    """
+    download_assemblies = self.plan(uris)
+    return download_assemblies() if download_assemblies is not None else None
+
+  def plan(self, uris):
+    """This function looks up which assemblies are not cached yet (see prefetch) without downloading them, so the
+    downloads can run while the assemblies that are already available are used
+
+    Args:
+      uris (List): The assembly URIs or local paths
+
+    Returns:
+      Function: Downloads the assemblies and returns the statistics described in prefetch, or None if nothing had to be checked
+    """
+    with self.lock:
+      uris = [uri for uri in dict.fromkeys(uris) if uri not in self.paths]
+      for uri in uris:
+        self.ready[uri] = threading.Event()
+        if not is_remote(uri):
+          self.paths[uri] = uri
+          self.ready[uri].set()
+      uris = [uri for uri in uris if is_remote(uri)]
+      if not uris:
+        return None
+
+      storage = get_storage(*uris, backend=self.storage_backend)
+      versions = storage.versions(uris)
+      downloads = []
+      with self.locked_index():
+        now = time.time()
+        for uri in uris:
+          version = versions.get(uri)
+          key = self.get_key(uri, version)
+          path = os.path.join(self.cache_directory, key)
+          self.paths[uri] = path
+          # an unknown version cannot be trusted across runs, so it is always downloaded again
+          if version is not None and key in self.index and os.path.exists(path):
+            self.logger.debug(f"CACHE:Using cached copy of {uri}")
+            self.index[key]["last_used"] = now
+            self.ready[uri].set()
+          else:
+            downloads.append((uri, path))
+            self.index[key] = {"uri": uri, "version": version, "size": 0, "last_used": now}
+        # leased before the index is unlocked, so no other run evicts these assemblies while they are used
+        self.lease.write("".join(self.get_key(uri, versions.get(uri)) + "\n" for uri in uris))
+        self.lease.flush()
+
+    self.logger.debug(f"CACHE:{len(uris) - len(downloads)} of {len(uris)} assemblies found in the cache; downloading {len(downloads)}")
+
+    def record_download(source, destination):
+      size = os.path.getsize(destination)
+      if self.run_manifest is not None:
+        self.run_manifest.record("download", source, destination, size, version=versions.get(source))
+      self.ready[source].set()
+      return size
+
+    def download(source, destination):
+      # download next to the final path and move it into place so an interrupted download is never used;
+      # the process id keeps batch jobs sharing the cache from writing to the same temporary file
+      temporary_path = f"{destination}.{os.getpid()}.part"
+      storage.copy(source, temporary_path)
+      os.replace(temporary_path, destination)
+      return record_download(source, destination)
+
+    def download_batch(batch):
+      # batched downloads are staged next to their destinations and moved into place by copy_batch
+      results, failures = storage.copy_batch(batch)
+      return {(source, destination): record_download(source, destination) for source, destination in results}, failures
+
+    def download_assemblies():
+      batched_downloads = [download for download in downloads if self.transfer_batch_size > 0 and storage.can_copy_batch(*download)]
+      single_downloads = [download for download in downloads if not (self.transfer_batch_size > 0 and storage.can_copy_batch(*download))]
+      scheduler = TransferScheduler(self.logger, self.transfer_concurrency, self.transfer_retries, limiter=self.limiter)
+      try:
+        statistics = []
+        if single_downloads:
+          statistics.append(scheduler.run(single_downloads, download))
+        if batched_downloads:
+          statistics.append(scheduler.run_batches(batched_downloads, download_batch, lambda batch: storage.make_batches(batch, self.transfer_batch_size)))
+        statistics = merge_statistics(statistics)
+      finally:
+        with self.lock, self.locked_index():
+          now = time.time()
+          for uri, path in downloads:
+            key = os.path.basename(path)
+            if os.path.exists(path):
+              # another run may have dropped the entry while this one was downloading
+              self.index[key] = {"uri": uri, "version": versions.get(uri), "size": os.path.getsize(path), "last_used": now}
+              self.ready[uri].set()
+            else:
+              self.index.pop(key, None)
+              # release anyone waiting for an assembly that could not be downloaded
+              self.failed.add(uri)
+              self.ready[uri].set()
+          self.evict()
+      return {**statistics, "cached": len(uris) - len(downloads)}
+
+    return download_assemblies
+
+  def close(self):
+    """This function releases the lease on the assemblies used by this run, so other runs may evict them
+    """
+    if self.lease is not None:
+      os.remove(self.lease_path)
+      self.lease.close()
+      self.lease = None
+
+  def get(self, uri):
+    """This function returns the local path of an assembly, fetching it first if needed
+
+    Args:
+      uri (String): The assembly URI or local path
+
+    Returns:
+      String: The local path of the assembly, once it is available
+    """
+    if uri not in self.paths:
+      self.prefetch([uri])
+    self.ready[uri].wait()
+    if uri in self.failed:
+      raise TransferError(f"the assembly {uri} could not be downloaded", [uri], [], [])
+    return self.paths[uri]
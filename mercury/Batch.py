@@ -0,0 +1,141 @@
+from concurrent.futures import ProcessPoolExecutor
+from Runner import Runner
+from Table import read_input_table
+import CheckInputs
+import multiprocessing
+import argparse
+import logging
+import copy
+import json
+import csv
+import sys
+
+# the input table shared by every job of a batch; set in each worker process by set_shared_table
+shared_table = None
+
+def set_shared_table(table):
+  global shared_table
+  shared_table = table
+
+def run_job(job_number, options):
+  """This function runs one job of a batch in a worker process
+
+  Returns:
+    Int: The exit code of the job (0 if it succeeded)
+  """
+  try:
+    Runner(options).run(input_dataframe=shared_table)
+  except SystemExit as exit_error:
+    return exit_error.code if isinstance(exit_error.code, int) else 1
+  except Exception as error:
+    logging.getLogger(__name__).error(f"BATCH:Error: job {job_number} ({options.output_prefix}) failed: {error}")
+    return 1
+  return 0
+
+
+class Batch:
+  """This class runs several Mercury jobs (e.g., one per lab or organism) against the same input table
+  """
+
+  def __init__(self, parser, options):
+    logging.basicConfig(encoding='utf-8', level=logging.ERROR, stream=sys.stderr)
+    self.logger = logging.getLogger(__name__)
+    if options.verbose:
+      self.logger.setLevel(logging.INFO)
+    elif options.debug:
+      self.logger.setLevel(logging.DEBUG)
+
+    self.parser = parser
+    self.options = options
+    self.batch_manifest = options.batch_manifest
+    self.batch_workers = options.batch_workers
+
+  def read_manifest(self):
+    """This function reads the jobs from a JSON list of objects or a TSV file with a header
+
+    Returns:
+      List: One dictionary of option names and values per job
+    """
+    self.logger.debug(f"BATCH:Reading batch manifest {self.batch_manifest}")
+    with open(self.batch_manifest) as manifest:
+      if self.batch_manifest.lower().endswith(".json"):
+        jobs = json.load(manifest)
+      else:
+        jobs = [{key: value for key, value in row.items() if value not in (None, "")} for row in csv.DictReader(manifest, delimiter="\t")]
+    if not isinstance(jobs, list) or not jobs:
+      self.logger.error("BATCH:Error: the batch manifest must contain at least one job")
+      sys.exit(1)
+    return jobs
+
+  def convert_value(self, action, value):
+    """This function converts a manifest value into the type the matching command line option would have produced
+    """
+    if isinstance(action, argparse._StoreTrueAction):
+      return value if isinstance(value, bool) else str(value).strip().lower() in ("true", "yes", "1")
+    if action.nargs == "*":
+      return value if isinstance(value, list) else str(value).split()
+    if action.type is CheckInputs.is_comma_delimited_list and isinstance(value, list):
+      return value
+    if action.type is not None:
+      return action.type(value if isinstance(value, str) else str(value))
+    return value
+
+  def make_job_options(self, job):
+    """This function applies the options of one job on top of the options given on the command line
+
+    Args:
+      job (Dict): The option names (e.g., samplenames, organism, output_prefix) and values of the job
+
+    Returns:
+      Namespace: The options of the job
+    """
+    actions = {action.dest: action for action in self.parser._actions}
+    options = copy.deepcopy(self.options)
+    for key, value in job.items():
+      key = key.lstrip("-")
+      if key not in actions or key in ("input_table", "table_name", "batch_manifest", "batch_workers", "help", "version"):
+        self.logger.error(f"BATCH:Error: {key} cannot be set in the batch manifest")
+        sys.exit(1)
+      try:
+        setattr(options, key, self.convert_value(actions[key], value))
+      except (argparse.ArgumentTypeError, ValueError) as error:
+        self.logger.error(f"BATCH:Error: invalid value for {key} in the batch manifest: {error}")
+        sys.exit(1)
+    if not options.samplenames and not options.sample_list:
+      self.logger.error("BATCH:Error: every job in the batch manifest needs samplenames or a sample_list")
+      sys.exit(1)
+    if options.sample_list == "-":
+      self.logger.error("BATCH:Error: the sample lists of batch jobs cannot be read from stdin")
+      sys.exit(1)
+    return options
+
+  def run(self):
+    """This function reads the input table once for all jobs and runs the jobs in parallel
+    """
+    job_options = [self.make_job_options(job) for job in self.read_manifest()]
+    output_prefixes = [options.output_prefix for options in job_options]
+    if len(set(output_prefixes)) != len(output_prefixes):
+      self.logger.error("BATCH:Error: every job in the batch manifest needs its own output_prefix")
+      sys.exit(1)
+
+    # read the union of the samples and columns of every job once; each job then selects its own part
+    self.logger.info(f"BATCH:Reading the input table once for {len(job_options)} jobs")
+    needed_columns = set()
+    samplenames = set()
+    for options in job_options:
+      runner = Runner(options)
+      needed_columns.update(runner.create_table().get_needed_columns())
+      samplenames.update(runner.samplenames)
+    table = read_input_table(self.options.input_table, self.options.table_name, samplenames, needed_columns)
+
+    self.logger.info(f"BATCH:Running {len(job_options)} jobs with {self.batch_workers} workers")
+    # forked workers inherit the shared table without copying it through a pipe
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(max_workers=self.batch_workers, mp_context=context, initializer=set_shared_table, initargs=(table,)) as executor:
+      exit_codes = list(executor.map(run_job, range(1, len(job_options) + 1), job_options))
+
+    failed_jobs = [options.output_prefix for options, exit_code in zip(job_options, exit_codes) if exit_code != 0]
+    if failed_jobs:
+      self.logger.error(f"BATCH:Error: {len(failed_jobs)} of {len(job_options)} jobs failed: " + ", ".join(failed_jobs))
+      sys.exit(1)
+    self.logger.info("BATCH:All jobs completed")
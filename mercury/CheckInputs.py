@@ -1,14 +1,41 @@
+from TableFormats import REQUIRED_LIBRARIES, get_table_format, is_library_available
 import os
+import sys
 import argparse
 
 def is_table_valid(filename):
   """
-  Checks if the input TSV file is valid
+  Checks if the input table (TSV, gzip/zstd-compressed TSV, Parquet or Arrow IPC/Feather) is valid
   """
   if not os.path.exists(filename) and filename != "-":
     raise argparse.ArgumentTypeError("{0} cannot be accessed".format(filename))
+  if filename != "-":
+    # the format of stdin is only known once it is read
+    table_format = get_table_format(filename)
+    library = REQUIRED_LIBRARIES.get(table_format)
+    if library is not None and not is_library_available(library):
+      raise argparse.ArgumentTypeError("{0} is in {1} format, which needs the {2} library (pip install {2})".format(filename, table_format, library))
   return filename
 
+def is_sample_list_valid(filename):
+  """
+  Checks if the sample list file exists (or is "-" for stdin)
+  """
+  if not os.path.exists(filename) and filename != "-":
+    raise argparse.ArgumentTypeError("{0} cannot be accessed".format(filename))
+  return filename
+
+def read_sample_list(filename):
+  """
+  Reads the sample names from a file (or stdin if "-") with one or more comma-delimited names per line
+  """
+  if filename == "-":
+    text = sys.stdin.read()
+  else:
+    with open(filename) as sample_list:
+      text = sample_list.read()
+  return [name.strip() for line in text.splitlines() for name in line.split(",") if name.strip()]
+
 def is_comma_delimited_list(string):
   """
   Checks if the input string is a list
@@ -0,0 +1,74 @@
+import pandas as pd
+import numpy as np
+
+# text columns with at most this many distinct values per row are stored as categoricals
+MAX_DISTINCT_RATIO = 0.5
+
+
+def constant(value, index):
+  """This function makes a column with the same value in every row, stored as a categorical so each row takes a
+  single byte instead of a reference to a string object
+
+  Args:
+    value (String): The value of every row
+    index (Index): The index of the table the column belongs to
+
+  Returns:
+    Series: The column
+  """
+  return pd.Series(pd.Categorical.from_codes(np.zeros(len(index), dtype=np.int8), [value]), index=index)
+
+def compact(column):
+  """This function stores a text column with few distinct values (e.g., country, lab, or instrument) as a categorical
+
+  Returns:
+    Series: The column as a categorical, or unchanged if it is not text or most of its values are distinct
+  """
+  if isinstance(column.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(column.dtype) or len(column) == 0:
+    return column
+  if column.nunique() > MAX_DISTINCT_RATIO * len(column):
+    return column
+  return column.astype("category")
+
+def compact_table(table):
+  """This function stores every text column of a table with few distinct values as a categorical
+
+  Returns:
+    DataFrame: The table with compact columns
+  """
+  return table.assign(**{column: compact(table[column]) for column in table.columns})
+
+def as_text(column):
+  """This function returns a column that can be concatenated with strings or filled with new values; categorical
+  columns are expanded, as the values of a categorical are limited to its categories
+  """
+  return column.astype(object) if isinstance(column.dtype, pd.CategoricalDtype) else column
+
+def is_missing(column):
+  """This function finds the missing values of a column; empty values and values that are only whitespace are missing too
+
+  Returns:
+    Array: True for every missing value
+  """
+  if isinstance(column.dtype, pd.CategoricalDtype):
+    # each category is checked once, instead of every row
+    codes = column.cat.codes.to_numpy()
+    missing_categories = np.append(is_missing(pd.Series(column.cat.categories)), True)
+    return missing_categories[codes]
+  missing = column.isna().to_numpy()
+  if pd.api.types.is_string_dtype(column.dtype) and len(column) > 0:
+    missing = missing | (column.str.strip() == "").to_numpy(dtype=bool, na_value=False)
+  return missing
+
+def get_missing_values(table, columns):
+  """This function makes the missing-value bitmap of a table: one row per row of the table and one column per checked
+  column, True where the value is missing (see is_missing). Only the checked columns are read, once each
+
+  Args:
+    table (DataFrame): The table
+    columns (List): The columns to check
+
+  Returns:
+    DataFrame: The bitmap
+  """
+  return pd.DataFrame({column: is_missing(table[column]) for column in dict.fromkeys(columns)}, index=table.index)
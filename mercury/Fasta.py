@@ -0,0 +1,95 @@
+import threading
+import hashlib
+import gzip
+import os
+
+
+class FastaWriter:
+  """This class streams assemblies into a combined FASTA file, replacing the first header of each assembly
+  """
+
+  # the number of bytes read from an assembly at a time
+  block_size = 1024 * 1024
+
+  def __init__(self, logger, combined_path, stream=None):
+    self.logger = logger
+    self.combined_path = combined_path
+    # the combined FASTA is written to its file (unless combined_path is None) and/or to an in-memory stream
+    self.combined_files = [open(combined_path, "wb")] if combined_path is not None else []
+    self.combined = self.combined_files + ([stream] if stream is not None else [])
+    self.bytes_written = 0
+    self.records_written = 0
+    # the checksum of the combined file, computed while it is written
+    self.md5 = hashlib.md5()
+    # the path, size and checksum of every per-sample file written
+    self.sample_files = []
+
+  def open_assembly(self, path):
+    """This function opens an assembly for reading, decompressing it if it is gzipped
+    """
+    with open(path, "rb") as assembly:
+      magic = assembly.read(2)
+    if magic == b"\x1f\x8b":
+      return gzip.open(path, "rb")
+    return open(path, "rb")
+
+  def write_data(self, outputs, checksums, data):
+    for output in outputs:
+      output.write(data)
+    for checksum in checksums:
+      checksum.update(data)
+    self.bytes_written += len(data)
+
+  def write(self, path, header, sample_path=None):
+    """This function appends one assembly to the combined FASTA with its first line replaced by the new header;
+    any further records in the assembly keep their headers
+
+    Args:
+      path (String): The local path of the (optionally gzipped) assembly
+      header (String): The new header, without the leading ">"
+      sample_path (String): If given, the rewritten assembly is also written to this file
+
+    Returns:
+      Int: The number of records written
+    """
+    outputs = list(self.combined)
+    checksums = [self.md5]
+    if sample_path is not None:
+      # written next to its final path and moved into place, as a sample in several rows can be written by several
+      # shards (or batch jobs) at the same time
+      temporary_path = f"{sample_path}.{os.getpid()}.{threading.get_ident()}.part"
+      outputs.append(open(temporary_path, "wb"))
+      checksums.append(hashlib.md5())
+    bytes_written = self.bytes_written
+
+    records = 0
+    with self.open_assembly(path) as assembly:
+      first_line = assembly.readline()
+      if first_line:
+        self.write_data(outputs, checksums, b">" + header.encode() + b"\n")
+        records = 1
+        previous_byte = b"\n"
+        for block in iter(lambda: assembly.read(self.block_size), b""):
+          # count the headers of any additional records, including one split across two blocks
+          records += block.count(b"\n>")
+          if previous_byte == b"\n" and block.startswith(b">"):
+            records += 1
+          self.write_data(outputs, checksums, block)
+          previous_byte = block[-1:]
+        if previous_byte != b"\n":
+          # make sure the next assembly starts on its own line
+          self.write_data(outputs, checksums, b"\n")
+      else:
+        self.logger.warning(f"FASTA:Warning: the assembly {path} is empty and was not written")
+
+    if sample_path is not None:
+      outputs[-1].close()
+      os.replace(temporary_path, sample_path)
+      self.sample_files.append((sample_path, self.bytes_written - bytes_written, checksums[1].hexdigest()))
+    self.records_written += records
+    return records
+
+  def close(self):
+    for combined_file in self.combined_files:
+      combined_file.close()
+    self.logger.debug(f"FASTA:Wrote {self.records_written} records ({self.bytes_written} bytes) to {self.combined_path or 'memory'}")
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from Storage import StorageBackend, LocalStorage, is_remote
+import functools
+import base64
+import os
+
+try:
+  from google.cloud import storage as gcs
+  from google.api_core.exceptions import NotFound
+except ImportError:
+  # google-cloud-storage is optional; without it, GCP buckets are accessed through the gcloud command line tool
+  gcs = None
+
+
+def is_gcs_client_available():
+  """This function checks if the google-cloud-storage library is installed
+  """
+  return gcs is not None
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+  """This function creates one client per process, so every transfer reuses its credentials and connection pool
+  """
+  return gcs.Client()
+
+def split_uri(uri):
+  """This function splits a GCP bucket URI into the bucket name and the object name
+
+  Returns:
+    String: The bucket name
+    String: The object name (empty for the bucket itself)
+  """
+  bucket, _, name = uri[len("gs://"):].partition("/")
+  return bucket, name
+
+
+class GcsClientStorage(StorageBackend):
+  """This class accesses GCP buckets with the google-cloud-storage library instead of starting a gcloud process per call
+  """
+
+  # the number of objects looked up at the same time by stats
+  lookup_concurrency = 16
+
+  def __init__(self):
+    self.client = get_client()
+
+  def get_blob(self, uri):
+    bucket, name = split_uri(uri)
+    return self.client.bucket(bucket).blob(name)
+
+  def describe(self, blob):
+    return {"size": blob.size, "version": f"{blob.generation}-{blob.size}", "md5": base64.b64decode(blob.md5_hash).hex() if blob.md5_hash else None}
+
+  def list(self, prefix):
+    if not is_remote(prefix):
+      return LocalStorage().list(prefix)
+    bucket, folder = split_uri(prefix.rstrip("/"))
+    try:
+      blobs = self.client.list_blobs(bucket, prefix=folder + "/" if folder else None, delimiter="/")
+      return {f"gs://{bucket}/{blob.name}": blob.size for blob in blobs}
+    except NotFound:
+      return {}
+
+  def stat(self, uri):
+    if not is_remote(uri):
+      return LocalStorage().stat(uri)
+    bucket, name = split_uri(uri)
+    try:
+      blob = self.client.bucket(bucket).get_blob(name)
+    except NotFound:
+      return None
+    return self.describe(blob) if blob is not None else None
+
+  def stats(self, uris):
+    # the lookups share the client's connection pool, so running them side by side is cheap
+    with ThreadPoolExecutor(max_workers=self.lookup_concurrency) as executor:
+      stats = dict(zip(uris, executor.map(self.stat, uris)))
+    return {uri: stat for uri, stat in stats.items() if stat is not None}
+
+  def checksums(self, uris):
+    # GCP keeps the MD5 of every object it stores, so only local files have to be read
+    checksums = LocalStorage().checksums([uri for uri in uris if not is_remote(uri)])
+    checksums.update({uri: (stat["size"], stat["md5"]) for uri, stat in self.stats([uri for uri in uris if is_remote(uri)]).items()})
+    return checksums
+
+  def get(self, uri, path):
+    bucket, name = split_uri(uri)
+    blob = self.client.bucket(bucket).get_blob(name)
+    if blob is None:
+      raise FileNotFoundError(f"{uri} does not exist")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # the library verifies the checksum of the downloaded data
+    blob.download_to_filename(path)
+    return blob.size, self.describe(blob)["md5"]
+
+  def put(self, path, uri):
+    blob = self.get_blob(uri)
+    blob.upload_from_filename(path)
+    return blob.size, self.describe(blob)["md5"]
+
+  def copy_object(self, source, destination):
+    source_blob = self.get_blob(source)
+    destination_blob = self.get_blob(destination)
+    # large objects are copied in several rewrite calls; the data never leaves GCP
+    token, copied_bytes, total_bytes = destination_blob.rewrite(source_blob)
+    while token is not None:
+      token, copied_bytes, total_bytes = destination_blob.rewrite(source_blob, token=token)
+    return total_bytes, self.describe(destination_blob)["md5"]
+
+  def exists(self, uri):
+    if not is_remote(uri):
+      return os.path.exists(uri)
+    return self.get_blob(uri).exists()
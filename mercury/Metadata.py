@@ -1,3 +1,107 @@
+from OutputSchema import OutputSchema
+from Columns import as_text
+import functools
+
+
+def make_flu_isolate(columns):
+  """This function creates the isolate of Flu samples as type/state/submission_id/year (subtype), with "Type_"
+  stripped off the beginning of the type (e.g., "Type_A" -> "A")
+  """
+  return (as_text(columns["abricate_flu_type"]).str.replace("Type_", "") + "/" + as_text(columns["state"]) + "/" + as_text(columns["submission_id"]) + "/" + as_text(columns["year"])
+          + " (" + as_text(columns["abricate_flu_subtype"]) + ")")
+
+def make_org_location(columns, usa_territory, skip_county):
+  """This function creates the GISAID location as continent / country / state (continent / state for USA territories),
+  followed by the county unless it is skipped or empty
+  """
+  if usa_territory:
+    org_location = as_text(columns["continent"]) + " / " + as_text(columns["state"])
+  else:
+    org_location = as_text(columns["continent"]) + " / " + as_text(columns["country"]) + " / " + as_text(columns["state"])
+  if skip_county:
+    return org_location
+  county = as_text(columns["county"]).fillna("")
+  return org_location.where(county.str.len() == 0, org_location + " / " + county)
+
+def fill_unknown(column):
+  """This function replaces empty and blank values with "unknown"
+  """
+  # regex expression '^\s*$' searches for blank strings
+  return as_text(column).replace(r'^\s*$', "unknown", regex=True).fillna("unknown")
+
+@functools.lru_cache(maxsize=None)
+def get_output_schema(output, organism, required, optional, assembly_mean_coverage_column_name="assembly_mean_coverage", derive_isolate=False, state_supplied=False,
+                      usa_territory=False, skip_county=False):
+  """This function describes how every output is made from the input table; each schema is compiled once per process
+  and reused by every run and batch job with the same columns and options
+
+  Args:
+    output (String): "biosample", "sra", "genbank", "bankit" or "gisaid"
+    organism (String): The organism
+    required (Tuple): The required input columns of the output (see Metadata)
+    optional (Tuple): The optional input columns of the output (see Metadata)
+    assembly_mean_coverage_column_name (String): GISAID only; the column with the assembly coverage
+    derive_isolate (Boolean): Flu BioSample only; creates the isolate when the input table has neither isolate nor strain
+    state_supplied (Boolean): GenBank only; adds the state to the geo_loc_name when the input table has a state column
+    usa_territory (Boolean): GISAID only; leaves the country out of the location
+    skip_county (Boolean): GISAID only; leaves the county out of the location
+
+  Returns:
+    OutputSchema: The compiled schema
+  """
+  organism = organism.lower()
+  if output == "biosample" and organism in {"mpox", "sars-cov-2"}:
+    renames = {"submission_id" : "sample_name", "collecting_lab" : "collected_by", "host_sci_name" : "host", "patient_gender" : "host_sex", "patient_age" : "host_age"}
+    if organism == "sars-cov-2":
+      renames["treatment"] = "antiviral_treatment_agent"
+    derived = {"geo_loc_name": lambda columns: as_text(columns["country"]) + ": " + as_text(columns["state"])}
+    return OutputSchema(required, optional, renames, derived, ["country", "state"])
+  if output == "biosample" and derive_isolate:
+    # the columns used to create the isolate are removed from the output
+    return OutputSchema(required, optional, {"submission_id" : "sample_name"}, {"isolate": make_flu_isolate}, ["abricate_flu_type", "abricate_flu_subtype", "year", "state"])
+  if output == "biosample":
+    return OutputSchema(required, optional, {"submission_id" : "sample_name"})
+
+  if output == "sra":
+    renames = {"submission_id" : "sample_name", "library_id" : "library_ID"}
+    if organism == "flu":
+      return OutputSchema(required, optional, renames)
+    # these columns are named differently in the mercury metadata preparation spreadsheets
+    renames.update({"amplicon_primer_scheme" : "amplicon_PCR_primer_scheme", "submitter_email" : "sequence_submitter_contact_email", "assembly_method" : "raw_sequence_data_processing_method", "seq_platform" : "platform"})
+    derived = {"title": lambda columns: "Genomic sequencing of " + as_text(columns["organism"]) + ": " + as_text(columns["isolation_source"])}
+    return OutputSchema(required, optional, renames, derived, ["organism", "isolation_source"])
+
+  if output == "genbank":
+    renames = {"submission_id" : "Sequence_ID", "host_sci_name" : "host", "collection_date" : "collection-date", "isolation_source" : "isolation-source", "biosample_accession" : "BioSample", "bioproject_accession" : "BioProject", "country" : "geo_loc_name"}
+    derived = {"country": lambda columns: as_text(columns["country"]) + ": " + as_text(columns["state"])} if state_supplied else {}
+    return OutputSchema(required, optional, renames, derived, ["state"])
+
+  if output == "bankit":
+    renames = {"submission_id" : "Sequence_ID", "isolate" : "Isolate", "collection_date" : "Collection_date", "country" : "Country", "host" : "Host", "isolation_source" : "Isolation_source"}
+    return OutputSchema(required, optional, renames)
+
+  if output == "gisaid":
+    derived = {"org_location": lambda columns: make_org_location(columns, usa_territory, skip_county)}
+    if organism == "sars-cov-2":
+      # add additional sc2-specific columns & any empty ones GISAID wants
+      derived.update({"covv_type" : "betacoronavirus", "covv_passage" : "original", "covv_subm_sample_id" : "", "covv_provider_sample_id" : "", "covv_add_location" : ""})
+      # format: {original : new} or {metadata_formatter : gisaid_format}
+      renames = {"gisaid_virus_name" : "covv_virus_name", "org_location" : "covv_location", "additional_host_information" : "covv_add_host_info", "gisaid_submitter" : "submitter", "collection_date" : "covv_collection_date", "seq_platform" : "covv_seq_technology", "host" : "covv_host", "assembly_method" : "covv_assembly_method", assembly_mean_coverage_column_name : "covv_coverage", "collecting_lab" : "covv_orig_lab", "collecting_lab_address" : "covv_orig_lab_addr", "submitting_lab" : "covv_subm_lab", "submitting_lab_address" : "covv_subm_lab_addr", "authors" : "covv_authors", "purpose_of_sequencing" : "covv_sampling_strategy", "patient_gender" : "covv_gender", "patient_age" : "covv_patient_age", "patient_status" : "covv_patient_status", "specimen_source" : "covv_specimen", "outbreak" : "covv_outbreak", "last_vaccinated" : "covv_last_vaccinated", "treatment" : "covv_treatment", "consortium" : "covv_consortium"}
+    else:
+      # add additional mpox-specific columns
+      derived["pox_passage"] = "original"
+      # format: {original : new} or {metadata_formatter : gisaid_format}
+      renames = {"gisaid_virus_name" : "pox_virus_name", "org_location" : "pox_location", "gisaid_submitter" : "submitter", "passage_details" : "pox_passage", "collection_date" : "pox_collection_date", "seq_platform" : "pox_seq_technology", "host" : "pox_host", "assembly_method" : "pox_assembly_method", assembly_mean_coverage_column_name : "pox_coverage", "collecting_lab" : "pox_orig_lab", "collecting_lab_address" : "pox_orig_lab_addr", "submitting_lab" : "pos_subm_lab", "submitting_lab_address" : "pox_subm_lab_addr", "authors" : "pox_authors", "purpose_of_sequencing" : "pox_sampling_strategy", "patient_gender" : "pox_gender", "patient_age" : "pox_patient_age", "patient_status" : "pox_patient_status", "specimen_source" : "pox_specimen_source", "outbreak" : "pox_outbreak", "last_vaccinated" : "pox_last_vaccinated", "treatment" : "pox_treatment"}
+    # replace any empty/NA values for age, status, and gender with "unknown"
+    derived["patient_age"] = lambda columns: fill_unknown(columns["patient_age"])
+    derived["patient_gender"] = lambda columns: fill_unknown(columns["patient_gender"])
+    derived["patient_status"] = lambda columns: fill_unknown(columns["patient_status"])
+    derived["fn"] = lambda columns: as_text(columns["submission_id"]) + "_gisaid.fasta"
+    return OutputSchema(required, optional, renames, derived, ["continent", "country", "state", "county", "submission_id"])
+
+  raise ValueError(f"no output schema for {output} ({organism})")
+
+
 class Metadata:
   """This class controls the various different metadata requirements
   """
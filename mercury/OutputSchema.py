@@ -0,0 +1,47 @@
+from Columns import constant
+import pandas as pd
+
+
+class OutputSchema:
+  """This class describes how one output table is made from the input table: the required and optional input columns it
+  reads, the columns derived from them (a function of the input columns, or a constant), the columns that are only used
+  to derive others, and the output names of renamed columns. A derived column replaces the input column with the same
+  name, or is added after the input columns
+  """
+
+  def __init__(self, required, optional, renames=None, derived=None, dropped=()):
+    self.required = list(required)
+    self.optional = [column for column in optional if column not in set(self.required)]
+    self.renames = dict(renames) if renames else {}
+    self.derived = dict(derived) if derived else {}
+    # the columns of the output and their order are worked out once, when the schema is compiled
+    inputs = list(dict.fromkeys(self.required + self.optional))
+    self.columns = [column for column in inputs + [column for column in self.derived if column not in inputs] if column not in set(dropped)]
+
+  def get_output_name(self, column):
+    """This function returns the name an input or derived column has in the output
+    """
+    return self.renames.get(column, column)
+
+  def build(self, table):
+    """This function makes the output table in a single step, instead of copying the required columns and then adding,
+    renaming and dropping columns one at a time
+
+    Args:
+      table (DataFrame): The input table
+
+    Returns:
+      DataFrame: The output table, with one row per row of the input table
+    """
+    # a missing optional column is left empty; empty and constant columns are stored compactly (see Columns.constant),
+    # and the input columns are used as they are, so compact input columns stay compact in the output
+    inputs = {column: table[column] for column in self.required}
+    inputs.update({column: table[column] if column in table.columns else constant("", table.index) for column in self.optional})
+
+    def get_column(column):
+      if column not in self.derived:
+        return inputs[column]
+      value = self.derived[column]
+      return pd.Series(value(inputs), index=table.index) if callable(value) else constant(value, table.index)
+
+    return pd.DataFrame({self.get_output_name(column): get_column(column) for column in self.columns}, index=table.index)
@@ -0,0 +1,88 @@
+import pandas as pd
+
+
+class QualityControl:
+  """This class evaluates column-wise quality rules against the table
+  """
+
+  def __init__(self, logger, sample_column):
+    self.logger = logger
+    self.sample_column = sample_column
+    self.rules = []
+
+  def add_rule(self, name, columns, mask_function, message_function, group=None):
+    """This function registers a quality rule
+
+    Args:
+      name (String): The name of the rule, used for logging
+      columns (List): The columns the rule needs; the rule is skipped if any are absent from the table
+      mask_function (Function): Takes the table and returns a boolean Series that is True for failing rows
+      message_function (Function): Takes the failing rows and returns the exclusion message (String or Series)
+      group (String): Rules sharing a group are mutually exclusive; only the first failing rule in a group reports a row
+    """
+    self.logger.debug(f"QC:Registering quality rule {name}")
+    self.rules.append({"name": name, "columns": columns, "mask": mask_function, "message": message_function, "group": group})
+
+  def add_threshold_rule(self, name, column, limit, message, minimum=False, group=None):
+    """This function registers a rule that fails rows whose numeric value is above (or below) a limit
+
+    Args:
+      name (String): The name of the rule, used for logging
+      column (String): The column holding the numeric value
+      limit (Int or Float): The threshold to compare against
+      message (String): The message prefix; the failing value and the limit are appended
+      minimum (Boolean): If True, rows below the limit fail instead of rows above it
+      group (String): The exclusive group of the rule (see add_rule)
+    """
+    def mask_function(table):
+      values = pd.to_numeric(table[column], errors="coerce")
+      return values < limit if minimum else values > limit
+
+    comparison = "less than minimum of " if minimum else "greater than limit of "
+    def message_function(failing):
+      return message + ": " + failing[column].astype(str) + " " + comparison + str(limit)
+
+    self.add_rule(name, [column], mask_function, message_function, group)
+
+  def evaluate(self, table):
+    """This function applies every registered rule to the table in one pass per rule
+
+    Args:
+      table (DataFrame): The table to check
+
+    Returns:
+      DataFrame: The exclusion messages (sample_name, message) in table order
+      Series: A boolean mask that is True for every row that failed at least one rule
+    """
+    positions = pd.Series(range(len(table)), index=table.index)
+    failed = pd.Series(False, index=table.index)
+    claimed = {}
+    messages = []
+    for order, rule in enumerate(self.rules):
+      missing_columns = [column for column in rule["columns"] if column not in table.columns]
+      if missing_columns:
+        self.logger.debug(f"QC:Skipping quality rule {rule['name']}; missing column(s) " + ", ".join(missing_columns))
+        continue
+
+      mask = rule["mask"](table).fillna(False).astype(bool)
+      failed |= mask
+      if rule["group"] is not None:
+        group_claimed = claimed.get(rule["group"], pd.Series(False, index=table.index))
+        mask = mask & ~group_claimed
+        claimed[rule["group"]] = group_claimed | mask
+      if not mask.any():
+        continue
+
+      failing = table[mask]
+      rule_messages = pd.DataFrame({"sample_name": failing[self.sample_column], "message": rule["message"](failing)})
+      rule_messages["_position"] = positions[mask]
+      rule_messages["_order"] = order
+      messages.append(rule_messages)
+      self.logger.debug(f"QC:Quality rule {rule['name']} failed {mask.sum()} sample(s)")
+
+    if messages:
+      exclusions = pd.concat(messages).sort_values(["_position", "_order"], kind="stable")
+      exclusions = exclusions.drop(columns=["_position", "_order"]).reset_index(drop=True)
+    else:
+      exclusions = pd.DataFrame(columns=["sample_name", "message"])
+    return exclusions, failed
@@ -0,0 +1,99 @@
+import threading
+import hashlib
+import json
+import os
+
+
+def get_file_md5(path):
+  """This function computes the MD5 checksum of a local file
+
+  Returns:
+    String: The hexadecimal MD5 checksum
+  """
+  md5 = hashlib.md5()
+  with open(path, "rb") as local_file:
+    for block in iter(lambda: local_file.read(1024 * 1024), b""):
+      md5.update(block)
+  return md5.hexdigest()
+
+
+class RunManifest:
+  """This class durably records every completed transfer, download and output of a run, so an interrupted run can be resumed
+  """
+
+  def __init__(self, logger, path, resume=False):
+    self.logger = logger
+    self.path = path
+    self.resume = resume
+    self.lock = threading.Lock()
+    # the latest record of every (kind, destination)
+    self.records = {}
+
+    if self.resume and os.path.exists(self.path):
+      with open(self.path) as manifest:
+        for line in manifest:
+          try:
+            record = json.loads(line)
+          except ValueError:
+            # the last line may be incomplete if the previous run was killed while writing it
+            continue
+          self.records[(record["kind"], record["destination"])] = record
+      self.logger.info(f"MANIFEST:Resuming from {len(self.records)} recorded transfers and outputs in {self.path}")
+    elif self.resume:
+      self.logger.info(f"MANIFEST:No run manifest found at {self.path}; starting a new one")
+
+    # the manifest is a JSON lines file that is appended to and flushed after every record
+    self.manifest = open(self.path, "a" if self.resume else "w")
+
+  def record(self, kind, source, destination, size=None, checksum=None, **details):
+    """This function appends one completed unit of work to the manifest
+
+    Args:
+      kind (String): "transfer", "download" or "output"
+      source (String): The source URI, path, or a fingerprint of the inputs of an output
+      destination (String): The destination URI or path
+      size (Int): The size of the destination in bytes (optional)
+      checksum (String): The MD5 checksum of the destination (optional)
+    """
+    record = {"kind": kind, "source": source, "destination": destination, "size": size, "checksum": checksum, **details}
+    with self.lock:
+      self.records[(kind, destination)] = record
+      self.manifest.write(json.dumps(record) + "\n")
+      self.manifest.flush()
+
+  def record_output(self, path, source=""):
+    """This function records a written output file with its size and checksum
+    """
+    self.record("output", source, path, os.path.getsize(path), get_file_md5(path))
+
+  def is_transfer_verified(self, source, destination, destination_size):
+    """This function checks if a transfer was completed by an earlier attempt and the destination still matches it
+
+    Args:
+      source (String): The source URI or path
+      destination (String): The destination URI or path
+      destination_size (Int): The current size of the destination, or None if it does not exist
+
+    Returns:
+      Boolean: True if the transfer can be skipped
+    """
+    record = self.records.get(("transfer", destination))
+    return self.resume and record is not None and record["source"] == source and destination_size is not None and record["size"] == destination_size
+
+  def is_output_verified(self, path, source):
+    """This function checks if an output was written by an earlier attempt from the same inputs and is unchanged since
+
+    Args:
+      path (String): The path of the output
+      source (String): The fingerprint of the inputs of the output
+
+    Returns:
+      Boolean: True if the output does not need to be written again
+    """
+    record = self.records.get(("output", path))
+    if not self.resume or record is None or record["source"] != source or not os.path.exists(path):
+      return False
+    return os.path.getsize(path) == record["size"] and get_file_md5(path) == record["checksum"]
+
+  def close(self):
+    self.manifest.close()
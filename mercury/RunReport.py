@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+import threading
+import json
+import sys
+import time
+
+try:
+  import resource
+except ImportError:
+  # the resource module is not available on Windows; peak memory is then not reported
+  resource = None
+
+
+def get_peak_rss_mb():
+  """This function returns the peak resident memory of the process so far in MB, or None if unavailable
+  """
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+  return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def read_memory_status():
+  """This function reads the current and peak resident memory of the process in MB from /proc (Linux only); the peak is
+  the highest since the process started or since reset_peak_rss was last called
+
+  Returns:
+    Tuple: The current and peak resident memory in MB, or None if unavailable
+  """
+  try:
+    with open("/proc/self/status") as status_file:
+      status = dict(line.split(":", 1) for line in status_file if line.startswith(("VmRSS:", "VmHWM:")))
+    return round(int(status["VmRSS"].split()[0]) / 1024, 1), round(int(status["VmHWM"].split()[0]) / 1024, 1)
+  except (OSError, KeyError, ValueError):
+    return None
+
+def reset_peak_rss():
+  """This function resets the peak resident memory of the process to its current resident memory (Linux only); this also
+  resets ru_maxrss
+
+  Returns:
+    Boolean: True if the peak was reset
+  """
+  try:
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+      clear_refs.write("5")
+    return True
+  except OSError:
+    return False
+
+
+class RunReport:
+  """This class records the time, memory, row counts and transfers of every stage of a Mercury run
+  """
+
+  def __init__(self, logger):
+    self.logger = logger
+    self.start_time = time.monotonic()
+    self.stages = []
+    self.transfers = []
+    self.details = {}
+    # the peak memory of a stage is measured by resetting the peak of the process when a stage starts or ends, and
+    # adding the peak of every interval to the stages running during it; where the peak cannot be reset (e.g., not on
+    # Linux), only the peak memory of the whole process is reported
+    self.lock = threading.Lock()
+    self.running_stages = []
+    memory_status = read_memory_status()
+    self.peak_rss_mb = memory_status[1] if memory_status is not None else None
+    self.measure_stages = memory_status is not None and reset_peak_rss()
+
+  def measure_peak(self):
+    """This function adds the peak memory since the last measurement to the running stages and to the run, and starts a
+    new interval (called with self.lock held); stages that run at the same time (e.g., the output writers) share the peak
+    of the time they overlap
+    """
+    memory_status = read_memory_status() if self.measure_stages else None
+    if memory_status is None:
+      return None
+    reset_peak_rss()
+    rss, peak = memory_status
+    self.peak_rss_mb = max(self.peak_rss_mb, peak)
+    for record in self.running_stages:
+      record["peak_rss_mb"] = max(record["peak_rss_mb"], peak)
+    return rss
+
+  @contextmanager
+  def stage(self, name, count_rows=None):
+    """This function times a stage and records its peak memory, how far the peak rose above the memory in use when the
+    stage started, and the number of rows before and after it; the memory is None where it cannot be measured per stage
+
+    Args:
+      name (String): The name of the stage
+      count_rows (Function): Returns the current number of rows in the table (optional)
+    """
+    record = {"stage": name, "rows_in": count_rows() if count_rows else None, "peak_rss_mb": None, "peak_rss_increase_mb": None}
+    with self.lock:
+      start_rss = self.measure_peak()
+      if start_rss is not None:
+        record["peak_rss_mb"] = start_rss
+        self.running_stages.append(record)
+    start_time = time.monotonic()
+    try:
+      yield record
+    finally:
+      record["seconds"] = round(time.monotonic() - start_time, 4)
+      record["rows_out"] = count_rows() if count_rows else None
+      with self.lock:
+        if start_rss is not None:
+          self.measure_peak()
+          self.running_stages = [running_stage for running_stage in self.running_stages if running_stage is not record]
+          record["peak_rss_increase_mb"] = round(record["peak_rss_mb"] - start_rss, 1)
+      self.stages.append(record)
+      self.logger.debug(f"REPORT:Stage {name} took {record['seconds']}s (rows {record['rows_in']} -> {record['rows_out']}, peak RSS {record['peak_rss_mb']} MB)")
+
+  def add_transfer(self, name, statistics):
+    """This function records the totals of a group of transfers
+
+    Args:
+      name (String): The name of the transfer group (e.g., "sra_upload")
+      statistics (Dict): The number of files and bytes transferred and the elapsed seconds
+    """
+    self.transfers.append({"transfer": name, **statistics})
+
+  def to_dict(self):
+    if self.measure_stages:
+      with self.lock:
+        self.measure_peak()
+      peak_rss_mb = self.peak_rss_mb
+    else:
+      peak_rss_mb = get_peak_rss_mb()
+    return {"total_seconds": round(time.monotonic() - self.start_time, 4), "peak_rss_mb": peak_rss_mb,
+            **self.details, "stages": self.stages, "transfers": self.transfers}
+
+  def write(self, path):
+    self.logger.debug(f"REPORT:Writing run report to {path}")
+    with open(path, "w") as report_file:
+      json.dump(self.to_dict(), report_file, indent=2)
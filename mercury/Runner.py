@@ -1,7 +1,9 @@
-from Table import Table
+from Table import Table, TableError
 from Metadata import Metadata
+from RunReport import RunReport
+import CheckInputs
+from __init__ import __VERSION__
 import logging
-import subprocess
 import sys
 
 class Runner:
@@ -20,9 +22,16 @@ class Runner:
 
     self.input_table = options.input_table
     self.table_name = options.table_name
-    self.samplenames = options.samplenames
+    # the sample names given on the command line and in the sample list, as requested (duplicates are reported by the table)
+    self.samplenames = (options.samplenames or []) + (CheckInputs.read_sample_list(options.sample_list) if options.sample_list else [])
+    self.strict_samples = options.strict_samples
     self.output_prefix = options.output_prefix
+    self.write_run_report = options.run_report
     self.gcp_bucket_uri = options.gcp_bucket_uri
+    self.transfer_concurrency = options.transfer_concurrency
+    self.transfer_retries = options.transfer_retries
+    self.cache_directory = options.cache_directory
+    self.cache_size = options.cache_size
     self.organism = options.organism
     self.skip_ncbi = options.skip_ncbi
     self.skip_county = options.skip_county
@@ -40,6 +49,15 @@ class Runner:
     self.assembly_mean_coverage_column_name = "assembly_mean_coverage"
     
     self.single_end = options.single_end
+    self.write_sample_fastas = options.write_sample_fastas
+    self.compute_checksums = options.checksums
+    self.transfer_batch_size = options.transfer_batch_size
+    self.storage_backend = options.storage_backend
+    self.async_io = options.async_io
+    self.shard_size = options.shard_size
+    self.resume = options.resume
+    self.incremental = options.incremental
+    self.state_database = options.state_database
     
     if self.clearlabs_data:
       self.read1_column_name = "clearlabs_fastq_gz"
@@ -76,32 +94,22 @@ class Runner:
     self.metadata_organism = " ".join(options.metadata_organism)
 
 
-  def check_gcloud_dependency(self):
-    result = subprocess.run(
-      ["gcloud", "storage", "cp", "--help"],
-      stdout=subprocess.PIPE,
-      stderr=subprocess.PIPE,
-      text=True,
-    )
-    if result.returncode != 0:
-      self.logger.error("RUNNER:Error: gcloud storage cp command not found")
-      sys.exit(1)
-    self.logger.debug("RUNNER:Found `gcloud storage cp` command, continuing")
+  def create_table(self, run_report=None, input_dataframe=None):
+    """This function gathers the metadata requirements and creates the Table for this run
 
-  def run(self):
-    """
-    This class orchestrates the different parts of Mercury
+    Args:
+      run_report (RunReport): The report that records the stages of the run (optional)
+      input_dataframe (DataFrame): A preloaded input table to use instead of reading input_table (optional)
+
+    Returns:
+      Table: The table, ready to be processed
     """
-    self.logger.info("RUNNER:Starting to run Mercury")
-    self.logger.debug("RUNNER:Checking for `gcloud storage cp` command")
-    self.check_gcloud_dependency()
-    
     self.logger.debug("RUNNER:Gathering metadata")
     
     metadata = Metadata(self.logger, self.organism, self.skip_ncbi, self.assembly_mean_coverage_column_name)
     metadata_list = metadata.get_metadata()      
     
-    self.logger.debug("RUNNER:Processing table")
+    self.logger.debug("RUNNER:Creating table")
     table = Table(self.logger, self.organism, self.input_table, self.table_name, self.samplenames, self.skip_county, 
                   self.skip_ncbi, self.usa_territory, metadata_list, self.vadr_alert_limit, self.number_n_threshold, 
                   self.assembly_fasta_column_name, self.output_prefix, self.gcp_bucket_uri, self.single_end, 
@@ -110,7 +118,34 @@ class Runner:
                   self.isolation_source, self.library_selection, self.library_source, self.library_strategy, 
                   self.purpose_of_sequencing, self.state, self.submitting_lab, self.submitting_lab_address, 
                   self.amplicon_primer_scheme, self.amplicon_size, self.instrument_model, self.library_layout, self.seq_platform, 
-                  self.gisaid_submitter, self.submitter_email, self.metadata_organism, self.read2_column_name)
-    table.process_table()
+                  self.gisaid_submitter, self.submitter_email, self.metadata_organism, self.read2_column_name,
+                  transfer_concurrency=self.transfer_concurrency, transfer_retries=self.transfer_retries,
+                  cache_directory=self.cache_directory, cache_size=self.cache_size, write_sample_fastas=self.write_sample_fastas,
+                  run_report=run_report, input_dataframe=input_dataframe, resume=self.resume,
+                  incremental=self.incremental, state_database=self.state_database, compute_checksums=self.compute_checksums,
+                  transfer_batch_size=self.transfer_batch_size, storage_backend=self.storage_backend,
+                  async_io=self.async_io, strict_samples=self.strict_samples, shard_size=self.shard_size)
+    return table
+
+  def run(self, input_dataframe=None):
+    """
+    This class orchestrates the different parts of Mercury
+    """
+    self.logger.info("RUNNER:Starting to run Mercury")
+    run_report = RunReport(self.logger)
+    run_report.details.update({"version": __VERSION__, "organism": self.organism, "output_prefix": self.output_prefix, "requested_samples": len(set(self.samplenames))})
+
+    with run_report.stage("create_table"):
+      table = self.create_table(run_report, input_dataframe)
+    
+    try:
+      table.process_table()
+    except TableError:
+      # the error was logged by the table
+      sys.exit(1)
+    finally:
+      # the report is also written when a stage exits early, so slow or failing runs can be inspected
+      if self.write_run_report:
+        run_report.write(self.output_prefix + "_run_report.json")
       
     self.logger.info("RUNNER:Done!")
\ No newline at end of file
@@ -0,0 +1,417 @@
+from abc import ABC, abstractmethod
+import subprocess
+import functools
+import tempfile
+import hashlib
+import base64
+import json
+import csv
+import os
+
+
+def is_remote(uri):
+  """This function checks if a URI points to a GCP bucket
+
+  Args:
+    uri (String): The URI or local path
+
+  Returns:
+    Boolean: True if the URI is a GCP bucket URI
+  """
+  return str(uri).startswith("gs://")
+
+@functools.lru_cache(maxsize=None)
+def is_gcloud_available():
+  """This function checks (once per process) if the `gcloud storage cp` command can be run
+
+  Returns:
+    Boolean: True if `gcloud storage cp` is available
+  """
+  try:
+    result = subprocess.run(["gcloud", "storage", "cp", "--help"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  except OSError:
+    return False
+  return result.returncode == 0
+
+def get_storage(*uris, backend="auto"):
+  """This function returns the storage backend able to handle all of the given URIs
+
+  Args:
+    uris (String): The URIs or local paths that will be accessed
+    backend (String): "gcs" for the google-cloud-storage library, "gcloud" for the gcloud command line tool, or "auto"
+      to use the library if it is installed
+
+  Returns:
+    StorageBackend: The storage backend; LocalStorage if none of the URIs point to a GCP bucket
+  """
+  if not any(is_remote(uri) for uri in uris):
+    return LocalStorage()
+  if backend != "gcloud":
+    # the library is optional, so it is only imported when a GCP bucket is accessed
+    from GcsClientStorage import GcsClientStorage, is_gcs_client_available
+    if backend == "gcs" or is_gcs_client_available():
+      return GcsClientStorage()
+  return GcloudStorage()
+
+
+class StorageBackend(ABC):
+  """This class defines the operations of a storage backend; every transfer and lookup goes through them, so the same
+  pipeline runs against GCP buckets and local directories. A backend must implement list, stat, get, put and copy_object
+  """
+
+  @abstractmethod
+  def list(self, prefix):
+    """This function lists the objects directly under a prefix
+
+    Returns:
+      Dict: The object URIs and their sizes in bytes; empty if the prefix does not exist
+    """
+
+  @abstractmethod
+  def stat(self, uri):
+    """This function describes one object
+
+    Returns:
+      Dict: The size in bytes, the version (which changes whenever the object changes) and the hexadecimal MD5
+        checksum (or None if it is not known without reading the object), or None if the object does not exist
+    """
+
+  @abstractmethod
+  def get(self, uri, path):
+    """This function downloads an object to a local path
+
+    Returns:
+      Int: The number of bytes copied, or None if unknown
+      String: The hexadecimal MD5 checksum, or None if unknown
+    """
+
+  @abstractmethod
+  def put(self, path, uri):
+    """This function uploads a local file (see get for the return values)
+    """
+
+  @abstractmethod
+  def copy_object(self, source, destination):
+    """This function copies an object to another object without downloading it (see get for the return values)
+    """
+
+  def exists(self, uri):
+    return self.stat(uri) is not None
+
+  def stats(self, uris):
+    """This function describes many objects; backends override it to look them up in as few requests as possible
+
+    Returns:
+      Dict: The stat of every URI that exists
+    """
+    stats = {}
+    for uri in uris:
+      stat = self.stat(uri)
+      if stat is not None:
+        stats[uri] = stat
+    return stats
+
+  def sizes(self, uris):
+    return {uri: stat["size"] for uri, stat in self.stats(uris).items()}
+
+  def versions(self, uris):
+    return {uri: stat["version"] for uri, stat in self.stats(uris).items()}
+
+  def checksums(self, uris):
+    return {uri: (stat["size"], stat["md5"]) for uri, stat in self.stats(uris).items()}
+
+  def copy(self, source, destination):
+    """This function copies a file with get, put or copy_object depending on where the source and destination are
+    (see get for the return values)
+    """
+    if is_remote(source) and is_remote(destination):
+      return self.copy_object(source, destination)
+    if is_remote(source):
+      return self.get(source, destination)
+    return self.put(source, destination)
+
+  def can_copy_batch(self, source, destination):
+    """This function checks if a copy can be made by copy_batch instead of one copy call per file
+    """
+    return False
+
+
+class GcloudStorage(StorageBackend):
+  """This class accesses GCP buckets through the `gcloud storage` command line tool
+  """
+
+  # the number of URIs passed to a single `gcloud storage ls` call to stay below command line length limits
+  batch_size = 500
+
+  def parse_long_listing(self, output):
+    """This function parses the output of `gcloud storage ls -l` (or `ls -l -a`) into a dictionary of object URIs and sizes
+    """
+    sizes = {}
+    for line in output.splitlines():
+      fields = line.split(maxsplit=2)
+      if len(fields) == 3 and fields[0].isdigit():
+        uri = fields[2]
+        # -a lists every version as "uri#generation  metageneration=N"
+        if uri.rsplit(maxsplit=1)[-1].startswith("metageneration="):
+          uri = uri.rsplit(maxsplit=1)[0]
+        sizes[uri] = int(fields[0])
+    return sizes
+
+  def list(self, prefix):
+    """This function lists the objects directly under a prefix in one call
+
+    Args:
+      prefix (String): The bucket URI (and optional folder) to list
+
+    Returns:
+      Dict: The object URIs and their sizes in bytes; empty if the prefix does not exist
+    """
+    if not is_remote(prefix):
+      return LocalStorage().list(prefix)
+    result = subprocess.run(["gcloud", "storage", "ls", "-l", prefix.rstrip("/") + "/"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if result.returncode != 0:
+      return {}
+    return self.parse_long_listing(result.stdout)
+
+  def sizes(self, uris):
+    """This function looks up the sizes of many objects with as few `gcloud storage ls` calls as possible
+
+    Args:
+      uris (List): The object URIs
+
+    Returns:
+      Dict: The object URIs and their sizes in bytes; URIs that do not exist are left out
+    """
+    sizes = LocalStorage().sizes([uri for uri in uris if not is_remote(uri)])
+    uris = [uri for uri in uris if is_remote(uri)]
+    for start in range(0, len(uris), self.batch_size):
+      result = subprocess.run(["gcloud", "storage", "ls", "-l"] + uris[start:start + self.batch_size], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+      sizes.update(self.parse_long_listing(result.stdout))
+    return sizes
+
+  def versions(self, uris):
+    """This function looks up the generation of many objects with as few `gcloud storage ls` calls as possible
+
+    Args:
+      uris (List): The object URIs
+
+    Returns:
+      Dict: The object URIs and their current generation and size (e.g., "1712345678901234-5120"); URIs that do not exist are left out
+    """
+    versions = LocalStorage().versions([uri for uri in uris if not is_remote(uri)])
+    uris = [uri for uri in uris if is_remote(uri)]
+    for start in range(0, len(uris), self.batch_size):
+      # -a appends the generation to every URI (uri#generation); the live version has the highest generation
+      result = subprocess.run(["gcloud", "storage", "ls", "-l", "-a"] + uris[start:start + self.batch_size], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+      generations = {}
+      for uri, size in self.parse_long_listing(result.stdout).items():
+        uri, _, generation = uri.rpartition("#")
+        if generation.isdigit() and int(generation) > generations.get(uri, (-1, 0))[0]:
+          generations[uri] = (int(generation), size)
+      versions.update({uri: f"{generation}-{size}" for uri, (generation, size) in generations.items()})
+    return versions
+
+  def checksums(self, uris):
+    """This function looks up the sizes and MD5 checksums that GCP computed when the objects were written,
+    so the objects do not have to be read again
+
+    Args:
+      uris (List): The object URIs
+
+    Returns:
+      Dict: The object URIs and their size and hexadecimal MD5 checksum; the checksum is None for composite objects, which have none
+    """
+    checksums = LocalStorage().checksums([uri for uri in uris if not is_remote(uri)])
+    uris = [uri for uri in uris if is_remote(uri)]
+    for start in range(0, len(uris), self.batch_size):
+      result = subprocess.run(["gcloud", "storage", "objects", "list", "--format=json"] + uris[start:start + self.batch_size], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+      try:
+        objects = json.loads(result.stdout) if result.stdout.strip() else []
+      except ValueError:
+        objects = []
+      for description in objects:
+        md5_hash = description.get("md5_hash")
+        checksums[f"gs://{description['bucket']}/{description['name']}"] = (int(description["size"]), base64.b64decode(md5_hash).hex() if md5_hash else None)
+    return checksums
+
+  def stat(self, uri):
+    checksums = self.checksums([uri])
+    if uri not in checksums:
+      return None
+    size, md5 = checksums[uri]
+    return {"size": size, "version": self.versions([uri]).get(uri), "md5": md5}
+
+  def exists(self, uri):
+    result = subprocess.run(["gcloud", "storage", "ls", uri], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+  def can_copy_batch(self, source, destination):
+    """This function checks if a copy can be part of a batch; `gcloud storage cp -I` keeps the name of every source,
+    so only uploads of local files (staged under their destination names) and downloads (renamed once downloaded) are batched
+    """
+    return is_remote(source) != is_remote(destination)
+
+  def get_batch_name(self, source, destination):
+    """This function returns the name gcloud gives a file of a batch in its destination directory
+    """
+    return os.path.basename(destination) if not is_remote(source) else source.rstrip("/").rpartition("/")[2]
+
+  def make_batches(self, transfers, batch_size):
+    """This function splits transfers into batches that each go to one destination directory, with at most batch_size files
+    and no two files with the same name
+
+    Args:
+      transfers (List): (source, destination) tuples that can be batched
+      batch_size (Int): The maximum number of files per batch
+
+    Returns:
+      List: Lists of (source, destination) tuples
+    """
+    layers = {}
+    seen_names = {}
+    for source, destination in transfers:
+      directory = destination.rpartition("/")[0]
+      name = (directory, self.get_batch_name(source, destination))
+      # the n-th file with a given name goes into the n-th layer of its directory
+      layer = seen_names.get(name, 0)
+      seen_names[name] = layer + 1
+      layers.setdefault((directory, layer), []).append((source, destination))
+    return [layer[start:start + batch_size] for layer in layers.values() for start in range(0, len(layer), batch_size)]
+
+  def copy_batch(self, transfers):
+    """This function copies a batch of files (made by make_batches) with a single `gcloud storage cp -I` call, which
+    parallelizes the copies internally, and reads the result of every file back from the gcloud manifest
+
+    Args:
+      transfers (List): (source, destination) tuples with the same destination directory and distinct batch names
+
+    Returns:
+      Dict: The size and hexadecimal MD5 checksum (or None) of every completed transfer
+      Dict: The error message of every failed transfer
+    """
+    destination_directory = transfers[0][1].rpartition("/")[0]
+    downloading = is_remote(transfers[0][0])
+    if downloading:
+      os.makedirs(destination_directory, exist_ok=True)
+    # downloads are staged next to their destinations so they can be moved into place atomically
+    with tempfile.TemporaryDirectory(prefix=".mercury_batch_", dir=destination_directory if downloading else None) as staging_directory:
+      names = {}
+      inputs = []
+      for source, destination in transfers:
+        name = self.get_batch_name(source, destination)
+        names[name] = (source, destination)
+        if downloading:
+          inputs.append(source)
+        else:
+          # local files are uploaded through symbolic links named after their destinations
+          link = os.path.join(staging_directory, name)
+          os.symlink(os.path.abspath(source), link)
+          inputs.append(link)
+
+      manifest_path = os.path.join(staging_directory, ".mercury_manifest.csv")
+      target = (staging_directory if downloading else destination_directory) + "/"
+      result = subprocess.run(["gcloud", "storage", "cp", "-I", f"--manifest-path={manifest_path}", target], input="\n".join(inputs) + "\n",
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+      results = {}
+      failures = {}
+      if os.path.exists(manifest_path):
+        with open(manifest_path, newline="") as manifest:
+          for row in csv.DictReader(manifest):
+            transfer = names.get(row.get("Destination", "").rstrip("/").rpartition("/")[2])
+            if transfer is None:
+              continue
+            if row.get("Result", "").upper() == "OK":
+              size = row.get("Bytes Transferred") or row.get("Source Size")
+              md5 = base64.b64decode(row["Md5"]).hex() if row.get("Md5") else None
+              results[transfer] = (int(size) if size and size.isdigit() else None, md5)
+            else:
+              failures[transfer] = row.get("Description") or row.get("Result") or "unknown error"
+
+      if downloading:
+        for source, destination in list(results):
+          try:
+            os.replace(os.path.join(staging_directory, self.get_batch_name(source, destination)), destination)
+          except OSError as error:
+            del results[(source, destination)]
+            failures[(source, destination)] = str(error)
+      # files gcloud did not report on (e.g., if it could not start) failed with its overall error
+      error_lines = result.stderr.strip().splitlines()
+      for transfer in transfers:
+        if transfer not in results and transfer not in failures:
+          failures[transfer] = error_lines[-1] if error_lines else f"gcloud exited with code {result.returncode} without reporting this file"
+    return results, failures
+
+  def copy(self, source, destination):
+    """This function copies a file; gcloud does not report the size or checksum, so (None, None) is returned
+    """
+    subprocess.run(["gcloud", "storage", "cp", source, destination], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return None, None
+
+  def get(self, uri, path):
+    return self.copy(uri, path)
+
+  def put(self, path, uri):
+    return self.copy(path, uri)
+
+  def copy_object(self, source, destination):
+    return self.copy(source, destination)
+
+
+class LocalStorage(StorageBackend):
+  """This class accesses a local directory that stands in for a GCP bucket (e.g., for offline runs)
+  """
+
+  # the number of bytes read at a time when copying or checksumming a file
+  block_size = 1024 * 1024
+
+  def list(self, prefix):
+    if not os.path.isdir(prefix):
+      return {}
+    prefix = prefix.rstrip("/")
+    return {prefix + "/" + entry.name: entry.stat().st_size for entry in os.scandir(prefix) if entry.is_file()}
+
+  def stat(self, uri):
+    if not os.path.isfile(uri):
+      return None
+    status = os.stat(uri)
+    # the checksum is only computed when it is asked for (see checksums), as it needs the whole file to be read
+    return {"size": status.st_size, "version": f"{status.st_mtime_ns}-{status.st_size}", "md5": None}
+
+  def checksums(self, uris):
+    checksums = {}
+    for uri in uris:
+      if os.path.isfile(uri):
+        md5 = hashlib.md5()
+        with open(uri, "rb") as local_file:
+          for block in iter(lambda: local_file.read(self.block_size), b""):
+            md5.update(block)
+        checksums[uri] = (os.path.getsize(uri), md5.hexdigest())
+    return checksums
+
+  def exists(self, uri):
+    return os.path.exists(uri)
+
+  def put(self, path, uri):
+    """This function copies a file, computing its MD5 checksum as it streams through
+
+    Returns:
+      Int: The number of bytes copied
+      String: The hexadecimal MD5 checksum of the file
+    """
+    destination_directory = os.path.dirname(os.path.abspath(uri))
+    os.makedirs(destination_directory, exist_ok=True)
+    md5 = hashlib.md5()
+    size = 0
+    with open(path, "rb") as source_file, open(uri, "wb") as destination_file:
+      for block in iter(lambda: source_file.read(self.block_size), b""):
+        destination_file.write(block)
+        md5.update(block)
+        size += len(block)
+    return size, md5.hexdigest()
+
+  def get(self, uri, path):
+    return self.put(uri, path)
+
+  def copy_object(self, source, destination):
+    return self.put(source, destination)
@@ -0,0 +1,87 @@
+from Table import Table
+from Metadata import Metadata
+from RunReport import RunReport
+import logging
+
+# the organisms Mercury can prepare submissions for
+ORGANISMS = ["sars-cov-2", "flu", "mpox"]
+# the databases that get a metadata table, and those that also get a combined fasta
+DATABASES = ["biosample", "sra", "genbank", "bankit", "gisaid"]
+FASTA_DATABASES = ["genbank", "bankit", "gisaid"]
+# the defaults of the Table options that have none, as on the command line
+DEFAULT_OPTIONS = {
+  "output_prefix": "mercury", "skip_county": False, "skip_ncbi": False, "usa_territory": False, "vadr_alert_limit": 0,
+  "number_n_threshold": 5000, "single_end": False, "assembly_fasta_column_name": "assembly_fasta", "read1_column_name": "read1_dehosted",
+  "read2_column_name": "read2_dehosted", "assembly_mean_coverage_column_name": "assembly_mean_coverage",
+  **{option: "" for option in ["authors", "bioproject_accession", "continent", "country", "host_disease", "isolation_source",
+                               "library_selection", "library_source", "library_strategy", "purpose_of_sequencing", "state",
+                               "submitting_lab", "submitting_lab_address", "amplicon_primer_scheme", "amplicon_size",
+                               "instrument_model", "library_layout", "seq_platform", "gisaid_submitter", "submitter_email",
+                               "metadata_organism"]}
+}
+
+
+class SubmissionResult:
+  """This class holds the outputs of a prepared submission
+  """
+
+  def __init__(self, outputs, run_report):
+    # the metadata table of every prepared database (e.g., "gisaid"), and the combined fasta (a BytesIO) of those that take assemblies
+    self.tables = {name: outputs[name] for name in DATABASES if name in outputs}
+    self.fastas = {name: outputs[name + "_fasta"] for name in FASTA_DATABASES if name + "_fasta" in outputs}
+    self.terra_table = outputs.get("terra")
+    # the samples excluded by the quality rules (sample_name, message), and those missing required metadata (the missing columns are empty)
+    self.quality_exclusions = outputs.get("quality_exclusions")
+    self.missing_metadata_exclusions = outputs.get("missing_metadata_exclusions")
+    # the required fields each of those samples is missing, by sample name
+    self.missing_fields = outputs.get("missing_fields")
+    self.sample_reconciliation = outputs.get("sample_reconciliation")
+    self.checksums = outputs.get("checksums")
+    self.run_report = run_report.to_dict()
+
+
+class Submission:
+  """This class prepares a submission from a table that is already in memory, without the command line: the outputs are
+  returned as DataFrames and in-memory fasta streams, and are only written to files if asked. Errors are raised (as
+  TableError or ValueError) instead of ending the process
+
+  Example:
+    result = Submission(terra_table, "sample_id", ["sample1", "sample2"], "gs://bucket/reads", organism="sars-cov-2").run()
+    result.tables["gisaid"], result.fastas["gisaid"].read()
+  """
+
+  def __init__(self, table, table_name, samplenames, gcp_bucket_uri, organism="sars-cov-2", write_files=False, logger=None, **options):
+    """
+    Args:
+      table (DataFrame): The input table; any table with a to_pandas method (e.g., a pyarrow Table) is converted first
+      table_name (String): The name of the first column in the table, holding the sample names
+      samplenames (List): The sample names to prepare
+      gcp_bucket_uri (String): The GCP bucket URI (or local directory) the SRA read files are copied to
+      organism (String): "sars-cov-2", "flu", or "mpox"
+      write_files (Boolean): Also write every output file, as the command line does
+      logger (Logger): The logger to use; by default the logger of this module, which is not configured here
+      options: Any other option of Table (e.g., skip_ncbi, country, output_prefix, or shard_size)
+    """
+    if organism.lower() not in ORGANISMS:
+      raise ValueError(f"Organism {organism} not recognized")
+    self.logger = logger if logger is not None else logging.getLogger(__name__)
+    self.table = table.to_pandas() if hasattr(table, "to_pandas") else table
+    self.table_name = table_name
+    self.samplenames = list(samplenames)
+    self.gcp_bucket_uri = gcp_bucket_uri
+    self.organism = organism
+    self.write_files = write_files
+    self.options = {**DEFAULT_OPTIONS, **options}
+
+  def run(self):
+    """This function prepares the submission
+
+    Returns:
+      SubmissionResult: The outputs of the submission
+    """
+    run_report = RunReport(self.logger)
+    metadata_list = Metadata(self.logger, self.organism, self.options["skip_ncbi"], self.options["assembly_mean_coverage_column_name"]).get_metadata()
+    table = Table(self.logger, self.organism, None, self.table_name, self.samplenames, metadata_list=metadata_list, gcp_bucket_uri=self.gcp_bucket_uri,
+                  run_report=run_report, input_dataframe=self.table, write_files=self.write_files, keep_outputs=True, **self.options)
+    table.process_table()
+    return SubmissionResult(table.outputs, run_report)
@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import time
+
+
+class SubmissionState:
+  """This class keeps a fingerprint of every sample prepared by earlier runs in a SQLite database,
+  so that incremental runs only prepare new or changed samples
+  """
+
+  # the number of samples looked up per query; SQLite limits the number of parameters of a statement
+  batch_size = 500
+
+  def __init__(self, logger, path):
+    self.logger = logger
+    self.path = path
+    self.logger.debug(f"STATE:Opening submission state database {self.path}")
+    # the database lives in the cache directory, which is not created by every run (e.g., flu never downloads assemblies)
+    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+    # batch jobs may share the database, so wait for their writes instead of failing
+    self.connection = sqlite3.connect(self.path, timeout=60)
+    with self.connection:
+      self.connection.execute("CREATE TABLE IF NOT EXISTS samples (organism TEXT NOT NULL, sample_name TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+                              "prepared REAL NOT NULL, PRIMARY KEY (organism, sample_name))")
+
+  def get_fingerprints(self, organism, sample_names):
+    """This function looks up the fingerprints recorded for the given samples
+
+    Args:
+      organism (String): The organism the samples were prepared for
+      sample_names (List): The sample names
+
+    Returns:
+      Dict: The recorded fingerprint of every sample that was prepared before
+    """
+    sample_names = list(dict.fromkeys(sample_names))
+    fingerprints = {}
+    for start in range(0, len(sample_names), self.batch_size):
+      batch = sample_names[start:start + self.batch_size]
+      query = "SELECT sample_name, fingerprint FROM samples WHERE organism = ? AND sample_name IN ({})".format(", ".join("?" * len(batch)))
+      fingerprints.update(self.connection.execute(query, [organism, *batch]).fetchall())
+    return fingerprints
+
+  def record(self, organism, fingerprints):
+    """This function records the fingerprints of samples that were prepared successfully
+
+    Args:
+      organism (String): The organism the samples were prepared for
+      fingerprints (Dict): The fingerprint of every sample name
+    """
+    now = time.time()
+    with self.connection:
+      self.connection.executemany("INSERT OR REPLACE INTO samples (organism, sample_name, fingerprint, prepared) VALUES (?, ?, ?, ?)",
+                                  [(organism, sample_name, fingerprint, now) for sample_name, fingerprint in fingerprints.items()])
+    self.logger.debug(f"STATE:Recorded {len(fingerprints)} prepared samples in {self.path}")
+
+  def close(self):
+    self.connection.close()
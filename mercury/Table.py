@@ -1,10 +1,106 @@
+from QualityControl import QualityControl
+from Metadata import get_output_schema
+from AssemblyCache import AssemblyCache, get_default_cache_directory
+from Fasta import FastaWriter
+from RunManifest import RunManifest, get_file_md5
+from RunReport import RunReport
+from SubmissionState import SubmissionState
+from Columns import as_text, compact, compact_table, constant, get_missing_values
+from TableFormats import COLUMNAR_FORMATS, get_table_format, read_columnar_table
+from Storage import get_storage, is_remote, is_gcloud_available
+from Transfer import TransferScheduler, TransferError, merge_statistics
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-import subprocess
-import re
+import threading
+import asyncio
+import hashlib
+import io
+import os
 import sys
 
 
+# YYYY-MM-DD (optionally followed by a time), or the partial dates YYYY-MM and YYYY that GISAID and NCBI accept
+DATE_PATTERN = r"^(?P<year>\d{4})(?:-(?P<month>\d{2})(?:-(?P<day>\d{2})(?:[T ].*)?)?)?$"
+
+
+class TableError(Exception):
+  """This exception is raised when the table cannot be processed; the error is logged before it is raised, and the
+  command line exits when it is caught
+  """
+
+
+class WriterError(Exception):
+  """This exception is raised by an output writer that cannot complete; the errors of every writer are reported together
+  """
+
+
+def read_input_table(input_table, table_name, samplenames, needed_columns, chunk_size=50000):
+  """This function reads only the needed columns of a table and keeps only the rows of the requested samples; TSV tables
+  (plain, gzip or zstd compressed, from a file or stdin) are read in chunks, and Parquet and Arrow IPC/Feather tables are read with pyarrow
+
+  Args:
+    input_table (String): The path of the table, or "-" for stdin
+    table_name (String): The name of the first column, holding the sample names
+    samplenames (List): The sample names to keep
+    needed_columns (Set): The lowercase names of the columns to read; headers are matched case-insensitively
+    chunk_size (Int): The number of rows parsed at a time
+
+  Returns:
+    DataFrame: The requested rows and columns
+  """
+  source = input_table
+  head = None
+  if source == "-":
+    # stdin cannot be read twice, so its first bytes are peeked at (without consuming them) to detect the format
+    source = sys.stdin.buffer
+    head = source.peek(8)[:8]
+  table_format = get_table_format(input_table, head)
+
+  samplenames = set(samplenames)
+  if table_format in COLUMNAR_FORMATS:
+    if source is sys.stdin.buffer:
+      # pyarrow needs to seek in the table, so a columnar table from stdin is buffered whole
+      source = io.BytesIO(source.read())
+    return read_columnar_table(source, table_format, table_name, samplenames, needed_columns)
+
+  # the columns are selected as the header is parsed, so the table (or stdin) is read in a single pass
+  compression = table_format if table_format != "tsv" else None
+  chunks = []
+  reader = pd.read_csv(source, sep="\t", header=0, usecols=lambda column: column.lower() in needed_columns or column == table_name,
+                       dtype={table_name: 'str'}, chunksize=chunk_size, compression=compression)
+  for chunk in reader:
+    chunks.append(chunk[chunk[table_name].isin(samplenames)])
+  return pd.concat(chunks)
+
+def parse_dates(dates):
+  """This function parses a column of dates in ISO 8601 format (YYYY-MM-DD) or partial dates (YYYY-MM or YYYY) at once,
+  checking that the month and day exist
+
+  Args:
+    dates (Series): The dates
+
+  Returns:
+    DataFrame: The date without surrounding whitespace, and its year, month and day as strings; the month and day are
+      missing for partial dates, and all four are missing if the date is not valid
+  """
+  # a table has far fewer distinct dates than samples, so every distinct date is parsed once
+  codes, unique_dates = pd.factorize(dates)
+  stripped_dates = pd.Series(unique_dates, dtype=object).astype("string").str.strip()
+  parts = stripped_dates.str.extract(DATE_PATTERN)
+  parts.insert(0, "date", stripped_dates)
+  parts = parts.astype(object).where(parts.notna(), np.nan)
+  month = pd.to_numeric(parts["month"])
+  complete_dates = pd.to_datetime(parts["year"] + "-" + parts["month"] + "-" + parts["day"], format="%Y-%m-%d", errors="coerce")
+  invalid = (month.notna() & ~month.between(1, 12)) | (parts["day"].notna() & complete_dates.isna())
+  parts.loc[invalid | parts["year"].isna()] = np.nan
+  # missing dates (code -1) take the last row, which is left empty
+  parts.loc[len(parts)] = np.nan
+  parts = parts.iloc[codes]
+  parts.index = dates.index
+  return parts
+
+
 class Table:
   """This class controls the manipulation of the table
   """
@@ -15,14 +111,21 @@ class Table:
                authors, bioproject_accession, continent, country, host_disease, isolation_source, library_selection, 
                library_source, library_strategy, purpose_of_sequencing, state, submitting_lab, submitting_lab_address, 
                amplicon_primer_scheme, amplicon_size, instrument_model, library_layout, seq_platform, 
-               gisaid_submitter, submitter_email, metadata_organism, read2_column_name=""):
+               gisaid_submitter, submitter_email, metadata_organism, read2_column_name="", transfer_concurrency=8, transfer_retries=3,
+               cache_directory=None, cache_size=2048, write_sample_fastas=False, run_report=None, input_dataframe=None,
+               resume=False, incremental=False, state_database=None, compute_checksums=False,
+               transfer_batch_size=1000, storage_backend="auto",
+               async_io=False, strict_samples=False, shard_size=0, write_files=True, keep_outputs=False):
     self.logger = logger
     self.logger.debug("TABLE:Initializing Table class")
     
     self.organism = organism
     self.input_table = input_table
     self.table_name = table_name
-    self.samplenames = samplenames
+    # the requested sample names are kept once each, in order; names requested more than once are reported by extract_samples
+    self.requested_samplenames = samplenames
+    self.samplenames = list(dict.fromkeys(samplenames))
+    self.strict_samples = strict_samples
     self.skip_county = skip_county
     self.skip_ncbi = skip_ncbi
     self.usa_territory = usa_territory
@@ -37,8 +140,40 @@ class Table:
   
     self.output_prefix = output_prefix
     self.exclusion_table_name = self.output_prefix + "_excluded_samples.tsv"
+    self.reconciliation_table_name = self.output_prefix + "_sample_reconciliation.tsv"
+    # the maximum number of samples in each output file; 0 writes every output to a single file
+    self.shard_size = shard_size
+    # the outputs are written to files and/or kept in self.outputs (e.g., for Submission), by name; the combined fasta
+    # files are kept as in-memory streams
+    self.write_files = write_files
+    self.keep_outputs = keep_outputs
+    self.outputs = {}
 
     self.gcp_bucket_uri = gcp_bucket_uri
+    self.transfer_concurrency = transfer_concurrency
+    self.transfer_retries = transfer_retries
+    self.transfer_batch_size = transfer_batch_size
+    self.storage_backend = storage_backend
+    self.async_io = async_io
+    # the writers run at the same time, so their uploads and downloads share one limit on the transfers running at the same time
+    self.transfer_limiter = threading.BoundedSemaphore(max(1, self.transfer_concurrency))
+    self.cache_directory = cache_directory if cache_directory else get_default_cache_directory()
+    self.cache_size = cache_size
+    self.assembly_cache = None
+    # the writers (and the shards of each writer) create the assembly cache on first use
+    self.assembly_cache_lock = threading.Lock()
+    self.write_sample_fastas = write_sample_fastas
+    self.run_report = run_report if run_report is not None else RunReport(self.logger)
+    self.resume = resume
+    # the run manifest is opened in process_table so that only a run that writes outputs creates or truncates it
+    self.run_manifest = None
+    self.incremental = incremental
+    self.state_database = state_database if state_database else os.path.join(self.cache_directory, "submission_state.sqlite")
+    self.submission_state = None
+    self.sample_fingerprints = None
+    self.compute_checksums = compute_checksums
+    # the path or URI, size and MD5 checksum of every read file uploaded and fasta file written
+    self.file_checksums = []
     self.single_end = single_end
     self.authors = authors
     self.bioproject_accession = bioproject_accession
@@ -62,26 +197,44 @@ class Table:
     self.submitter_email = submitter_email
     self.metadata_organism = metadata_organism
 
-    # transform the input table into a pandas dataframe
-    self.logger.debug(f"TABLE:Loading input table {self.input_table}")
-    self.table = pd.read_csv(self.input_table, sep="\t", header=0, dtype={self.table_name: 'str'})
+    # register the default quality rules; additional rules can be added before process_table is called
+    self.quality_control = QualityControl(self.logger, self.table_name.lower())
+    self.add_default_quality_rules()
 
-  def get_year_from_date(self, date):
-    """This function extracts the year from a date in ISO 8601 format
+    # the input table is read in process_table so that only the needed columns and samples are loaded
+    self.input_dataframe = input_dataframe
+    self.table = None
+    self.read_chunk_size = 50000
 
-    Args:
-      date (String): The date in ISO 8601 format (YYYY-MM-DD)
+  def get_needed_columns(self):
+    """This function collects the (lowercase) names of every column that Mercury reads from the input table
 
     Returns:
-      Int: The year from the date, or np.nan if the date is not in the correct format
+      Set: The lowercase column names required by the metadata requirements, the data columns, and the quality rules
+    """
+    needed_columns = {column.lower() for group in self.metadata_list[0] + self.metadata_list[1] for column in group}
+    needed_columns.update([self.table_name, self.assembly_fasta_column_name, self.assembly_mean_coverage_column_name, self.read1_column_name, self.read2_column_name])
+    # columns used to create the standard variables and the flu isolate
+    needed_columns.update(["submission_id", "organism", "country", "state", "county", "collection_date", "isolate", "strain"])
+    for rule in self.quality_control.rules:
+      needed_columns.update(rule["columns"])
+    return {column.lower() for column in needed_columns if column}
+
+  def read_table(self):
+    """This function loads only the needed columns of the input table and keeps only the rows of the requested samples;
+    if a preloaded table was given (e.g., shared by a batch of runs) it is used instead of reading the input table again
     """
-    r = re.compile('^\d{4}-\d{2}-\d{2}')      
-    if pd.isna(date) or r.match(date) is None:
-      self.logger.debug("TABLE:Incorrect collection date format; collection date must be in YYYY-MM-DD format. Invalid date was: " + str(date))
-      return np.nan
+    needed_columns = self.get_needed_columns()
+    if self.input_dataframe is not None:
+      self.logger.debug("TABLE:Using the preloaded input table")
+      selected_columns = [column for column in self.input_dataframe.columns if column.lower() in needed_columns or column == self.table_name]
+      table = self.input_dataframe[selected_columns]
+      self.table = table[table[self.table_name].isin(set(self.samplenames))]
     else:
-      return date.split("-")[0]
-           
+      self.logger.debug(f"TABLE:Loading input table {self.input_table}")
+      self.table = read_input_table(self.input_table, self.table_name, self.samplenames, needed_columns, self.read_chunk_size)
+    self.logger.debug(f"TABLE:Loaded {len(self.table.columns)} columns and {len(self.table)} rows for the requested samples")
+
   def extract_samples(self):
     """This function pulls out the rows that belong to each sample in the samplenames list. It also converts the column names to lowercase.
     
@@ -89,78 +242,150 @@ class Table:
       DataFrame: The reduced table with lowercase headers
     """
     self.logger.debug("TABLE:Extracting samples from table")
-    working_table = self.table[self.table[self.table_name].isin(self.samplenames)]
+    working_table = self.table[self.table[self.table_name].isin(set(self.samplenames))]
+    self.reconcile_samples(working_table[self.table_name])
     # Create a dictionary to retain the original column names
     self.terra_columns = {col.lower(): col for col in working_table.columns}
     working_table.columns = working_table.columns.str.lower()
-    self.table = working_table
+    # columns with few distinct values (e.g., country or lab) are stored as categoricals for the rest of the run
+    self.table = compact_table(working_table)
+
+  def reconcile_samples(self, sample_names):
+    """This function compares the requested samples with the rows found in the table, so missing and duplicated samples are
+    caught before any file is transferred; if there are any, the result is written to <output_prefix>_sample_reconciliation.tsv
+
+    Args:
+      sample_names (Series): The sample name of every row of the table that belongs to a requested sample
+    """
+    # one pass over the sample names of the table
+    row_counts = sample_names.value_counts()
+    request_counts = pd.Series(self.requested_samplenames, dtype=object).value_counts()
+    reconciliation = pd.DataFrame({"sample_name": self.samplenames})
+    reconciliation["rows_in_table"] = reconciliation["sample_name"].map(row_counts).fillna(0).astype(int)
+    reconciliation["times_requested"] = reconciliation["sample_name"].map(request_counts).astype(int)
+    reconciliation["status"] = "found"
+    reconciliation.loc[reconciliation["rows_in_table"] > 1, "status"] = "duplicated"
+    reconciliation.loc[reconciliation["rows_in_table"] == 0, "status"] = "missing"
+
+    missing = reconciliation.loc[reconciliation["status"] == "missing", "sample_name"]
+    duplicated = reconciliation.loc[reconciliation["status"] == "duplicated", "sample_name"]
+    # the file is only written when a sample needs attention, so the outputs of a run without any do not change
+    reconciliation_path = self.reconciliation_table_name if len(missing) > 0 or len(duplicated) > 0 else None
+    self.save_table("sample_reconciliation", reconciliation, reconciliation_path, sep='\t', index=False)
+    requested_twice = reconciliation.loc[reconciliation["times_requested"] > 1, "sample_name"]
+    self.run_report.details.update({"missing_samples": len(missing), "duplicated_samples": len(duplicated)})
+    if len(missing) > 0:
+      self.logger.warning("TABLE:Warning: {} requested samples are not in the table: {}".format(len(missing), ", ".join(missing)))
+    if len(duplicated) > 0:
+      self.logger.warning("TABLE:Warning: {} requested samples are in more than one row of the table: {}".format(len(duplicated), ", ".join(duplicated)))
+    if len(requested_twice) > 0:
+      self.logger.info("TABLE:{} samples were requested more than once and are prepared once: {}".format(len(requested_twice), ", ".join(requested_twice)))
+    if self.strict_samples and (len(missing) > 0 or len(duplicated) > 0):
+      self.logger.error("TABLE:ENDING PROCESS! Missing or duplicated samples were found; see {}".format(self.reconciliation_table_name))
+      raise TableError("missing or duplicated samples were found: " + ", ".join(pd.concat([missing, duplicated])))
+
+  def get_sample_fingerprints(self):
+    """This function fingerprints every row from its metadata and data (assembly and read URI) columns and the submission target,
+    so a sample is only considered unchanged if everything that goes into its outputs is the same
+
+    Returns:
+      Series: The hexadecimal fingerprint of every row
+    """
+    columns = sorted(self.table.columns)
+    prefix = "\x1f".join([str(self.skip_ncbi), self.gcp_bucket_uri, *columns])
+    values = self.table[columns].astype(object)
+    values = values.where(values.notna(), "").astype(str)
+    fingerprints = [hashlib.sha256("\x1f".join((prefix, *row)).encode()).hexdigest() for row in zip(*(values[column] for column in columns))]
+    return pd.Series(fingerprints, index=self.table.index, dtype=object)
+
+  def select_changed_samples(self):
+    """This function removes the samples that were prepared by an earlier run and have not changed since (incremental mode only)
+    """
+    if not self.incremental:
+      return
+    sample_names = self.table[self.table_name.lower()]
+    self.sample_fingerprints = self.get_sample_fingerprints()
+    self.submission_state = SubmissionState(self.logger, self.state_database)
+    previous_fingerprints = self.submission_state.get_fingerprints(self.organism.lower(), sample_names)
+    unchanged = np.array([previous_fingerprints.get(sample_name) == fingerprint for sample_name, fingerprint in zip(sample_names, self.sample_fingerprints)], dtype=bool)
+    self.logger.info(f"TABLE:{unchanged.sum()} of {len(self.table)} samples were prepared by an earlier run and have not changed; preparing the other {(~unchanged).sum()}")
+    self.table = self.table[~unchanged]
+
+  def record_prepared_samples(self):
+    """This function records the fingerprints of the samples that were prepared, so later incremental runs skip them
+    """
+    if not self.incremental:
+      return
+    fingerprints = self.sample_fingerprints.loc[self.table.index]
+    self.submission_state.record(self.organism.lower(), dict(zip(self.table[self.table_name.lower()], fingerprints)))
 
   def populate_from_options(self):    
-    """This function populates the table with the options provided by the user"""
+    """This function populates the table with the options provided by the user; every option is stored once per column
+    (see Columns.constant) instead of once per row"""
     self.logger.debug("TABLE:Populating table with provided metadata")
     if self.metadata_organism:
-      self.table["organism"] = self.metadata_organism
+      self.table["organism"] = constant(self.metadata_organism, self.table.index)
       self.logger.debug(f"TABLE:Metadata organism was provided, overwriting organism column with {self.metadata_organism}")
     # Overwrite preexisting inputs if these values do not evaluate to False
     if self.authors:
-      self.table["authors"] = self.authors
+      self.table["authors"] = constant(self.authors, self.table.index)
       self.logger.debug(f"TABLE:Authors were provided, overwriting authors column with {self.authors}")
     if self.bioproject_accession:
-      self.table["bioproject_accession"] = self.bioproject_accession
+      self.table["bioproject_accession"] = constant(self.bioproject_accession, self.table.index)
       self.logger.debug(f"TABLE:BioProject accession was provided, overwriting BioProject accession column with {self.bioproject_accession}")
     if self.continent:
-      self.table["continent"] = self.continent
+      self.table["continent"] = constant(self.continent, self.table.index)
       self.logger.debug(f"TABLE:Continent was provided, overwriting continent column with {self.continent}")
     if self.country:
-      self.table["country"] = self.country
+      self.table["country"] = constant(self.country, self.table.index)
       self.logger.debug(f"TABLE:Country was provided, overwriting country column with {self.country}")
     if self.host_disease:
-      self.table["host_disease"] = self.host_disease
+      self.table["host_disease"] = constant(self.host_disease, self.table.index)
       self.logger.debug(f"TABLE:Host disease was provided, overwriting host_disease column with {self.host_disease}")
     if self.isolation_source:
-      self.table["isolation_source"] = self.isolation_source
+      self.table["isolation_source"] = constant(self.isolation_source, self.table.index)
       self.logger.debug(f"TABLE:Isolation source was provided, overwriting isolation_source column with {self.isolation_source}")
     if self.library_selection:
-      self.table["library_selection"] = self.library_selection
+      self.table["library_selection"] = constant(self.library_selection, self.table.index)
       self.logger.debug(f"TABLE:Library selection was provided, overwriting library_selection column with {self.library_selection}")
     if self.library_source:
-      self.table["library_source"] = self.library_source
+      self.table["library_source"] = constant(self.library_source, self.table.index)
       self.logger.debug(f"TABLE:Library source was provided, overwriting library_source column with {self.library_source}")
     if self.library_strategy:
-      self.table["library_strategy"] = self.library_strategy
+      self.table["library_strategy"] = constant(self.library_strategy, self.table.index)
       self.logger.debug(f"TABLE:Library strategy was provided, overwriting library_strategy column with {self.library_strategy}")
     if self.purpose_of_sequencing:
-      self.table["purpose_of_sequencing"] = self.purpose_of_sequencing
+      self.table["purpose_of_sequencing"] = constant(self.purpose_of_sequencing, self.table.index)
       self.logger.debug(f"TABLE:Purpose of sequencing was provided, overwriting purpose_of_sequencing column with {self.purpose_of_sequencing}")
     if self.state:
-      self.table["state"] = self.state
+      self.table["state"] = constant(self.state, self.table.index)
       self.logger.debug(f"TABLE:State was provided, overwriting state column with {self.state}")
     if self.submitting_lab:
-      self.table["submitting_lab"] = self.submitting_lab
+      self.table["submitting_lab"] = constant(self.submitting_lab, self.table.index)
       self.logger.debug(f"TABLE:Submitting lab was provided, overwriting submitting_lab column with {self.submitting_lab}")
     if self.submitting_lab_address:
-      self.table["submitting_lab_address"] = self.submitting_lab_address
+      self.table["submitting_lab_address"] = constant(self.submitting_lab_address, self.table.index)
       self.logger.debug(f"TABLE:Submitting lab address was provided, overwriting submitting_lab_address column with {self.submitting_lab_address}")
     if self.amplicon_primer_scheme:
-      self.table["amplicon_primer_scheme"] = self.amplicon_primer_scheme
+      self.table["amplicon_primer_scheme"] = constant(self.amplicon_primer_scheme, self.table.index)
       self.logger.debug(f"TABLE:Amplicon primer scheme was provided, overwriting amplicon_primer_scheme column with {self.amplicon_primer_scheme}")
     if self.amplicon_size:
-      self.table["amplicon_size"] = self.amplicon_size
+      self.table["amplicon_size"] = constant(self.amplicon_size, self.table.index)
       self.logger.debug(f"TABLE:Amplicon size was provided, overwriting amplicon_size column with {self.amplicon_size}")
     if self.instrument_model:
-      self.table["instrument_model"] = self.instrument_model
+      self.table["instrument_model"] = constant(self.instrument_model, self.table.index)
       self.logger.debug(f"TABLE:Instrument model was provided, overwriting instrument_model column with {self.instrument_model}")
     if self.library_layout:
-      self.table["library_layout"] = self.library_layout
+      self.table["library_layout"] = constant(self.library_layout, self.table.index)
       self.logger.debug(f"TABLE:Library layout was provided, overwriting library_layout column with {self.library_layout}")
     if self.seq_platform:
-      self.table["seq_platform"] = self.seq_platform
+      self.table["seq_platform"] = constant(self.seq_platform, self.table.index)
       self.logger.debug(f"TABLE:Sequencing platform was provided, overwriting seq_platform column with {self.seq_platform}")
     if self.gisaid_submitter:
-      self.table["gisaid_submitter"] = self.gisaid_submitter
+      self.table["gisaid_submitter"] = constant(self.gisaid_submitter, self.table.index)
       self.logger.debug(f"TABLE:GISAID submitter was provided, overwriting gisaid_submitter column with {self.gisaid_submitter}")
     if self.submitter_email:
-      self.table["submitter_email"] = self.submitter_email
+      self.table["submitter_email"] = constant(self.submitter_email, self.table.index)
       self.logger.debug(f"TABLE:Submitter email was provided, overwriting submitter_email column with {self.submitter_email}")
 
     
@@ -168,87 +393,96 @@ class Table:
     """This function creates standard variables in the table
     """
     self.logger.debug("TABLE:Creating standard variables like date and host")
-    self.table["year"] = self.table["collection_date"].apply(lambda x: self.get_year_from_date(x))
-    self.table["host"] = "Human" #(????)
+    dates = parse_dates(self.table["collection_date"])
+    for date in self.table.loc[dates["year"].isna(), "collection_date"]:
+      self.logger.debug("TABLE:Incorrect collection date format; collection date must be in YYYY-MM-DD, YYYY-MM or YYYY format. Invalid date was: " + str(date))
+    # valid dates are written as they were checked, without surrounding whitespace; invalid ones are kept for the excluded samples table
+    self.table["collection_date"] = compact(dates["date"].where(dates["year"].notna(), as_text(self.table["collection_date"])))
+    self.table["year"] = compact(dates["year"])
+    self.table["host"] = constant("Human", self.table.index) #(????)
     if self.skip_ncbi:
       self.logger.debug("TABLE:Skipping creating NCBI-specific variables")
     else:
       self.logger.debug("TABLE:Creating NCBI-specific variables")
-      self.table["host_sci_name"] = "Homo sapiens"
-      self.table["filetype"] = "fastq"
+      self.table["host_sci_name"] = constant("Homo sapiens", self.table.index)
+      self.table["filetype"] = constant("fastq", self.table.index)
       
       if self.organism.lower() != "flu":
-        self.table["isolate"] = (self.table["organism"] + "/" + self.table["host"] + "/" + self.table["country"] + "/" + self.table["submission_id"] + "/" + self.table["year"])
+        self.table["isolate"] = (as_text(self.table["organism"]) + "/" + as_text(self.table["host"]) + "/" + as_text(self.table["country"]) + "/" + as_text(self.table["submission_id"]) + "/" + as_text(self.table["year"]))
       
-      self.table["biosample_accession"] = "{populate_with_BioSample_accession}"
-      self.table["design_description"] = "Whole genome sequencing of " + self.table["organism"] 
+      self.table["biosample_accession"] = constant("{populate_with_BioSample_accession}", self.table.index)
+      self.table["design_description"] = compact("Whole genome sequencing of " + as_text(self.table["organism"]))
     
     if self.organism.lower() == "sars-cov-2":
-      self.table["gisaid_organism"] = "hCoV-19"
+      self.table["gisaid_organism"] = constant("hCoV-19", self.table.index)
     elif self.organism.lower() == "mpox":
-      self.table["gisaid_organism"] = "mpx/A"
+      self.table["gisaid_organism"] = constant("mpx/A", self.table.index)
 
     if self.organism.lower() != "flu":
       self.logger.debug("TABLE:Populating gisaid_virus_name")
       if self.usa_territory:
         # if usa territory, use "state" (e.g., Puerto Rico) instead of country (USA)
-        self.table["gisaid_virus_name"] = (self.table["gisaid_organism"] + "/" + self.table["state"] + "/" + self.table["submission_id"] + "/" + self.table["year"])
+        self.table["gisaid_virus_name"] = (as_text(self.table["gisaid_organism"]) + "/" + as_text(self.table["state"]) + "/" + as_text(self.table["submission_id"]) + "/" + as_text(self.table["year"]))
       else: 
-        self.table["gisaid_virus_name"] = (self.table["gisaid_organism"] + "/" + self.table["country"] + "/" + self.table["submission_id"] + "/" + self.table["year"])
+        self.table["gisaid_virus_name"] = (as_text(self.table["gisaid_organism"]) + "/" + as_text(self.table["country"]) + "/" + as_text(self.table["submission_id"]) + "/" + as_text(self.table["year"]))
 
       
   def remove_nas(self):
-    """This function removes rows with missing values in the required metadata columns and writes them to a file
+    """This function removes rows with missing values in the required metadata columns and writes them to a file; empty
+    and whitespace-only values are missing too. Only the required columns are checked, once each, and the resulting
+    bitmap (see Columns.get_missing_values) gives both the rows to remove and the missing fields of every sample
     """
-    # replace blank cells with NaNs (blanks are missing values)
-    self.table.replace(r'^\s+$', np.nan, regex=True)
-    # remove rows with missing values in the required metadata columns
-    excluded_samples = self.table[self.table[self.required_metadata].isna().any(axis=1)]
-    # set the index to the sample name
-    excluded_samples.set_index(self.table_name.lower(), inplace=True)
-    # remove all optional columns so only required columns are shown
-    excluded_samples = excluded_samples[excluded_samples.columns.intersection(self.required_metadata)]
-    # remove all NON-NA columns so only columns with NAs remain; Shelly is a wizard and I love her 
-    excluded_samples = excluded_samples.loc[:, excluded_samples.isna().any()] 
-    # remove all rows that are required with NaNs from table
-    self.table.dropna(subset=self.required_metadata, axis=0, how='any', inplace=True) 
-
-    with open(self.exclusion_table_name, "a") as exclusions:
-      exclusions.write("\nSamples excluded for missing required metadata (will have empty values in indicated columns):\n")
-    excluded_samples.to_csv(self.exclusion_table_name, mode='a', sep='\t')
+    missing = get_missing_values(self.table, self.required_metadata)
+    excluded = missing.any(axis=1).to_numpy()
+    # only the required columns with a missing value are shown, with the sample name as the index and the missing values left empty
+    missing_columns = set(missing.columns[missing.any()])
+    shown_columns = [column for column in self.table.columns if column in missing_columns and column != self.table_name.lower()]
+    excluded_samples = self.table.loc[excluded, shown_columns].mask(missing.loc[excluded, shown_columns])
+    excluded_samples.index = self.table.loc[excluded, self.table_name.lower()]
+    missing_fields = {sample_name: list(missing.columns[row]) for sample_name, row in zip(excluded_samples.index, missing[excluded].to_numpy())}
+    self.run_report.details["missing_metadata_samples"] = len(excluded_samples)
+    # remove all rows that are missing required values from table
+    self.table = self.table[~excluded]
+
+    if self.keep_outputs:
+      self.outputs["missing_metadata_exclusions"] = excluded_samples
+      self.outputs["missing_fields"] = missing_fields
+    if self.write_files:
+      with open(self.exclusion_table_name, "a") as exclusions:
+        exclusions.write("\nSamples excluded for missing required metadata (will have empty values in indicated columns):\n")
+      excluded_samples.to_csv(self.exclusion_table_name, mode='a', sep='\t')
     # print out the samples that were removed if they exist
     if len(excluded_samples) > 0:
       self.logger.debug("TABLE:Removed samples with missing required metadata:")
-      self.logger.debug("TABLE:  Missing metadata: " + ', '.join(list(excluded_samples.columns)))
-      self.logger.debug("TABLE:  Excluded samples: " + ', '.join(list(excluded_samples.index)))
+      for sample_name, fields in missing_fields.items():
+        self.logger.debug("TABLE:  {} is missing {}".format(sample_name, ", ".join(fields)))
 
     
+  def add_default_quality_rules(self):
+    """This function registers the VADR, number of Ns, and collection date quality rules
+    """
+    self.quality_control.add_rule("vadr_skipped", ["vadr_num_alerts"],
+                                  lambda table: table["vadr_num_alerts"].astype(str).str.contains("VADR skipped due to poor assembly", regex=False),
+                                  lambda failing: "VADR skipped due to poor assembly", group="assembly")
+    self.quality_control.add_threshold_rule("vadr_num_alerts", "vadr_num_alerts", self.vadr_alert_limit, "VADR number alerts too high", group="assembly")
+    self.quality_control.add_threshold_rule("number_n", "number_n", self.number_n_threshold, "Number of Ns was too high", group="assembly")
+    self.quality_control.add_rule("collection_date", ["year"],
+                                  lambda table: table["year"].isna(),
+                                  lambda failing: "The collection date format was incorrect")
+
   def perform_quality_check(self):
-    """This function removes samples based on the number of VADR alerts and the number of Ns (for "sars-cov-2" only) and writes them to a file
+    """This function removes samples that fail any registered quality rule (by default the number of VADR alerts, the number of Ns, and the collection date format) and writes them to a file
     """
-    quality_exclusion = pd.DataFrame()
-    for index, row in self.table.iterrows():
-      if ("VADR skipped due to poor assembly") in str(row["vadr_num_alerts"]):
-        notification = "VADR skipped due to poor assembly"
-        quality_exclusion = pd.concat([quality_exclusion, pd.Series({"sample_name": row[self.table_name.lower()], "message": notification}).to_frame().T], ignore_index=True)
-      elif int(row["vadr_num_alerts"]) > self.vadr_alert_limit:
-        notification = "VADR number alerts too high: " + str(row["vadr_num_alerts"]) + " greater than limit of " + str(self.vadr_alert_limit)
-        quality_exclusion = pd.concat([quality_exclusion, pd.Series({"sample_name": row[self.table_name.lower()], "message": notification}).to_frame().T], ignore_index=True)
-      elif int(row["number_n"]) > self.number_n_threshold:
-        notification="Number of Ns was too high: " + str(row["number_n"]) + " greater than limit of " + str(self.number_n_threshold)
-        quality_exclusion = pd.concat([quality_exclusion, pd.Series({"sample_name": row[self.table_name.lower()], "message": notification}).to_frame().T], ignore_index=True)
-      if pd.isna(row["year"]):
-        notification="The collection date format was incorrect"
-        quality_exclusion = pd.concat([quality_exclusion, pd.Series({"sample_name": row[self.table_name.lower()], "message": notification}).to_frame().T], ignore_index=True)
-
-    with open(self.exclusion_table_name, "w") as exclusions:
-      exclusions.write("Samples excluded for quality thresholds:\n")
-    quality_exclusion.to_csv(self.exclusion_table_name, mode='a', sep='\t', index=False)
-      
-    self.table.drop(self.table.index[self.table["vadr_num_alerts"].astype(str).str.contains("VADR skipped due to poor assembly")], inplace=True)
-    self.table.drop(self.table.index[self.table["vadr_num_alerts"].astype(int) > self.vadr_alert_limit], inplace=True)
-    self.table.drop(self.table.index[self.table["number_n"].astype(int) > self.number_n_threshold], inplace=True)
-    self.table.drop(self.table.index[self.table["year"].isna()], inplace=True)
+    quality_exclusion, failed = self.quality_control.evaluate(self.table)
+
+    if self.keep_outputs:
+      self.outputs["quality_exclusions"] = quality_exclusion
+    if self.write_files:
+      with open(self.exclusion_table_name, "w") as exclusions:
+        exclusions.write("Samples excluded for quality thresholds:\n")
+      quality_exclusion.to_csv(self.exclusion_table_name, mode='a', sep='\t', index=False)
+
+    self.table = self.table[~failed]
 
   def split_metadata(self):
     self.logger.debug("TABLE:Splitting metadata list into separate lists")
@@ -283,287 +517,380 @@ class Table:
   
     self.logger.debug("TABLE:Metadata split!")
 
-  def make_biosample_csv(self):
-    self.logger.debug("TABLE:Creating BioSample metadata file")
-    biosample_metadata = self.table[self.biosample_required].copy()
-    for column in self.biosample_optional:
-      if column in self.table.columns:
-        biosample_metadata[column] = self.table[column]
-      else:
-        biosample_metadata[column] = ""
-    
-    # if either "isolate" or "strain" columns do not exist in input terra table, then set a boolean variable "user_supplied_isolate_or_strain" to False; otherwise set to True
-    if "isolate" not in self.table.columns and "strain" not in self.table.columns:
-      user_supplied_isolate_or_strain = False
-    else:
-      user_supplied_isolate_or_strain = True
+  def check_storage_dependency(self):
+    """This function checks that the GCP bucket storage backend can be used, but only if a remote transfer is planned;
+    the google-cloud-storage library is used if it is installed (unless the gcloud backend was chosen), and otherwise
+    the `gcloud storage cp` command is needed
+    """
+    writes_fasta = self.organism.lower() != "flu"
+    planned_uris = list(self.table[self.assembly_fasta_column_name]) if writes_fasta else []
+    if not self.skip_ncbi:
+      planned_uris.append(self.gcp_bucket_uri)
+      read_columns = [self.read1_column_name] if self.single_end else [self.read1_column_name, self.read2_column_name]
+      for column in read_columns:
+        if column in self.table.columns:
+          planned_uris.extend(self.table[column])
 
-    biosample_metadata.rename(columns={"submission_id" : "sample_name"}, inplace=True)
-    
-    if self.organism.lower() in {"mpox", "sars-cov-2"}:
-      biosample_metadata["geo_loc_name"] = biosample_metadata["country"] + ": " + biosample_metadata["state"]
-      biosample_metadata.drop(["country", "state"], axis=1, inplace=True)
+    if not any(is_remote(uri) for uri in planned_uris):
+      self.logger.debug("TABLE:No remote transfers are planned; not checking for a GCP storage backend")
+      return
+    if self.storage_backend != "gcloud":
+      from GcsClientStorage import is_gcs_client_available
+      if is_gcs_client_available():
+        self.logger.debug("TABLE:Using the google-cloud-storage library to access GCP buckets")
+        return
+      if self.storage_backend == "gcs":
+        self.logger.error("TABLE:Error: the google-cloud-storage library is not installed; install it or use --storage_backend gcloud")
+        raise TableError("the google-cloud-storage library is not installed")
+    self.logger.debug("TABLE:Checking for `gcloud storage cp` command")
+    if not is_gcloud_available():
+      self.logger.error("TABLE:Error: gcloud storage cp command not found")
+      raise TableError("gcloud storage cp command not found")
+    self.logger.debug("TABLE:Found `gcloud storage cp` command, continuing")
 
-      biosample_metadata.rename(columns={"collecting_lab" : "collected_by", "host_sci_name" : "host", "patient_gender" : "host_sex", "patient_age" : "host_age"}, inplace=True)      
-      if self.organism.lower() == "sars-cov-2":
-        biosample_metadata.rename(columns={"treatment" : "antiviral_treatment_agent"}, inplace=True)
-    # Flu only: when user does not supply isolate or strain metadata columns, create "isolate" column using the syntax below
-    elif self.organism.lower() == "flu" and user_supplied_isolate_or_strain == False :
-      # type/state/submission_id/year (subtype)
-      # strip off "Type_" from beginning of Type, e.g. "Type_A" -> "A"
+  def get_assembly_cache(self):
+    """This function opens the assembly cache the first time a remote assembly is needed, so runs that only use local
+    assemblies never create the cache directory
+
+    Returns:
+      AssemblyCache: The assembly cache of this run
+    """
+    with self.assembly_cache_lock:
+      if self.assembly_cache is None:
+        self.assembly_cache = AssemblyCache(self.logger, self.cache_directory, self.cache_size * 1024 * 1024, self.transfer_concurrency, self.transfer_retries, self.run_manifest,
+                                            self.transfer_batch_size, self.storage_backend, self.transfer_limiter)
+      return self.assembly_cache
+
+  def get_assembly_path(self, uri):
+    """This function returns the local path of an assembly; local assemblies are used where they are
+
+    Args:
+      uri (String): The assembly URI or local path
+
+    Returns:
+      String: The local path of the assembly, once it is available
+    """
+    if not is_remote(uri):
+      return uri
+    return self.get_assembly_cache().get(uri)
+
+  def plan_assembly_downloads(self):
+    """This function looks up which assemblies in the table are not in the assembly cache yet
+
+    Returns:
+      Function: Downloads them (see AssemblyCache.plan), or None if there is nothing to download
+    """
+    uris = self.table[self.assembly_fasta_column_name]
+    if not any(is_remote(uri) for uri in uris):
+      self.logger.debug("TABLE:All assemblies are local; not opening the assembly cache")
+      return None
+    return self.get_assembly_cache().plan(uris)
+
+  def fetch_assemblies(self):
+    """This function makes every assembly in the table available in the assembly cache; assemblies shared by
+    several outputs (and assemblies cached by an earlier run) are downloaded only once
+    """
+    self.download_assemblies(self.plan_assembly_downloads())
+
+  def download_assemblies(self, download_assemblies):
+    """This function runs the assembly downloads planned by plan_assembly_downloads
+    """
+    if download_assemblies is None:
+      return
+    self.logger.debug("TABLE:Fetching assemblies into the assembly cache")
+    try:
+      statistics = download_assemblies()
+      if statistics is not None:
+        self.run_report.add_transfer("assembly_download", statistics)
+    except TransferError as error:
+      raise WriterError("non-zero exit code when copying files to working directory; {}".format(error))
+
+  def get_fasta_fingerprint(self, assembly_tuples):
+    """This function identifies the inputs of a combined fasta file, so a resumed run can tell if it needs to be written again
+
+    Args:
+      assembly_tuples (List): (assembly URI, per-sample file name, new header) tuples
+
+    Returns:
+      String: A checksum of the local assemblies (with their sizes and modification times), the new headers and the per-sample file names
+    """
+    fingerprint = hashlib.sha256()
+    for oldname, newname, header in assembly_tuples:
+      # cached assemblies are named after their URI and version, so a changed assembly also changes its path
+      path = self.get_assembly_path(oldname)
+      status = os.stat(path)
+      fingerprint.update(f"{path}\t{status.st_size}\t{status.st_mtime_ns}\t{header}\t{newname if self.write_sample_fastas else ''}\n".encode())
+    return fingerprint.hexdigest()
+
+  def write_combined_fasta(self, assembly_tuples, combined_path, stream=None):
+    """This function streams every assembly into the combined fasta file in table order, replacing the first header
+
+    Args:
+      assembly_tuples (List): (assembly URI, per-sample file name, new header) tuples
+      combined_path (String): The path of the combined fasta file, or None if it is only written to the stream
+      stream (BytesIO): An in-memory stream the combined fasta is also written to (optional)
+    """
+    self.fetch_assemblies()
+    try:
+      # only a resumed run needs the fingerprint before writing; otherwise it is computed afterwards, so the fasta file
+      # can be written while the remaining assemblies download (async mode)
+      fingerprint = self.get_fasta_fingerprint(assembly_tuples) if combined_path is not None and stream is None and self.run_manifest is not None and self.run_manifest.resume else None
+      sample_fastas_exist = not self.write_sample_fastas or all(os.path.exists(newname) for oldname, newname, header in assembly_tuples)
+      if fingerprint is not None and sample_fastas_exist and self.run_manifest.is_output_verified(combined_path, fingerprint):
+        self.logger.info("TABLE:The combined fasta file {} was already written from the same assemblies; skipping".format(combined_path))
+        if self.compute_checksums:
+          record = self.run_manifest.records[("output", combined_path)]
+          self.file_checksums.append((combined_path, record["size"], record["checksum"]))
+          if self.write_sample_fastas:
+            self.file_checksums.extend((newname, os.path.getsize(newname), get_file_md5(newname)) for oldname, newname, header in assembly_tuples)
+        return
+      writer = FastaWriter(self.logger, combined_path, stream)
+      for oldname, newname, header in assembly_tuples:
+        self.logger.debug("TABLE:Writing " + oldname + " with header " + header)
+        writer.write(self.get_assembly_path(oldname), header, newname if self.write_sample_fastas else None)
+      writer.close()
+      if self.compute_checksums:
+        if combined_path is not None:
+          self.file_checksums.append((combined_path, writer.bytes_written, writer.md5.hexdigest()))
+        self.file_checksums.extend(writer.sample_files)
+      if combined_path is not None and self.run_manifest is not None:
+        fingerprint = fingerprint or self.get_fasta_fingerprint(assembly_tuples)
+        self.run_manifest.record("output", fingerprint, combined_path, writer.bytes_written, writer.md5.hexdigest())
+    # a TransferError is only raised in async mode, where the assemblies are still downloading while the fasta file is written
+    except (OSError, TransferError) as error:
+      raise WriterError("could not write the combined fasta file {}; {}".format(combined_path or "in memory", error))
+
+  def get_shards(self, row_count):
+    """This function splits the rows of an output table into shards of at most shard_size rows
+
+    Args:
+      row_count (Int): The number of rows of the output table
+
+    Returns:
+      List: (shard number, first row, row after the last) tuples; the shard number is None if the outputs are not sharded
+    """
+    if self.shard_size <= 0:
+      return [(None, 0, row_count)]
+    return [(number, start, min(start + self.shard_size, row_count)) for number, start in enumerate(range(0, row_count, self.shard_size), start=1)]
+
+  def get_shard_path(self, path, shard):
+    """This function returns the path of one shard of an output file (e.g., mercury_gisaid_metadata_shard001.csv)
+    """
+    if shard is None:
+      return path
+    root, extension = os.path.splitext(path)
+    return "{}_shard{:03d}{}".format(root, shard, extension)
+
+  def write_output_files(self, name, metadata, metadata_path, separator="\t", assembly_tuples=None, fasta_path=None):
+    """This function writes an output table and, for the databases that take assemblies, its combined fasta file. When
+    the outputs are sharded, every shard of the table gets its own fasta file with the assemblies of the same rows in the
+    same order; the shards are written at the same time, at most transfer_concurrency at once as they read the assemblies.
+    Outputs kept in memory are not sharded
+
+    Args:
+      name (String): The name the outputs are kept under (the table as name and the fasta stream as name + "_fasta")
+      metadata (DataFrame): The output table
+      metadata_path (String): The path of the output table
+      separator (String): The column separator of the output table
+      assembly_tuples (List): (assembly URI, per-sample file name, new header) tuples, one per row of the output table (optional)
+      fasta_path (String): The path of the combined fasta file (optional)
+    """
+    if assembly_tuples is not None:
+      # a duplicated row has a single record in the fasta file, so it is written once in the table too and every shard
+      # keeps one row per record
+      duplicated = pd.Series(assembly_tuples, dtype=object).duplicated().to_numpy()
+      if duplicated.any():
+        self.logger.debug("TABLE:{} duplicated rows are written once in {}".format(duplicated.sum(), metadata_path))
+        metadata = metadata[~duplicated]
+        assembly_tuples = [assembly_tuple for assembly_tuple, is_duplicated in zip(assembly_tuples, duplicated) if not is_duplicated]
+    stream = io.BytesIO() if self.keep_outputs and fasta_path is not None else None
+    if self.keep_outputs:
+      self.outputs[name] = metadata
+      if stream is not None:
+        self.outputs[name + "_fasta"] = stream
+
+    def write_shard(shard, start, stop, stream=None):
+      if self.write_files:
+        shard_path = self.get_shard_path(metadata_path, shard)
+        metadata.iloc[start:stop].to_csv(shard_path, sep=separator, index=False)
+        self.record_output(shard_path)
+      if fasta_path is not None:
+        self.write_combined_fasta(assembly_tuples[start:stop], self.get_shard_path(fasta_path, shard) if self.write_files else None, stream)
+
+    shards = self.get_shards(len(metadata)) if self.write_files else [(None, 0, len(metadata))]
+    if len(shards) == 1:
+      # the fasta file and stream are written together
+      write_shard(*shards[0], stream)
+    else:
+      self.logger.debug("TABLE:Writing {} in {} shards of at most {} samples".format(metadata_path, len(shards), self.shard_size))
+      with ThreadPoolExecutor(max_workers=min(len(shards), max(1, self.transfer_concurrency))) as executor:
+        futures = [executor.submit(write_shard, *shard) for shard in shards]
+      # the first error is raised once every shard finished
+      for future in futures:
+        future.result()
+      if stream is not None:
+        self.write_combined_fasta(assembly_tuples, None, stream)
+    if stream is not None:
+      stream.seek(0)
+
+  def make_biosample_csv(self):
+    self.logger.debug("TABLE:Creating BioSample metadata file")
+    # Flu only: when user does not supply isolate or strain metadata columns, create "isolate" column (see make_flu_isolate)
+    derive_isolate = self.organism.lower() == "flu" and "isolate" not in self.table.columns and "strain" not in self.table.columns
+    if derive_isolate:
       self.logger.debug("DEBUG:User did not supply isolate or strain metadata columns, creating isolate column for Flu samples now...")
-      print(biosample_metadata["abricate_flu_type"])
-      print(biosample_metadata["state"])
-      print(biosample_metadata["sample_name"])
-      print(biosample_metadata["abricate_flu_subtype"])
-      biosample_metadata["isolate"] = (biosample_metadata["abricate_flu_type"].str.replace("Type_","") + "/" + biosample_metadata["state"] + "/" + biosample_metadata["sample_name"] + "/" + biosample_metadata["year"] + " (" + biosample_metadata["abricate_flu_subtype"] + ")")
-      print(biosample_metadata["isolate"])
-      # Remove 4 extra columns from the output table prior to creating TSV file (these are simply used to create the isolate column)
-      biosample_metadata.drop(["abricate_flu_type", "abricate_flu_subtype", "year", "state"], axis=1, inplace=True)
-
-    biosample_metadata.to_csv(self.output_prefix + "_biosample_metadata.tsv", sep='\t', index=False)
+    schema = get_output_schema("biosample", self.organism, tuple(self.biosample_required), tuple(self.biosample_optional), derive_isolate=derive_isolate)
+    biosample_metadata = schema.build(self.table)
+
+    self.write_output_files("biosample", biosample_metadata, self.output_prefix + "_biosample_metadata.tsv")
     self.logger.debug("TABLE:BioSample metadata file created")
 
   def make_sra_csv(self):
     self.logger.debug("TABLE:Creating SRA metadata file")
-    sra_metadata = self.table[self.sra_required].copy()
-    for column in self.sra_optional:
-      if column in self.table.columns:
-        sra_metadata[column] = self.table[column]
-      else:
-        sra_metadata[column] = ""
-        
-    sra_metadata.rename(columns={"submission_id" : "sample_name", "library_id" : "library_ID"}, inplace=True)
-  
-    if self.organism.lower() != "flu":
-      # these columns are named differently in the mercury metadata preparation spreadsheets 
-      sra_metadata.rename(columns={"amplicon_primer_scheme" : "amplicon_PCR_primer_scheme", "submitter_email" : "sequence_submitter_contact_email", "assembly_method" : "raw_sequence_data_processing_method", "seq_platform" : "platform"}, inplace=True)
-      sra_metadata["title"] = "Genomic sequencing of " + sra_metadata["organism"] + ": " + sra_metadata["isolation_source"]
-      sra_metadata.drop(["organism", "isolation_source"], axis=1, inplace=True)
+    sra_metadata = get_output_schema("sra", self.organism, tuple(self.sra_required), tuple(self.sra_optional)).build(self.table)
 
-    sra_metadata["filename"] = sra_metadata["sample_name"] + "_R1.fastq.gz"
+    sra_metadata["filename"] = as_text(sra_metadata["sample_name"]) + "_R1.fastq.gz"
     read_tuples = list(zip(self.table[self.read1_column_name], sra_metadata["filename"]))
     if (self.read2_column_name in self.table.columns) and (self.single_end == False):
-      sra_metadata["filename2"] = sra_metadata["sample_name"] + "_R2.fastq.gz"
+      sra_metadata["filename2"] = as_text(sra_metadata["sample_name"]) + "_R2.fastq.gz"
       read_tuples = read_tuples + list(zip(self.table[self.read2_column_name], sra_metadata["filename2"]))
     elif (self.read2_column_name not in self.table.columns and self.single_end == False):
-      self.logger.error("TABLE:Error: Paired-end data was indicated but no read2 column was found in the table")
-      sys.exit(1)    
+      raise WriterError("Paired-end data was indicated but no read2 column was found in the table")
 
-    sra_metadata.to_csv(self.output_prefix + "_sra_metadata.tsv", sep='\t', index=False)
+    if not self.compute_checksums:
+      self.write_output_files("sra", sra_metadata, self.output_prefix + "_sra_metadata.tsv")
     
     self.logger.info("TABLE:Copying over SRA files to the indicated GCP bucket ({})".format(self.gcp_bucket_uri))
-    for oldname, newname in read_tuples:
-      check_if_transferred_command = "gcloud storage ls " + self.gcp_bucket_uri + "/" + newname
-      self.logger.debug("TABLE:Running command: " + check_if_transferred_command)
-      try:
-        subprocess.run(check_if_transferred_command, shell=True, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        self.logger.warning("TABLE:Warning: A file with an identical name was found in the destination Google bucket; data transfer will be skipped.")
-      except:
-        self.logger.debug("TABLE:The data did not appear in the bucket; now attempting to transfer the data")
-        
-        transfer_command = "gcloud storage cp " + oldname + " " + self.gcp_bucket_uri + "/" + newname
-        self.logger.debug("TABLE:Running command: " + transfer_command)
-        try:
-          subprocess.run(transfer_command, shell=True, check=True)
-        except:
-          self.logger.error("TABLE:Error: non-zero exit code when copying files to GCP bucket ({})".format(self.gcp_bucket_uri))
-          sys.exit(1)
+    # duplicated rows would otherwise copy to the same destination at the same time
+    transfers = list(dict.fromkeys((oldname, self.gcp_bucket_uri.rstrip("/") + "/" + newname) for oldname, newname in read_tuples))
+    destinations = [destination for source, destination in transfers]
+    storage = get_storage(self.gcp_bucket_uri, *[oldname for oldname, newname in read_tuples], backend=self.storage_backend)
+
+    # list the destination once instead of checking every file; files already there are only
+    # skipped if their size matches the source, so partially or wrongly uploaded files are re-sent
+    self.logger.debug("TABLE:Listing the files already in the GCP bucket")
+    existing_files = storage.list(self.gcp_bucket_uri)
+    collisions = [(source, destination) for source, destination in transfers if destination in existing_files]
+    skipped = set()
+    if self.run_manifest is not None and self.run_manifest.resume:
+      # files uploaded by an earlier attempt of this run that are still in the bucket unchanged do not need their source checked again
+      skipped = {destination for source, destination in collisions if self.run_manifest.is_transfer_verified(source, destination, existing_files[destination])}
+      if skipped:
+        self.logger.info("TABLE:{} read files were already uploaded by an earlier attempt; skipping them".format(len(skipped)))
+      collisions = [(source, destination) for source, destination in collisions if destination not in skipped]
+      transfers = [(source, destination) for source, destination in transfers if destination not in skipped]
+    # the source sizes are also used to report the number of bytes transferred
+    source_sizes = storage.sizes([source for source, destination in transfers])
+    for source, destination in collisions:
+      if source_sizes.get(source) == existing_files[destination]:
+        skipped.add(destination)
+        if self.run_manifest is not None:
+          self.run_manifest.record("transfer", source, destination, existing_files[destination])
+        self.logger.warning("TABLE:Warning: A file with an identical name and size was found in the destination Google bucket; data transfer will be skipped ({})".format(destination))
+      else:
+        self.logger.warning("TABLE:Warning: A file with an identical name but a different size was found in the destination Google bucket; it will be replaced ({})".format(destination))
+    transfers = [(source, destination) for source, destination in transfers if destination not in skipped]
+
+    # the size and checksum of every read file in the bucket, by destination
+    read_checksums = {}
+
+    def record_upload(source, destination, transferred_bytes, checksum):
+      transferred_bytes = transferred_bytes if transferred_bytes is not None else source_sizes.get(source)
+      if checksum is not None:
+        # local copies and batched uploads report the checksum of the data they copied
+        read_checksums[destination] = (transferred_bytes, checksum)
+      if self.run_manifest is not None:
+        self.run_manifest.record("transfer", source, destination, transferred_bytes, checksum)
+      return transferred_bytes
+
+    def upload_read(source, destination):
+      self.logger.debug("TABLE:Transferring " + source + " to " + destination)
+      return record_upload(source, destination, *storage.copy(source, destination))
+
+    def upload_batch(batch):
+      self.logger.debug("TABLE:Transferring a batch of {} files to {}".format(len(batch), self.gcp_bucket_uri))
+      results, failures = storage.copy_batch(batch)
+      return {(source, destination): record_upload(source, destination, *result) for (source, destination), result in results.items()}, failures
+
+    # uploads that gcloud can make in a single call are batched to save starting one gcloud process per file
+    batched_transfers = [transfer for transfer in transfers if self.transfer_batch_size > 0 and storage.can_copy_batch(*transfer)]
+    single_transfers = [transfer for transfer in transfers if not (self.transfer_batch_size > 0 and storage.can_copy_batch(*transfer))]
+    scheduler = TransferScheduler(self.logger, self.transfer_concurrency, self.transfer_retries, limiter=self.transfer_limiter)
+    try:
+      statistics = []
+      if single_transfers:
+        statistics.append(scheduler.run(single_transfers, upload_read))
+      if batched_transfers:
+        statistics.append(scheduler.run_batches(batched_transfers, upload_batch, lambda batch: storage.make_batches(batch, self.transfer_batch_size)))
+      self.run_report.add_transfer("sra_upload", {**merge_statistics(statistics), "skipped": len(skipped)})
+    except TransferError as error:
+      raise WriterError("non-zero exit code when copying files to GCP bucket ({}); {}".format(self.gcp_bucket_uri, error))
     
     self.logger.info("TABLE:Files copied to the indicated GCP bucket ({})".format(self.gcp_bucket_uri))
+
+    if self.compute_checksums:
+      # GCP computes the checksum of every object it stores, so uploaded and skipped files are not read again
+      self.logger.debug("TABLE:Looking up the checksums of the read files in the GCP bucket")
+      read_checksums.update(storage.checksums([destination for destination in destinations if destination not in read_checksums]))
+      for destination in destinations:
+        size, checksum = read_checksums.get(destination, (None, None))
+        if checksum is None:
+          self.logger.warning("TABLE:Warning: no MD5 checksum is available for {}".format(destination))
+        self.file_checksums.append((destination, size, checksum))
+      for filename_column in ["filename", "filename2"]:
+        if filename_column in sra_metadata.columns:
+          bucket_paths = self.gcp_bucket_uri.rstrip("/") + "/" + sra_metadata[filename_column]
+          sra_metadata[filename_column + "_md5"] = bucket_paths.map(lambda destination: read_checksums.get(destination, (None, None))[1])
+      self.write_output_files("sra", sra_metadata, self.output_prefix + "_sra_metadata.tsv")
+
     self.logger.debug("TABLE:SRA metadata file created and data transferred")
     
   def make_genbank_csv(self):
     self.logger.debug("TABLE:Creating GenBank metadata file")
-    genbank_metadata = self.table[self.genbank_required].copy()
-    
-    update_country = False
-    for column in self.genbank_optional:
-      if column in self.table.columns:
-        genbank_metadata[column] = self.table[column]
-        if column == "state":
-          update_country = True
-      else:
-        genbank_metadata[column] = ""
-    
-    genbank_metadata.rename(columns={"submission_id" : "Sequence_ID", "host_sci_name" : "host", "collection_date" : "collection-date", "isolation_source" : "isolation-source", "biosample_accession" : "BioSample", "bioproject_accession" : "BioProject", "country" : "geo_loc_name"}, inplace=True)
-  
-    if update_country:
-      genbank_metadata["geo_loc_name"] = genbank_metadata["geo_loc_name"] + ": " + genbank_metadata["state"]
-      
-    # remove state column from genbank
-    genbank_metadata.drop("state", axis=1, inplace=True)
-    
-    genbank_metadata.to_csv(self.output_prefix + "_genbank_metadata.tsv", sep='\t', index=False)
-    self.logger.debug("TABLE:GenBank metadata file created")
-    
+    # the state is added to the country in geo_loc_name if the input table has it
+    schema = get_output_schema("genbank", self.organism, tuple(self.genbank_required), tuple(self.genbank_optional), state_supplied="state" in self.table.columns)
+    genbank_metadata = schema.build(self.table)
     
     self.logger.debug("TABLE:Now renaming the header of every fasta file to the preferred format")
-    genbank_metadata["new_filenames"] = genbank_metadata["Sequence_ID"] + "_genbank_untrimmed.fasta"
-    assembly_tuples = list(zip(self.table[self.assembly_fasta_column_name], genbank_metadata["new_filenames"], genbank_metadata["Sequence_ID"]))
+    new_filenames = as_text(genbank_metadata["Sequence_ID"]) + "_genbank_untrimmed.fasta"
+    assembly_tuples = list(zip(self.table[self.assembly_fasta_column_name], new_filenames, genbank_metadata["Sequence_ID"]))
     
-    for oldname, newname, sequence_id in assembly_tuples:
-      assembly_rename_command = "gcloud storage cp " + oldname + " ./" + newname
-      self.logger.debug("TABLE:Running command: " + assembly_rename_command)
-      try:
-        subprocess.run(assembly_rename_command, shell=True, check=True)
-      except:
-        self.logger.error("TABLE:Error: non-zero exit code when copying files to working directory")
-        sys.exit(1)
-      
-      sed_command = "sed -i '1s|.*|>" + sequence_id + "|' " + newname
-      self.logger.debug("TABLE:Running command: " + sed_command)
-      try:
-        subprocess.run(sed_command, shell=True, check=True)
-      except:
-        self.logger.error("TABLE:Error: non-zero exit code when rewriting assembly header")
-        sys.exit(1)
-        
-    self.logger.debug("TABLE:Concatenating GenBank  fasta files")
-    cat_command = "cat *_genbank_untrimmed.fasta > " + self.output_prefix + "_genbank_untrimmed_combined.fasta"
-    try:
-      subprocess.run(cat_command, shell=True, check=True)
-    except:
-      self.logger.error("TABLE:Error: non-zero exit code when concatenating fasta files")
-      sys.exit(1)
+    self.logger.debug("TABLE:Writing GenBank metadata and fasta files")
+    self.write_output_files("genbank", genbank_metadata, self.output_prefix + "_genbank_metadata.tsv", assembly_tuples=assembly_tuples,
+                            fasta_path=self.output_prefix + "_genbank_untrimmed_combined.fasta")
     
     self.logger.debug("TABLE:GenBank metadata preparation complete")
     
   def make_bankit_src(self):
     self.logger.debug("TABLE:Creating BankIt metadata file")
-    bankit_metadata = self.table[self.bankit_required].copy()
-    for column in self.bankit_optional:
-      if column in self.table.columns:
-        bankit_metadata[column] = self.table[column]
-      else:
-        bankit_metadata[column] = ""
-    bankit_metadata.rename(columns={"submission_id" : "Sequence_ID", "isolate" : "Isolate", "collection_date" : "Collection_date", "country" : "Country", "host" : "Host", "isolation_source" : "Isolation_source"}, inplace=True)
-
-    self.logger.debug("TABLE:Writing BankIt metadata out to a file")
-    bankit_metadata.to_csv(self.output_prefix + ".src", sep='\t', index=False)
+    bankit_metadata = get_output_schema("bankit", self.organism, tuple(self.bankit_required), tuple(self.bankit_optional)).build(self.table)
 
     self.logger.debug("TABLE:Now renaming the header of every fasta file to the preferred format")
     
-    bankit_metadata["new_filenames"] = bankit_metadata["Sequence_ID"] + "_bankit.fasta"
-    assembly_tuples = list(zip(self.table[self.assembly_fasta_column_name], bankit_metadata["new_filenames"], bankit_metadata["Sequence_ID"]))
+    new_filenames = as_text(bankit_metadata["Sequence_ID"]) + "_bankit.fasta"
+    assembly_tuples = list(zip(self.table[self.assembly_fasta_column_name], new_filenames, bankit_metadata["Sequence_ID"]))
     
-    for oldname, newname, sequence_id in assembly_tuples:
-      assembly_rename_command = "gcloud storage cp " + oldname + " ./" + newname
-      self.logger.debug("TABLE:Running command: " + assembly_rename_command)
-      try:
-        subprocess.run(assembly_rename_command, shell=True, check=True)
-      except:
-        self.logger.error("TABLE:Error: non-zero exit code when copying files to working directory")
-        sys.exit(1)
-      
-      sed_command = "sed -i '1s|.*|>" + sequence_id + "|' " + newname
-      self.logger.debug("TABLE:Running command: " + sed_command)
-      try:
-        subprocess.run(sed_command, shell=True, check=True)
-      except:
-        self.logger.error("TABLE:Error: non-zero exit code when rewriting assembly header")
-        sys.exit(1)
-    
-    self.logger.debug("TABLE:Concatenating BankIt fasta files")
-    cat_command = "cat *_bankit.fasta > " + self.output_prefix + "_bankit_combined.fasta"
-    try:
-      subprocess.run(cat_command, shell=True, check=True)
-    except:
-      self.logger.error("TABLE:Error: non-zero exit code when concatenating fasta files")
-      sys.exit(1)
+    self.logger.debug("TABLE:Writing BankIt metadata and fasta files")
+    self.write_output_files("bankit", bankit_metadata, self.output_prefix + ".src", assembly_tuples=assembly_tuples, fasta_path=self.output_prefix + "_bankit_combined.fasta")
       
     self.logger.debug("TABLE:BankIt metadata preparation complete")    
  
   def make_gisaid_csv(self):
     self.logger.debug("TABLE:Creating GISAID metadata file")
-    gisaid_metadata = self.table[self.gisaid_required].copy()
-    
-    for column in self.gisaid_optional:
-      if column in self.table.columns:
-        self.logger.debug("TABLE:Adding column " + column + " to GISAID metadata")
-        gisaid_metadata[column] = self.table[column]
-      else:
-        gisaid_metadata[column] = ""
-    
-    if self.usa_territory:
-      gisaid_metadata["org_location"] = (gisaid_metadata["continent"] + " / " + gisaid_metadata["state"]) 
-    else:
-      gisaid_metadata["org_location"] = (gisaid_metadata["continent"] + " / " + gisaid_metadata["country"] + " / " + gisaid_metadata["state"]) 
-    
     if self.skip_county:
       self.logger.debug("TABLE:Not adding county information to `org_location`")
     else:
       self.logger.debug("TABLE:Adding county information to `org_location`")
-      gisaid_metadata["county"] = gisaid_metadata["county"].fillna("")
-      gisaid_metadata["org_location"] = gisaid_metadata.apply(lambda x: x["org_location"] + " / " + x["county"] if len(x["county"]) > 0 else x["org_location"], axis=1)
+    schema = get_output_schema("gisaid", self.organism, tuple(self.gisaid_required), tuple(self.gisaid_optional), self.assembly_mean_coverage_column_name,
+                               usa_territory=self.usa_territory, skip_county=self.skip_county)
+    gisaid_metadata = schema.build(self.table)
 
-    
-    if self.organism.lower() == "sars-cov-2":     
-      # add additional sc2-specific columns & any empty ones GISAID wants
-      gisaid_metadata["covv_type"] = "betacoronavirus"
-      gisaid_metadata["covv_passage"] = "original"
-      gisaid_metadata["covv_subm_sample_id"] = ""
-      gisaid_metadata["covv_provider_sample_id"] = ""
-      gisaid_metadata["covv_add_location"] = ""
-      
-      # make dictionary for renaming headers
-      # format: {original : new} or {metadata_formatter : gisaid_format}
-      gisaid_rename_headers = {"gisaid_virus_name" : "covv_virus_name", "org_location" : "covv_location", "additional_host_information" : "covv_add_host_info", "gisaid_submitter" : "submitter", "collection_date" : "covv_collection_date", "seq_platform" : "covv_seq_technology", "host" : "covv_host", "assembly_method" : "covv_assembly_method", self.assembly_mean_coverage_column_name : "covv_coverage", "collecting_lab" : "covv_orig_lab", "collecting_lab_address" : "covv_orig_lab_addr", "submitting_lab" : "covv_subm_lab", "submitting_lab_address" : "covv_subm_lab_addr", "authors" : "covv_authors", "purpose_of_sequencing" : "covv_sampling_strategy", "patient_gender" : "covv_gender", "patient_age" : "covv_patient_age", "patient_status" : "covv_patient_status", "specimen_source" : "covv_specimen", "outbreak" : "covv_outbreak", "last_vaccinated" : "covv_last_vaccinated", "treatment" : "covv_treatment", "consortium" : "covv_consortium"}
-      
-    elif self.organism.lower() == "mpox":
-      # add additional mpox-specific columns
-      gisaid_metadata["pox_passage"] = "original"
-      
-      # make dictionary for renaming headers
-      # format: {original : new} or {metadata_formatter : gisaid_format}
-      gisaid_rename_headers = {"gisaid_virus_name" : "pox_virus_name", "org_location" : "pox_location", "gisaid_submitter" : "submitter", "passage_details" : "pox_passage", "collection_date" : "pox_collection_date", "seq_platform" : "pox_seq_technology", "host" : "pox_host", "assembly_method" : "pox_assembly_method", self.assembly_mean_coverage_column_name : "pox_coverage", "collecting_lab" : "pox_orig_lab", "collecting_lab_address" : "pox_orig_lab_addr", "submitting_lab" : "pos_subm_lab", "submitting_lab_address" : "pox_subm_lab_addr", "authors" : "pox_authors", "purpose_of_sequencing" : "pox_sampling_strategy", "patient_gender" : "pox_gender", "patient_age" : "pox_patient_age", "patient_status" : "pox_patient_status", "specimen_source" : "pox_specimen_source", "outbreak" : "pox_outbreak", "last_vaccinated" : "pox_last_vaccinated", "treatment" : "pox_treatment"}
-
-    gisaid_metadata.drop(["continent", "country", "state", "county"], axis=1, inplace=True)
-
-    # replace any empty/NA values for age, status, and gender with "unknown"
-    # regex expression '^\s*$' searches for blank strings
-    gisaid_metadata["patient_age"] = gisaid_metadata["patient_age"].replace(r'^\s*$', "unknown", regex=True)
-    gisaid_metadata["patient_age"] = gisaid_metadata["patient_age"].fillna("unknown")
-    gisaid_metadata["patient_gender"] = gisaid_metadata["patient_gender"].replace(r'^\s*$', "unknown", regex=True)
-    gisaid_metadata["patient_gender"] = gisaid_metadata["patient_gender"].fillna("unknown")
-    gisaid_metadata["patient_status"] = gisaid_metadata["patient_status"].replace(r'^\s*$', "unknown", regex=True)
-    gisaid_metadata["patient_status"] = gisaid_metadata["patient_status"].fillna("unknown")
-        
- 
     self.logger.debug("TABLE:Now preparing the command to rewrite the header of every fasta file to the preferred format")
-    gisaid_metadata["fn"] = gisaid_metadata["submission_id"] + "_gisaid.fasta"
-    assembly_tuples = list(zip(self.table[self.assembly_fasta_column_name], gisaid_metadata["fn"], gisaid_metadata["gisaid_virus_name"]))
-    
-    gisaid_metadata.drop(["submission_id"], axis=1, inplace=True)
+    assembly_tuples = list(zip(self.table[self.assembly_fasta_column_name], gisaid_metadata["fn"], gisaid_metadata[schema.get_output_name("gisaid_virus_name")]))
 
-    self.logger.debug("TABLE:Writing GISAID metadata out to a file")
-    gisaid_metadata.rename(columns=gisaid_rename_headers, inplace=True)
-    gisaid_metadata.to_csv(self.output_prefix + "_gisaid_metadata.csv", sep=',', index=False)  
-    
-    for oldname, newname, virus_name in assembly_tuples:
-      assembly_rename_command = "gcloud storage cp " + oldname + " ./" + newname
-      self.logger.debug("TABLE:Running command: " + assembly_rename_command)
-      try:
-        subprocess.run(assembly_rename_command, shell=True, check=True)
-      except:
-        self.logger.error("TABLE:Error: non-zero exit code when copying files to working directory")
-        sys.exit(1)
-      
-      sed_command = "sed -i '1s|.*|>" + virus_name + "|' " + newname
-      self.logger.debug("TABLE:Running command: " + sed_command)
-      try:
-        subprocess.run(sed_command, shell=True, check=True)
-      except:
-        self.logger.error("TABLE:Error: non-zero exit code when rewriting assembly header")
-        sys.exit(1)
-    
-    self.logger.debug("TABLE:Concatenating GISAID fasta files")
-    cat_command = "cat *_gisaid.fasta > " + self.output_prefix + "_gisaid_combined.fasta"
-    try:
-      subprocess.run(cat_command, shell=True, check=True)
-    except:
-      self.logger.error("TABLE:Error: non-zero exit code when concatenating fasta files")
-      sys.exit(1)
+    self.logger.debug("TABLE:Writing GISAID metadata and fasta files")
+    self.write_output_files("gisaid", gisaid_metadata, self.output_prefix + "_gisaid_metadata.csv", separator=",", assembly_tuples=assembly_tuples,
+                            fasta_path=self.output_prefix + "_gisaid_combined.fasta")
     
     self.logger.debug("TABLE:GISAID metadata preparation complete")
 
@@ -576,41 +903,157 @@ class Table:
     # Convert the lower-cased columns to their original format
     terra_metadata.rename(columns=self.terra_columns, inplace=True)
     # Output the table to a TSV file
-    terra_metadata.to_csv(self.output_prefix + "_terra_table_to_upload.tsv", sep='\t', index=False)
+    self.save_table("terra", terra_metadata, self.output_prefix + "_terra_table_to_upload.tsv", sep='\t', index=False)
+    self.record_output(self.output_prefix + "_terra_table_to_upload.tsv")
     self.logger.debug("TABLE:Terra compatible table preparation complete")
 
 
+  def write_checksums(self):
+    """This function writes the size and MD5 checksum of every uploaded read file and written fasta file to a sidecar file
+    """
+    if not self.compute_checksums:
+      return
+    self.logger.debug("TABLE:Writing the checksums of the uploaded and written files")
+    # sorted, so the file is the same however the writers were scheduled
+    checksums = pd.DataFrame(sorted(dict.fromkeys(self.file_checksums)), columns=["file", "size", "md5"])
+    checksums["size"] = checksums["size"].astype("Int64")
+    self.save_table("checksums", checksums, self.output_prefix + "_checksums.tsv", sep='\t', index=False)
+
+  def save_table(self, name, table, path, **to_csv_options):
+    """This function writes an output table to its file and/or keeps it in self.outputs
+
+    Args:
+      name (String): The name the table is kept under (e.g., "terra")
+      table (DataFrame): The output table
+      path (String): The path of its file, or None if it is only kept in memory
+      to_csv_options: The options used to write the file (e.g., sep)
+    """
+    if self.keep_outputs:
+      self.outputs[name] = table
+    if self.write_files and path is not None:
+      table.to_csv(path, **to_csv_options)
+
+  def record_output(self, path):
+    """This function records a written output file in the run manifest
+    """
+    if self.run_manifest is not None:
+      self.run_manifest.record_output(path)
+
+  def run_writer(self, name, writer):
+    """This function runs one output writer as a stage
+
+    Returns:
+      String: The error of the writer, or None if it succeeded
+    """
+    try:
+      self.run_stage(name, writer)
+    except WriterError as error:
+      return "{}: {}".format(name, error)
+    return None
+
+  def run_writers(self, writers):
+    """This function runs the output writers at the same time; they only read the table, which is not changed after quality
+    control, and each writes its own files. The errors of every writer are collected and reported once all of them finished
+
+    Args:
+      writers (List): (stage name, writer function) tuples
+    """
+    if self.async_io:
+      errors = asyncio.run(self.run_writers_concurrently(writers))
+    else:
+      with ThreadPoolExecutor(max_workers=max(1, len(writers))) as executor:
+        errors = list(executor.map(self.run_writer, *zip(*writers))) if writers else []
+    errors = [error for error in errors if error is not None]
+    if errors:
+      for error in errors:
+        self.logger.error("TABLE:Error: " + error)
+      self.logger.error("TABLE:ENDING PROCESS! {} of {} output writers failed".format(len(errors), len(writers)))
+      raise TableError("{} of {} output writers failed; {}".format(len(errors), len(writers), "; ".join(errors)))
+
+  async def run_writers_concurrently(self, writers):
+    """This function runs the writers at the same time (async mode): the assemblies still missing from the cache are
+    planned up front and downloaded in the background, each fasta writer streams the assemblies in table order as soon as
+    they are available, and the read uploads run alongside; the transfer limiter bounds the transfers of all of them.
+    Every writer writes its own files in the same order as in sequential mode, so the outputs are identical
+
+    Args:
+      writers (List): (stage name, writer function) tuples
+
+    Returns:
+      List: The error of every writer (see run_writer)
+    """
+    tasks = []
+    if self.organism.lower() != "flu":
+      download_assemblies = await asyncio.to_thread(self.plan_assembly_downloads)
+      tasks.append(asyncio.to_thread(self.run_writer, "fetch_assemblies", lambda: self.download_assemblies(download_assemblies)))
+    tasks.extend(asyncio.to_thread(self.run_writer, name, writer) for name, writer in writers)
+    return await asyncio.gather(*tasks)
+
+  def run_stage(self, name, stage_function):
+    """This function runs one stage of process_table and records its time, memory and row counts in the run report
+    """
+    with self.run_report.stage(name, lambda: 0 if self.table is None else len(self.table)):
+      stage_function()
+
   def process_table(self):
-    self.split_metadata()
-    self.extract_samples()
-    self.populate_from_options()
-    self.make_terra_csv()
-    self.create_standard_variables()
-    self.perform_quality_check()
-    self.remove_nas()
+    # the manifest is only written when asked for, and only a run that writes files can be resumed
+    if self.write_files and self.resume:
+      self.run_manifest = RunManifest(self.logger, self.output_prefix + "_run_manifest.jsonl", self.resume)
+    try:
+      self.run_stages()
+    finally:
+      if self.run_manifest is not None:
+        self.run_manifest.close()
+      if self.submission_state is not None:
+        self.submission_state.close()
+      if self.assembly_cache is not None:
+        self.assembly_cache.close()
+
+  def run_stages(self):
+    self.run_stage("split_metadata", self.split_metadata)
+    self.run_stage("read_table", self.read_table)
+    self.run_stage("extract_samples", self.extract_samples)
+    self.run_stage("populate_from_options", self.populate_from_options)
+    self.run_stage("make_terra_csv", self.make_terra_csv)
+    self.run_stage("select_changed_samples", self.select_changed_samples)
+    if self.incremental and self.table.empty:
+      self.logger.info("TABLE:No new or changed samples were found since the last run; there is nothing to prepare")
+      return
+    self.run_stage("create_standard_variables", self.create_standard_variables)
+    self.run_stage("perform_quality_check", self.perform_quality_check)
+    self.run_stage("remove_nas", self.remove_nas)
     
+    # excluded samples are not recorded, so an incremental run checks them again and may find nothing else to prepare
+    if self.incremental and self.table.empty:
+      self.logger.info("TABLE:Every new or changed sample was excluded during cleaning; there is nothing to prepare")
+      return
     if self.table.empty:
       self.logger.error("TABLE:ENDING PROCESS! No samples were found in the table after extraction and cleaning. Check the input table and/or the excluded samples table for missing columns and populate in the table or metadata customization parameters.")
-      sys.exit(1)
+      raise TableError("no samples were found in the table after extraction and cleaning")
+
+    self.run_stage("check_storage_dependency", self.check_storage_dependency)
     
     self.logger.debug("TABLE:Now creating metadata files")
+    writers = []
     if not self.skip_ncbi:
       self.logger.debug("TABLE:NCBI submission NOT skipped, now preparing data for NCBI")
     
-      self.make_biosample_csv()
-      self.make_sra_csv()
+      writers.append(("make_biosample_csv", self.make_biosample_csv))
+      writers.append(("make_sra_csv", self.make_sra_csv))
       if self.organism.lower() == "sars-cov-2":
-        self.make_genbank_csv()
+        writers.append(("make_genbank_csv", self.make_genbank_csv))
       elif self.organism.lower() == "mpox":
-        self.make_bankit_src()
-    
-      self.logger.debug("TABLE:NCBI metadata prepared")
+        writers.append(("make_bankit_src", self.make_bankit_src))
     
     if self.organism.lower() != "flu":
       self.logger.debug("TABLE:Creating GISAID metadata")
-      self.make_gisaid_csv()
+      writers.append(("make_gisaid_csv", self.make_gisaid_csv))
+
+    self.run_writers(writers)
+    if not self.skip_ncbi:
+      self.logger.debug("TABLE:NCBI metadata prepared")
+
+    self.run_stage("write_checksums", self.write_checksums)
+    self.run_stage("record_prepared_samples", self.record_prepared_samples)
 
     self.logger.debug("TABLE:Metadata tables made")
-    
-    
-    
@@ -0,0 +1,74 @@
+import importlib.util
+import io
+import os
+
+# the first bytes of every supported binary format; Feather v2 files are Arrow IPC files
+MAGIC_BYTES = [(b"PAR1", "parquet"), (b"ARROW1", "arrow"), (b"FEA1", "arrow"), (b"\x1f\x8b", "gzip"), (b"\x28\xb5\x2f\xfd", "zstd")]
+EXTENSIONS = {".parquet": "parquet", ".pq": "parquet", ".feather": "arrow", ".arrow": "arrow", ".ipc": "arrow", ".gz": "gzip", ".zst": "zstd"}
+COLUMNAR_FORMATS = {"parquet", "arrow"}
+# the optional library needed to read each format
+REQUIRED_LIBRARIES = {"parquet": "pyarrow", "arrow": "pyarrow", "zstd": "zstandard"}
+
+
+def is_library_available(name):
+  """This function checks if an optional library is installed without importing it
+  """
+  return importlib.util.find_spec(name) is not None
+
+def get_table_format(path, head=None):
+  """This function detects the format of an input table from its first bytes, or from its extension if they are not conclusive
+
+  Args:
+    path (String): The path of the table, or "-" for stdin
+    head (Bytes): The first bytes of the table (read from the file if not given)
+
+  Returns:
+    String: "parquet", "arrow" (Arrow IPC or Feather), "gzip" or "zstd" (compressed TSV), or "tsv"
+  """
+  if head is None and path != "-":
+    with open(path, "rb") as table_file:
+      head = table_file.read(8)
+  for magic, table_format in MAGIC_BYTES:
+    if head and head.startswith(magic):
+      return table_format
+  return EXTENSIONS.get(os.path.splitext(path)[1].lower(), "tsv")
+
+def read_columnar_table(source, table_format, table_name, samplenames, needed_columns):
+  """This function reads a Parquet or Arrow IPC/Feather table with pyarrow; only the needed columns are read, and for
+  Parquet only the row groups that can hold the requested samples
+
+  Args:
+    source (String or BytesIO): The path of the table, or its contents
+    table_format (String): "parquet" or "arrow"
+    table_name (String): The name of the first column, holding the sample names
+    samplenames (Set): The sample names to keep
+    needed_columns (Set): The lowercase names of the columns to read; names are matched case-insensitively
+
+  Returns:
+    DataFrame: The requested rows and columns
+  """
+  import pyarrow as pa
+  import pyarrow.compute as pc
+
+  def select_columns(names):
+    return [name for name in names if name.lower() in needed_columns or name == table_name]
+
+  if table_format == "parquet":
+    import pyarrow.parquet as pq
+    schema = pq.ParquetFile(source).schema_arrow
+    # the sample names can only be filtered while reading if they are stored as strings
+    sample_type = schema.field(table_name).type
+    filters = [(table_name, "in", sorted(samplenames))] if pa.types.is_string(sample_type) or pa.types.is_large_string(sample_type) else None
+    if isinstance(source, io.BytesIO):
+      source.seek(0)
+    table = pq.read_table(source, columns=select_columns(schema.names), filters=filters)
+  else:
+    import pyarrow.feather as feather
+    # memory mapped, so the columns that are not selected are never read from disk
+    table = feather.read_table(source, memory_map=not isinstance(source, io.BytesIO))
+    table = table.select(select_columns(table.schema.names))
+
+  sample_names = table.column(table_name).cast(pa.string())
+  table = table.set_column(table.schema.get_field_index(table_name), table_name, sample_names)
+  table = table.filter(pc.is_in(sample_names, value_set=pa.array(sorted(samplenames), pa.string())))
+  return table.to_pandas()
@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from contextlib import nullcontext
+import itertools
+import time
+
+
+def merge_statistics(statistics):
+  """This function adds up the statistics of several groups of transfers
+
+  Args:
+    statistics (List): Dictionaries of the number of files and bytes transferred and the elapsed seconds
+
+  Returns:
+    Dict: The totals
+  """
+  return {"files": sum(group["files"] for group in statistics), "bytes": sum(group["bytes"] for group in statistics),
+          "seconds": sum(group["seconds"] for group in statistics)}
+
+
+class TransferError(Exception):
+  """This exception is raised when at least one transfer failed after all of its retries
+  """
+
+  def __init__(self, message, failed, completed, cancelled):
+    super().__init__(message)
+    self.failed = failed
+    self.completed = completed
+    self.cancelled = cancelled
+
+
+class TransferScheduler:
+  """This class runs file transfers on a bounded pool of workers with per-file retries
+  """
+
+  def __init__(self, logger, concurrency=8, retries=3, backoff=2.0, limiter=None):
+    self.logger = logger
+    # a semaphore shared with other schedulers to bound the transfers running at the same time across all of them (optional)
+    self.limiter = limiter if limiter is not None else nullcontext()
+    self.concurrency = max(1, concurrency)
+    self.retries = max(0, retries)
+    self.backoff = backoff
+
+  def transfer_with_retries(self, transfer_function, source, destination):
+    """This function runs a single transfer, retrying with exponential backoff
+
+    Args:
+      transfer_function (Function): Takes the source and destination, returns the number of bytes transferred (or None)
+      source (String): The source URI or path
+      destination (String): The destination URI or path
+
+    Returns:
+      Int: The number of bytes transferred, or None if unknown
+    """
+    attempt = 0
+    while True:
+      try:
+        with self.limiter:
+          return transfer_function(source, destination)
+      except Exception as error:
+        if attempt >= self.retries:
+          raise
+        delay = self.backoff * (2 ** attempt)
+        attempt += 1
+        self.logger.warning(f"TRANSFER:Warning: transfer of {source} failed ({error}); retrying in {delay:.1f}s (attempt {attempt} of {self.retries})")
+        time.sleep(delay)
+
+  def log_progress(self, done, total, transferred_bytes, start_time):
+    elapsed = max(time.monotonic() - start_time, 1e-6)
+    self.logger.info(f"TRANSFER:Completed {done} of {total} transfers ({transferred_bytes / 1e6:.1f} MB, {done / elapsed:.2f} files/s, {transferred_bytes / 1e6 / elapsed:.2f} MB/s)")
+
+  def run(self, transfers, transfer_function):
+    """This function runs all transfers; after the first permanent failure no new transfers are started,
+    the running ones are allowed to finish, and a TransferError summarizing every transfer is raised
+
+    Args:
+      transfers (List): (source, destination) tuples
+      transfer_function (Function): Takes the source and destination, returns the number of bytes transferred (or None)
+
+    Returns:
+      Dict: The number of files and bytes transferred and the elapsed time in seconds
+    """
+    total = len(transfers)
+    completed = []
+    failed = []
+    transferred_bytes = 0
+    start_time = time.monotonic()
+    self.logger.debug(f"TRANSFER:Starting {total} transfers with {self.concurrency} workers")
+
+    with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+      remaining = iter(transfers)
+      pending = {}
+
+      def submit(count):
+        # transfers are only handed to the pool as workers free up, so none can start after the first failure is seen
+        for source, destination in itertools.islice(remaining, count):
+          pending[executor.submit(self.transfer_with_retries, transfer_function, source, destination)] = (source, destination)
+
+      submit(self.concurrency)
+      while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          source, destination = pending.pop(future)
+          error = future.exception()
+          if error is not None:
+            self.logger.error(f"TRANSFER:Error: transfer of {source} to {destination} failed: {error}")
+            failed.append((source, destination, error))
+            continue
+          completed.append((source, destination))
+          transferred_bytes += future.result() or 0
+          if len(completed) == total or len(completed) % max(1, total // 20) == 0:
+            self.log_progress(len(completed), total, transferred_bytes, start_time)
+
+        if failed:
+          # stop scheduling new work but let the running transfers finish so none are left half-done
+          cancelled = list(remaining)
+          wait(pending)
+          for future, (source, destination) in pending.items():
+            if future.exception() is None:
+              completed.append((source, destination))
+              transferred_bytes += future.result() or 0
+            else:
+              failed.append((source, destination, future.exception()))
+          message = f"{len(failed)} transfer(s) failed; {len(completed)} completed and {len(cancelled)} were not started"
+          raise TransferError(message, failed, completed, cancelled)
+        submit(len(done))
+
+    elapsed = time.monotonic() - start_time
+    self.logger.info(f"TRANSFER:All {total} transfers completed in {elapsed:.1f}s")
+    return {"files": total, "bytes": transferred_bytes, "seconds": elapsed}
+
+  def run_batch(self, batch_function, batch):
+    with self.limiter:
+      return batch_function(batch)
+
+  def run_batches(self, transfers, batch_function, make_batches):
+    """This function runs transfers in batches, each handled by one call of batch_function (e.g., a single gcloud
+    invocation); the transfers that failed are retried in new batches with exponential backoff, and a TransferError
+    naming every transfer that still failed is raised
+
+    Args:
+      transfers (List): (source, destination) tuples
+      batch_function (Function): Takes a list of transfers, returns the bytes transferred of every completed transfer
+        and the error of every failed transfer (both dictionaries keyed by transfer)
+      make_batches (Function): Splits a list of transfers into batches
+
+    Returns:
+      Dict: The number of files and bytes transferred and the elapsed time in seconds
+    """
+    total = len(transfers)
+    completed = []
+    transferred_bytes = 0
+    start_time = time.monotonic()
+    remaining = transfers
+    attempt = 0
+    while True:
+      batches = make_batches(remaining)
+      self.logger.debug(f"TRANSFER:Starting {len(remaining)} transfers in {len(batches)} batches")
+      failures = {}
+      with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(batches)))) as executor:
+        futures = {executor.submit(self.run_batch, batch_function, batch): batch for batch in batches}
+        for future in as_completed(futures):
+          try:
+            batch_results, batch_failures = future.result()
+          except Exception as error:
+            batch_results, batch_failures = {}, {transfer: error for transfer in futures[future]}
+          completed.extend(batch_results)
+          transferred_bytes += sum(size or 0 for size in batch_results.values())
+          failures.update(batch_failures)
+          self.log_progress(len(completed), total, transferred_bytes, start_time)
+
+      remaining = [transfer for transfer in remaining if transfer in failures]
+      if not remaining:
+        break
+      if attempt >= self.retries:
+        failed = [(source, destination, failures[(source, destination)]) for source, destination in remaining]
+        for source, destination, error in failed:
+          self.logger.error(f"TRANSFER:Error: transfer of {source} to {destination} failed: {error}")
+        raise TransferError(f"{len(failed)} transfer(s) failed; {len(completed)} completed", failed, completed, [])
+      delay = self.backoff * (2 ** attempt)
+      attempt += 1
+      self.logger.warning(f"TRANSFER:Warning: {len(remaining)} transfers failed; retrying them in {delay:.1f}s (attempt {attempt} of {self.retries})")
+      time.sleep(delay)
+
+    elapsed = time.monotonic() - start_time
+    self.logger.info(f"TRANSFER:All {total} transfers completed in {elapsed:.1f}s")
+    return {"files": total, "bytes": transferred_bytes, "seconds": elapsed}
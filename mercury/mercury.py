@@ -2,7 +2,7 @@
 import CheckInputs
 import argparse
 from __init__ import __VERSION__
-from Runner import Runner
+from AssemblyCache import get_default_cache_directory
 
 def main():
   parser = argparse.ArgumentParser(
@@ -15,15 +15,19 @@ def main():
   parser.add_argument("-v", "--version", action="version", version=str(__VERSION__))
 
   parser.add_argument("input_table",
-                      help="The table containing the metadata for the samples to be submitted", type=CheckInputs.is_table_valid)
+                      help="The table containing the metadata for the samples to be submitted (TSV, gzip or zstd compressed TSV,\nParquet, or Arrow IPC/Feather; \"-\" reads it from stdin)", type=CheckInputs.is_table_valid)
   parser.add_argument("table_name",
                       help="The name of the first column in the table (A1); include the `_id` if data table is downloaded from Terra.bio", type=str)
   parser.add_argument("samplenames",
-                      help="The sample names to be extracted from the table", type=CheckInputs.is_comma_delimited_list)
+                      help="The sample names to be extracted from the table (not used with --batch_manifest)", nargs="?", type=CheckInputs.is_comma_delimited_list)
   parser.add_argument("-o", "--output_prefix",
                       help="The prefix for the output files\ndefault=\"mercury\"", default="mercury", metavar="\b", type=str)
   parser.add_argument("-b", "--gcp_bucket_uri",
                       help="The GCP bucket URI to store the temporarily store the read files (required)", metavar="\b", required=True, type=str)
+  parser.add_argument("--sample_list",
+                      help="A file with the sample names to be extracted from the table, one or more (comma-delimited) per line;\n\"-\" reads them from stdin; used together with samplenames if both are given", metavar="\b", type=CheckInputs.is_sample_list_valid)
+  parser.add_argument("--strict_samples",
+                      help="Add to stop before any file is transferred if a requested sample is not in the table or is in more\nthan one row", action="store_true", default=False)
 
   submission_type_arguments = parser.add_argument_group("submission type arguments", "options that determine submission type")
   submission_type_arguments.add_argument("--organism", 
@@ -42,6 +46,12 @@ def main():
                                        help="Add if using reads_dehosted instead of clearlabs data", action="store_true", default=False)
   customization_arguments.add_argument("--single_end",
                                       help="Add if the data is single-end", action="store_true", default=False)
+  customization_arguments.add_argument("--write_sample_fastas",
+                                       help="Add to also write every renamed assembly to its own fasta file", action="store_true", default=False)
+  customization_arguments.add_argument("--checksums",
+                                       help="Add to add the MD5 checksums of the read files to the SRA metadata and write the size and MD5\nchecksum of every uploaded read file and written fasta file to <output_prefix>_checksums.tsv", action="store_true", default=False)
+  customization_arguments.add_argument("--shard_size",
+                                       help="The maximum number of samples in each metadata and fasta file; the files are split into numbered\nshards (e.g., <output_prefix>_gisaid_metadata_shard001.csv); 0 writes a single file per output\ndefault=0", default=0, metavar="\b", type=int)
   
   metadata_population_arguments = parser.add_argument_group("metadata population arguments", "options that populate metadata fields")
   metadata_population_arguments.add_argument("--amplicon_primer_scheme", help="Amplicon primer scheme", nargs="*", default = "")
@@ -72,16 +82,59 @@ def main():
   qc_arguments.add_argument("-n", "--number_n_threshold",
                             help="The maximum number of Ns allowed in SARS-CoV-2 assemblies\ndefault=5000", default=5000, metavar="\b", type=int)
 
+  batch_arguments = parser.add_argument_group("batch arguments", "options that run several submissions against the same input table")
+  batch_arguments.add_argument("--batch_manifest",
+                               help="A TSV (with a header) or JSON file with one job per row/object; every job needs samplenames and\nan output_prefix and can override any other option (e.g., organism)", metavar="\b", type=CheckInputs.is_table_valid)
+  batch_arguments.add_argument("--batch_workers",
+                               help="The number of batch jobs run at the same time\ndefault=4", default=4, metavar="\b", type=int)
+
+  transfer_arguments = parser.add_argument_group("transfer arguments", "options that control how read files are copied to the GCP bucket and how assemblies are cached")
+  transfer_arguments.add_argument("--storage_backend",
+                                  help="How GCP buckets are accessed: \"gcs\" (the google-cloud-storage library), \"gcloud\" (the gcloud\ncommand line tool), or \"auto\" (the library if it is installed, otherwise gcloud)\ndefault=\"auto\"", default="auto", metavar="\b", choices=["auto", "gcs", "gcloud"])
+  transfer_arguments.add_argument("--transfer_concurrency",
+                                  help="The number of files transferred at the same time, across all databases\ndefault=8", default=8, metavar="\b", type=int)
+  transfer_arguments.add_argument("--transfer_retries",
+                                  help="The number of times a failed transfer is retried (with backoff)\ndefault=3", default=3, metavar="\b", type=int)
+  transfer_arguments.add_argument("--transfer_batch_size",
+                                  help="The maximum number of files copied by a single gcloud call; 0 copies every file with its own call\ndefault=1000", default=1000, metavar="\b", type=int)
+  transfer_arguments.add_argument("--cache_directory",
+                                  help="The directory where downloaded assemblies are cached between runs\ndefault=\"$XDG_CACHE_HOME/mercury\" or \"~/.cache/mercury\"", metavar="\b", type=str,
+                                  default=get_default_cache_directory())
+  transfer_arguments.add_argument("--cache_size",
+                                  help="The maximum size of the assembly cache in MB; the least recently used assemblies are removed first\ndefault=2048", default=2048, metavar="\b", type=int)
+  transfer_arguments.add_argument("--async_io",
+                                  help="Add to download the assemblies in the background, so the fasta files are written while the\nremaining assemblies download", action="store_true", default=False)
+  transfer_arguments.add_argument("--resume",
+                                  help="Add to record the completed transfers and fasta files in <output_prefix>_run_manifest.jsonl, and to\nskip those recorded by an interrupted run with the same output_prefix if they are unchanged", action="store_true", default=False)
+
+  incremental_arguments = parser.add_argument_group("incremental arguments", "options that skip samples prepared by earlier runs")
+  incremental_arguments.add_argument("--incremental",
+                                     help="Add to only prepare samples that are new or changed since they were last prepared", action="store_true", default=False)
+  incremental_arguments.add_argument("--state_database",
+                                     help="The SQLite database that records the samples prepared by earlier runs\ndefault=\"<cache_directory>/submission_state.sqlite\"", metavar="\b", type=str)
+
   logging_arguments = parser.add_argument_group("logging arguments", "options that change the verbosity of the stdout logging")
   logging_arguments.add_argument("--verbose",
                                  help="Add to enable verbose logging", action="store_true", default=False)
   logging_arguments.add_argument("--debug",
                                   help="Add to enable debug logging; overwrites --verbose", action="store_true", default=False)
+  logging_arguments.add_argument("--run_report",
+                                 help="Add to write the time, peak memory, row counts and transfers of every stage to <output_prefix>_run_report.json", action="store_true", default=False)
 
   options = parser.parse_args()
-  
-  parse = Runner(options)
-  parse.run()
+  if options.batch_manifest is None and options.samplenames is None and options.sample_list is None:
+    parser.error("the following arguments are required: samplenames (or --sample_list or --batch_manifest)")
+  if options.input_table == "-" and options.sample_list == "-":
+    parser.error("the input table and the sample list cannot both be read from stdin")
+
+  # imported after parsing so that --help, --version and argument errors do not wait for pandas to load
+  if options.batch_manifest is not None:
+    from Batch import Batch
+    Batch(parser, options).run()
+  else:
+    from Runner import Runner
+    parse = Runner(options)
+    parse.run()
 
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import logging
+import sys
+import os
+
+import pandas as pd
+import pytest
+
+# the mercury modules import each other by name, as when run from the mercury directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mercury"))
+
+
+@pytest.fixture
+def make_terra_table(tmp_path):
+  """This fixture returns a function that makes a small SARS-CoV-2 Terra table whose samples pass quality control
+  """
+  assembly = os.path.join(tmp_path, "assembly.fasta")
+  with open(assembly, "w") as fasta:
+    fasta.write(">consensus\nACGTACGT\n")
+
+  reads_directory = os.path.join(tmp_path, "reads")
+  os.makedirs(reads_directory)
+
+  def make_terra_table(samples):
+    # every sample has its own read files, so the SRA uploads can be told apart
+    reads = {}
+    for read in ("R1", "R2"):
+      reads[read] = [os.path.join(reads_directory, f"{sample}_{read}.fastq.gz") for sample in samples]
+      for path in reads[read]:
+        with open(path, "w") as read_file:
+          read_file.write(f"@{os.path.basename(path)}\nACGT\n+\nIIII\n")
+    return pd.DataFrame({
+      "sample_id": samples, "submission_id": samples, "collection_date": "2021-03-01", "organism": "SARS-CoV-2",
+      "country": "USA", "state": "NY", "continent": "North America", "collecting_lab": "Collecting Lab",
+      "collecting_lab_address": "1 Main St", "submitting_lab": "Submitting Lab", "submitting_lab_address": "2 Side St",
+      "authors": "A. Author", "gisaid_submitter": "submitter", "purpose_of_sequencing": "baseline surveillance",
+      "seq_platform": "Illumina", "assembly_method": "ivar", "assembly_mean_coverage": 100, "vadr_num_alerts": "0",
+      "number_n": 10, "assembly_fasta": assembly, "read1_dehosted": reads["R1"], "read2_dehosted": reads["R2"],
+      "bioproject_accession": "PRJNA000000", "host_disease": "COVID-19", "isolation_source": "clinical",
+      "library_id": [f"{sample}_library" for sample in samples], "library_strategy": "WGS", "library_source": "VIRAL RNA",
+      "library_selection": "RT-PCR", "library_layout": "paired", "instrument_model": "NextSeq 2000", "collected_by": "Collecting Lab",
+    })
+  return make_terra_table
+
+
+@pytest.fixture
+def make_mercury_table(tmp_path):
+  """This fixture returns a function that makes a Table for a Terra table (and by default every sample in it), as Submission
+  does; outputs are kept in memory
+  and, with write_files=True, also written to files starting with tmp_path/mercury
+  """
+  from Metadata import Metadata
+  from RunReport import RunReport
+  from Submission import DEFAULT_OPTIONS
+  from Table import Table
+
+  def make_mercury_table(terra_table, organism="sars-cov-2", samplenames=None, keep_outputs=True, write_files=False, **options):
+    logger = logging.getLogger(__name__)
+    options = {**DEFAULT_OPTIONS, "skip_ncbi": True, "output_prefix": os.path.join(tmp_path, "mercury"), **options}
+    metadata_list = Metadata(logger, organism, options["skip_ncbi"], "assembly_mean_coverage").get_metadata()
+    samplenames = samplenames if samplenames is not None else list(dict.fromkeys(terra_table["sample_id"]))
+    return Table(logger, organism, None, "sample_id", samplenames, metadata_list=metadata_list,
+                 gcp_bucket_uri=os.path.join(tmp_path, "bucket"), run_report=RunReport(logger), input_dataframe=terra_table,
+                 write_files=write_files, keep_outputs=keep_outputs, cache_directory=os.path.join(tmp_path, "cache"), **options)
+  return make_mercury_table
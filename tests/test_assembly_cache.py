@@ -0,0 +1,63 @@
+import logging
+import json
+import os
+
+import pytest
+
+import AssemblyCache as assembly_cache_module
+from AssemblyCache import AssemblyCache
+from Storage import LocalStorage
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+  # a local directory stands in for the bucket; its paths are treated as remote so they are cached
+  directory = tmp_path / "bucket"
+  directory.mkdir()
+  for name in ("a", "b", "c"):
+    (directory / f"{name}.fasta").write_text(f">{name}\n" + "ACGT" * 25 + "\n")
+  monkeypatch.setattr(assembly_cache_module, "is_remote", lambda uri: str(uri).startswith(str(directory)))
+  monkeypatch.setattr(assembly_cache_module, "get_storage", lambda *uris, backend="auto": LocalStorage())
+  return directory
+
+
+def make_cache(directory, max_size_bytes=1024 * 1024):
+  return AssemblyCache(logging.getLogger(__name__), str(directory), max_size_bytes, transfer_batch_size=0)
+
+
+def test_index_keeps_the_entries_of_every_run(tmp_path, bucket):
+  # both caches are opened before either writes the index, as by two batch jobs starting together
+  first, second = make_cache(tmp_path / "cache"), make_cache(tmp_path / "cache")
+  first.prefetch([str(bucket / "a.fasta")])
+  second.prefetch([str(bucket / "b.fasta")])
+  with open(tmp_path / "cache" / "index.json") as index_file:
+    assert sorted(entry["uri"] for entry in json.load(index_file).values()) == [str(bucket / "a.fasta"), str(bucket / "b.fasta")]
+  first.close()
+  second.close()
+
+
+def test_assemblies_leased_by_another_run_are_not_evicted(tmp_path, bucket):
+  # the cache only fits one assembly
+  first, second = make_cache(tmp_path / "cache", 150), make_cache(tmp_path / "cache", 150)
+  path = first.get(str(bucket / "a.fasta"))
+  second.get(str(bucket / "b.fasta"))
+  assert os.path.exists(path)
+
+  # once the first run ends, its assembly is the least recently used one and is evicted
+  first.close()
+  third = make_cache(tmp_path / "cache", 150)
+  third.get(str(bucket / "c.fasta"))
+  assert not os.path.exists(path)
+  second.close()
+  third.close()
+  assert os.listdir(tmp_path / "cache" / "leases") == []
+
+
+def test_local_assemblies_do_not_open_the_cache(tmp_path, make_terra_table):
+  from Submission import Submission
+
+  table = make_terra_table(["a", "b"])
+  result = Submission(table, "sample_id", ["a", "b"], str(tmp_path / "bucket"), skip_ncbi=True,
+                      cache_directory=str(tmp_path / "cache"), logger=logging.getLogger(__name__)).run()
+  assert result.fastas["gisaid"].getvalue().count(b">") == 2
+  assert not os.path.exists(tmp_path / "cache")
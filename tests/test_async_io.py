@@ -0,0 +1,30 @@
+import logging
+import os
+
+from Submission import Submission
+
+SAMPLES = [f"sample{number}" for number in range(5)]
+
+
+def test_async_io_writes_the_same_files_as_a_sequential_run(tmp_path, make_terra_table, monkeypatch):
+  table = make_terra_table(SAMPLES)
+  # every sample has its own assembly, so the order of the fasta records is checked
+  assemblies = []
+  for number, sample in enumerate(SAMPLES):
+    assemblies.append(str(tmp_path / f"{sample}.fasta"))
+    with open(assemblies[-1], "w") as fasta:
+      fasta.write(f">{sample}\n" + "ACGT" * (number + 1) + "\n")
+  table["assembly_fasta"] = assemblies
+
+  outputs = {}
+  for async_io in (False, True):
+    directory = tmp_path / ("async" if async_io else "sequential")
+    directory.mkdir()
+    # the per-sample fasta files are written to the working directory
+    monkeypatch.chdir(directory)
+    Submission(table, "sample_id", SAMPLES, str(tmp_path / "bucket"), write_files=True, output_prefix=str(directory / "mercury"),
+               write_sample_fastas=True, async_io=async_io, cache_directory=str(tmp_path / "cache"),
+               logger=logging.getLogger(__name__)).run()
+    outputs[async_io] = {name: (directory / name).read_bytes() for name in os.listdir(directory)}
+  assert len(outputs[False]) == 18
+  assert outputs[True] == outputs[False]
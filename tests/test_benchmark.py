@@ -0,0 +1,21 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from benchmark import compare
+
+
+def make_row(stage, seconds, peak_rss_mb, peak_rss_increase_mb):
+  return {"organism": "sars-cov-2", "size": 1000, "stage": stage, "seconds": seconds, "peak_rss_mb": peak_rss_mb, "peak_rss_increase_mb": peak_rss_increase_mb}
+
+
+def test_compare_uses_the_memory_increase_of_each_stage(capsys):
+  baseline = {"results": [make_row("read_table", 1.0, 100, 20), make_row("make_gisaid_csv", 1.0, 120, 10), make_row("total", 2.0, 120, None)]}
+  # read_table keeps 50 MB more, which raises the peak of the later stages without them using more memory themselves
+  results = [make_row("read_table", 1.0, 150, 70), make_row("make_gisaid_csv", 1.0, 170, 10), make_row("total", 2.0, 170, None)]
+  assert compare(results, baseline, 0.2) == 2
+  assert capsys.readouterr().out.splitlines() == [
+    "REGRESSION sars-cov-2 1000 read_table peak_rss_increase_mb: 20 -> 70",
+    "REGRESSION sars-cov-2 1000 total peak_rss_mb: 120 -> 170",
+  ]
@@ -0,0 +1,34 @@
+import hashlib
+import logging
+import os
+
+import pandas as pd
+
+from Submission import Submission
+
+
+def get_md5(path):
+  with open(path, "rb") as checked_file:
+    return hashlib.md5(checked_file.read()).hexdigest()
+
+
+def test_checksum_file_lists_every_uploaded_read_and_written_fasta(tmp_path, make_terra_table):
+  table = make_terra_table(["a", "b"])
+  output_prefix = str(tmp_path / "mercury")
+  result = Submission(table, "sample_id", ["a", "b"], str(tmp_path / "bucket"), write_files=True, output_prefix=output_prefix,
+                      compute_checksums=True, cache_directory=str(tmp_path / "cache"), transfer_batch_size=0,
+                      logger=logging.getLogger(__name__)).run()
+
+  checksums = pd.read_csv(output_prefix + "_checksums.tsv", sep="\t")
+  assert list(checksums.columns) == ["file", "size", "md5"]
+  reads = [str(tmp_path / "bucket" / f"{sample}_{read}.fastq.gz") for sample in ("a", "b") for read in ("R1", "R2")]
+  fastas = [output_prefix + "_gisaid_combined.fasta", output_prefix + "_genbank_untrimmed_combined.fasta"]
+  assert sorted(checksums["file"]) == sorted(reads + fastas)
+  for path, size, md5 in checksums.itertuples(index=False):
+    assert size == os.path.getsize(path)
+    assert md5 == get_md5(path)
+
+  # the read checksums are also added to the SRA metadata
+  sra = result.tables["sra"]
+  assert sra["filename_md5"].tolist() == [get_md5(path) for path in reads[0::2]]
+  assert sra["filename2_md5"].tolist() == [get_md5(path) for path in reads[1::2]]
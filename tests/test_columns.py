@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from Columns import get_missing_values, is_missing
+
+
+def test_empty_and_whitespace_values_are_missing():
+  values = ["A. Author", "", "  ", "\t\n", None, " B. Author "]
+  expected = [False, True, True, True, True, False]
+  for dtype in (object, "string", "category"):
+    assert is_missing(pd.Series(values, dtype=dtype)).tolist() == expected
+  assert is_missing(pd.Series([1.0, np.nan, 0.0])).tolist() == [False, True, False]
+
+
+def test_missing_value_bitmap_has_a_column_per_checked_column():
+  table = pd.DataFrame({"authors": ["A. Author", " "], "state": pd.Series([" ", "NY"], dtype="category"), "number_n": [1, 2]})
+  table.index = [3, 7]
+  missing = get_missing_values(table, ["state", "authors", "state"])
+  assert list(missing.columns) == ["state", "authors"]
+  assert missing.index.tolist() == [3, 7]
+  assert missing.to_numpy().tolist() == [[True, False], [False, True]]
+
+
+def test_samples_with_whitespace_only_required_values_are_removed(make_terra_table, make_mercury_table):
+  terra_table = make_terra_table(["ok", "blank_submitter", "blank_state"])
+  terra_table["gisaid_submitter"] = ["submitter", "  ", "submitter"]
+  terra_table["state"] = pd.Series(["NY", "NY", " \t"], dtype="category")
+  table = make_mercury_table(terra_table)
+  table.process_table()
+  assert table.outputs["missing_fields"] == {"blank_submitter": ["gisaid_submitter"], "blank_state": ["state"]}
+  assert table.outputs["missing_metadata_exclusions"].index.tolist() == ["blank_submitter", "blank_state"]
+  assert [name.split("/")[2] for name in table.outputs["gisaid"]["covv_virus_name"]] == ["ok"]
@@ -0,0 +1,26 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from Submission import Submission
+from Table import parse_dates
+
+
+def test_parse_dates():
+  dates = pd.Series([" 2021-03-01 ", "2021-03", "2021", None, "03/04/2021", "2021-02-30", "2021-13"], dtype="category")
+  parts = parse_dates(dates).replace({np.nan: None})
+  assert parts.values.tolist() == [
+    ["2021-03-01", "2021", "03", "01"], ["2021-03", "2021", "03", None], ["2021", "2021", None, None],
+    *[[None, None, None, None]] * 4,
+  ]
+
+
+def test_dates_are_written_without_surrounding_whitespace(tmp_path, make_terra_table):
+  table = make_terra_table(["padded", "invalid"])
+  table["collection_date"] = [" 2021-03-01 ", " 03/04/2021"]
+  result = Submission(table, "sample_id", ["padded", "invalid"], os.path.join(tmp_path, "bucket"), skip_ncbi=True,
+                      cache_directory=os.path.join(tmp_path, "cache"), logger=logging.getLogger(__name__)).run()
+  assert result.tables["gisaid"]["covv_collection_date"].tolist() == ["2021-03-01"]
+  assert result.quality_exclusions["sample_name"].tolist() == ["invalid"]
@@ -0,0 +1,59 @@
+import hashlib
+import logging
+import gzip
+import io
+import os
+
+import pytest
+
+from Fasta import FastaWriter
+
+
+def write_assemblies(writer, directory, assemblies):
+  for name, contents in assemblies.items():
+    path = os.path.join(directory, name)
+    with (gzip.open if name.endswith(".gz") else open)(path, "wb") as assembly:
+      assembly.write(contents)
+    writer.write(path, name.split(".")[0])
+
+
+def test_gzipped_assemblies_are_decompressed(tmp_path):
+  writer = FastaWriter(logging.getLogger(__name__), str(tmp_path / "combined.fasta"))
+  write_assemblies(writer, tmp_path, {"plain.fasta": b">old\nACGT\n", "compressed.fasta.gz": b">old\nTTGA\n"})
+  writer.close()
+  assert (tmp_path / "combined.fasta").read_bytes() == b">plain\nACGT\n>compressed\nTTGA\n"
+
+
+@pytest.mark.parametrize("block_size", [1024 * 1024, 3])
+def test_only_the_first_header_is_replaced(tmp_path, monkeypatch, block_size):
+  # a small block size splits the second header across blocks
+  monkeypatch.setattr(FastaWriter, "block_size", block_size)
+  (tmp_path / "segments.fasta").write_bytes(b">segment1\nACGT\n>segment2\nGG\n")
+  writer = FastaWriter(logging.getLogger(__name__), str(tmp_path / "combined.fasta"))
+  records = writer.write(str(tmp_path / "segments.fasta"), "new")
+  writer.close()
+  assert records == 2
+  assert writer.records_written == 2
+  assert (tmp_path / "combined.fasta").read_bytes() == b">new\nACGT\n>segment2\nGG\n"
+
+
+def test_a_missing_trailing_newline_does_not_merge_records(tmp_path):
+  stream = io.BytesIO()
+  writer = FastaWriter(logging.getLogger(__name__), str(tmp_path / "combined.fasta"), stream)
+  write_assemblies(writer, tmp_path, {"first.fasta": b">old\nACGT", "second.fasta": b">old\nTTGA\n"})
+  writer.close()
+  expected = b">first\nACGT\n>second\nTTGA\n"
+  assert (tmp_path / "combined.fasta").read_bytes() == stream.getvalue() == expected
+  assert (writer.bytes_written, writer.md5.hexdigest()) == (len(expected), hashlib.md5(expected).hexdigest())
+
+
+def test_sample_files_are_moved_into_place(tmp_path):
+  (tmp_path / "assembly.fasta").write_bytes(b">old\nACGT\n")
+  # a file left by an earlier run is replaced
+  (tmp_path / "sample_gisaid.fasta").write_bytes(b">stale\n")
+  writer = FastaWriter(logging.getLogger(__name__), None)
+  writer.write(str(tmp_path / "assembly.fasta"), "sample", str(tmp_path / "sample_gisaid.fasta"))
+  writer.close()
+  assert (tmp_path / "sample_gisaid.fasta").read_bytes() == b">sample\nACGT\n"
+  assert sorted(os.listdir(tmp_path)) == ["assembly.fasta", "sample_gisaid.fasta"]
+  assert writer.sample_files == [(str(tmp_path / "sample_gisaid.fasta"), 13, hashlib.md5(b">sample\nACGT\n").hexdigest())]
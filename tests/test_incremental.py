@@ -0,0 +1,23 @@
+import logging
+import os
+
+from Submission import Submission
+
+
+def run(directory, table):
+  return Submission(table, "sample_id", list(table["sample_id"]), os.path.join(directory, "bucket"), skip_ncbi=True,
+                    incremental=True, cache_directory=os.path.join(directory, "cache"), logger=logging.getLogger(__name__)).run()
+
+
+def test_rerun_with_only_excluded_samples_is_a_no_op(tmp_path, make_terra_table):
+  table = make_terra_table(["good", "bad"])
+  # the second sample is missing a required field, so it is excluded and never recorded as prepared
+  table.loc[1, "collecting_lab"] = ""
+  result = run(tmp_path, table)
+  assert list(result.tables["gisaid"]["covv_virus_name"].str.contains("good")) == [True]
+  assert list(result.missing_fields) == ["bad"]
+
+  # the good sample is unchanged and skipped, the bad one is checked again and excluded again
+  result = run(tmp_path, table)
+  assert "gisaid" not in result.tables
+  assert list(result.missing_fields) == ["bad"]
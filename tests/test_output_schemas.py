@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import os
+
+import pytest
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MERCURY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mercury", "mercury.py")
+SAMPLES = [f"S{number:02d}" for number in range(6)]
+
+# the expected outputs were written by the hand-built output tables that the schemas replaced, for every organism
+# (with and without the options that change the outputs); the directory name is the organism and the options
+CASES = {
+  "sars-cov-2": ("sars-cov-2", "SARS-CoV-2", []),
+  "sars-cov-2_skip_county_usa_territory": ("sars-cov-2", "SARS-CoV-2", ["--skip_county", "--usa_territory"]),
+  "mpox": ("mpox", "Mpox", []),
+  "mpox_skip_county_usa_territory": ("mpox", "Mpox", ["--skip_county", "--usa_territory"]),
+  "flu": ("flu", "Influenza A virus", []),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_outputs_match_the_hand_built_tables(tmp_path, case):
+  organism, organism_name, options = CASES[case]
+  for directory in ("assemblies", "reads", "bucket"):
+    os.makedirs(tmp_path / directory)
+  for sample in SAMPLES:
+    (tmp_path / "assemblies" / f"{sample}.fasta").write_text(">old\nACGT\n")
+    for read in ("R1", "R2"):
+      (tmp_path / "reads" / f"{sample}_{read}.fastq.gz").write_text("@r\nACGT\n+\nIIII\n")
+  with open(os.path.join(DATA_DIRECTORY, "terra_table.tsv")) as template:
+    (tmp_path / "table.tsv").write_text(template.read().replace("ORGANISM", organism_name))
+
+  result = subprocess.run([sys.executable, MERCURY, "table.tsv", "sample_id", ",".join(SAMPLES), "-b", "bucket", "--organism", organism,
+                           "--cache_directory", "cache", *options], cwd=tmp_path, capture_output=True, text=True)
+  assert result.returncode == 0, result.stderr
+
+  expected_directory = os.path.join(DATA_DIRECTORY, "output_schemas", case)
+  for name in sorted(os.listdir(expected_directory)):
+    with open(os.path.join(expected_directory, name), "rb") as expected, open(tmp_path / name, "rb") as output:
+      assert output.read() == expected.read(), name
@@ -0,0 +1,50 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def check_quality_with_rows(table, vadr_alert_limit, number_n_threshold):
+  """This function is the row-by-row quality check that the rule engine replaced
+  """
+  quality_exclusion = pd.DataFrame()
+  for index, row in table.iterrows():
+    year = row["collection_date"].split("-")[0] if re.match(r"^\d{4}-\d{2}-\d{2}", row["collection_date"]) else np.nan
+    if ("VADR skipped due to poor assembly") in str(row["vadr_num_alerts"]):
+      notification = "VADR skipped due to poor assembly"
+      quality_exclusion = pd.concat([quality_exclusion, pd.Series({"sample_name": row["sample_id"], "message": notification}).to_frame().T], ignore_index=True)
+    elif int(row["vadr_num_alerts"]) > vadr_alert_limit:
+      notification = "VADR number alerts too high: " + str(row["vadr_num_alerts"]) + " greater than limit of " + str(vadr_alert_limit)
+      quality_exclusion = pd.concat([quality_exclusion, pd.Series({"sample_name": row["sample_id"], "message": notification}).to_frame().T], ignore_index=True)
+    elif int(row["number_n"]) > number_n_threshold:
+      notification = "Number of Ns was too high: " + str(row["number_n"]) + " greater than limit of " + str(number_n_threshold)
+      quality_exclusion = pd.concat([quality_exclusion, pd.Series({"sample_name": row["sample_id"], "message": notification}).to_frame().T], ignore_index=True)
+    if pd.isna(year):
+      notification = "The collection date format was incorrect"
+      quality_exclusion = pd.concat([quality_exclusion, pd.Series({"sample_name": row["sample_id"], "message": notification}).to_frame().T], ignore_index=True)
+  return quality_exclusion
+
+
+def test_rules_match_the_row_by_row_check(make_terra_table, make_mercury_table):
+  terra_table = make_terra_table(["ok", "skipped", "alerts", "ns", "date", "alerts_and_date", "alerts_and_ns"])
+  terra_table["vadr_num_alerts"] = ["0", "VADR skipped due to poor assembly", "3", "0", "0", "2", "1"]
+  terra_table["number_n"] = [10, 10, 10, 6000, 10, 10, 6000]
+  terra_table["collection_date"] = ["2021-03-01", "2021-03-01", "2021-03-01", "2021-03-01", "03/04/2021", "2021/03/01", "2021-03-01"]
+  table = make_mercury_table(terra_table)
+  table.process_table()
+
+  expected = check_quality_with_rows(terra_table, 0, 5000)
+  assert table.outputs["quality_exclusions"].values.tolist() == expected.values.tolist()
+  assert table.outputs["gisaid"]["covv_virus_name"].str.contains("/ok/").tolist() == [True]
+
+
+def test_custom_minimum_coverage_rule(make_terra_table, make_mercury_table):
+  terra_table = make_terra_table(["deep", "shallow", "borderline"])
+  terra_table["assembly_mean_coverage"] = [500, 12.5, 50]
+  table = make_mercury_table(terra_table)
+  table.quality_control.add_threshold_rule("minimum_coverage", "assembly_mean_coverage", 50, "Coverage too low", minimum=True)
+  table.process_table()
+
+  # the limit itself passes
+  assert table.outputs["quality_exclusions"].values.tolist() == [["shallow", "Coverage too low: 12.5 less than minimum of 50"]]
+  assert [name.split("/")[2] for name in table.outputs["gisaid"]["covv_virus_name"]] == ["deep", "borderline"]
@@ -0,0 +1,31 @@
+import gzip
+import io
+import sys
+
+import pytest
+
+from Table import read_input_table
+
+TABLE = b"Sample_ID\tCountry\tunused\nsample1\tUSA\tx\nsample2\tPeru\ty\nsample3\tChile\tz\n"
+
+
+class Stdin:
+  # a pipe, which can be peeked at but not seeked or read twice
+  def __init__(self, data):
+    self.buffer = io.BufferedReader(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("data", [TABLE, gzip.compress(TABLE)])
+def test_reads_stdin_in_chunks(monkeypatch, data):
+  monkeypatch.setattr(sys, "stdin", Stdin(data))
+  table = read_input_table("-", "Sample_ID", ["sample1", "sample3"], {"country"}, chunk_size=1)
+  assert list(table.columns) == ["Sample_ID", "Country"]
+  assert table.values.tolist() == [["sample1", "USA"], ["sample3", "Chile"]]
+  assert sys.stdin.buffer.read() == b""
+
+
+def test_reads_a_file(tmp_path):
+  path = tmp_path / "table.tsv"
+  path.write_bytes(TABLE)
+  table = read_input_table(str(path), "Sample_ID", ["sample2"], {"country"})
+  assert table.values.tolist() == [["sample2", "Peru"]]
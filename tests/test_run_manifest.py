@@ -0,0 +1,21 @@
+import logging
+import json
+import os
+
+
+def test_no_manifest_is_written_without_resume(tmp_path, make_terra_table, make_mercury_table):
+  make_mercury_table(make_terra_table(["sample1", "sample2"]), write_files=True).process_table()
+  assert os.path.exists(tmp_path / "mercury_gisaid_combined.fasta")
+  assert not os.path.exists(tmp_path / "mercury_run_manifest.jsonl")
+
+
+def test_resume_records_the_outputs_and_skips_them_on_the_next_attempt(tmp_path, make_terra_table, make_mercury_table, caplog):
+  terra_table = make_terra_table(["sample1", "sample2"])
+  make_mercury_table(terra_table, keep_outputs=False, write_files=True, resume=True).process_table()
+  with open(tmp_path / "mercury_run_manifest.jsonl") as manifest:
+    destinations = [json.loads(line)["destination"] for line in manifest]
+  assert str(tmp_path / "mercury_gisaid_combined.fasta") in destinations
+
+  caplog.set_level(logging.INFO)
+  make_mercury_table(terra_table, keep_outputs=False, write_files=True, resume=True).process_table()
+  assert "mercury_gisaid_combined.fasta was already written from the same assemblies; skipping" in caplog.text
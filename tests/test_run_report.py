@@ -0,0 +1,36 @@
+import logging
+
+import numpy as np
+import pytest
+
+from RunReport import RunReport, read_memory_status, reset_peak_rss
+
+pytestmark = pytest.mark.skipif(read_memory_status() is None or not reset_peak_rss(), reason="the peak memory can only be reset on Linux")
+
+
+def test_stages_report_their_own_peak_memory():
+  run_report = RunReport(logging.getLogger(__name__))
+  with run_report.stage("allocate"):
+    array = np.ones(64 * 1024 * 1024 // 8)
+    array += 1
+    del array
+  with run_report.stage("small"):
+    pass
+  allocate, small = run_report.stages
+  # the 64 MB allocated by the first stage is freed, so it does not count toward the peak of the second
+  assert allocate["peak_rss_increase_mb"] >= 60
+  assert small["peak_rss_increase_mb"] < 10
+  assert small["peak_rss_mb"] < allocate["peak_rss_mb"] - 50
+  assert run_report.to_dict()["peak_rss_mb"] >= allocate["peak_rss_mb"]
+
+
+def test_nested_stages_include_the_peak_of_the_inner_stage():
+  run_report = RunReport(logging.getLogger(__name__))
+  with run_report.stage("outer"):
+    with run_report.stage("inner"):
+      array = np.ones(64 * 1024 * 1024 // 8)
+      array += 1
+      del array
+  inner, outer = run_report.stages
+  assert outer["peak_rss_mb"] >= inner["peak_rss_mb"]
+  assert outer["peak_rss_increase_mb"] >= 60
@@ -0,0 +1,18 @@
+import os
+
+import pandas as pd
+
+
+def test_no_reconciliation_file_when_every_sample_is_found_once(tmp_path, make_terra_table, make_mercury_table):
+  table = make_mercury_table(make_terra_table(["sample1", "sample2"]), write_files=True)
+  table.process_table()
+  assert not os.path.exists(tmp_path / "mercury_sample_reconciliation.tsv")
+  assert table.outputs["sample_reconciliation"]["status"].tolist() == ["found", "found"]
+
+
+def test_missing_and_duplicated_samples_are_written(tmp_path, make_terra_table, make_mercury_table):
+  terra_table = make_terra_table(["sample1", "sample2", "sample2"])
+  table = make_mercury_table(terra_table, samplenames=["sample1", "sample2", "sample3"], write_files=True)
+  table.process_table()
+  reconciliation = pd.read_csv(tmp_path / "mercury_sample_reconciliation.tsv", sep="\t")
+  assert reconciliation.values.tolist() == [["sample1", 1, 1, "found"], ["sample2", 2, 1, "duplicated"], ["sample3", 0, 1, "missing"]]
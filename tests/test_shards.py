@@ -0,0 +1,31 @@
+import logging
+import glob
+import os
+
+import pandas as pd
+
+from Submission import Submission
+
+
+def read_fasta_headers(path):
+  with open(path) as fasta:
+    return [line[1:].strip() for line in fasta if line.startswith(">")]
+
+
+def test_shard_rows_match_fasta_records_with_duplicated_samples(tmp_path, make_terra_table):
+  # "a" is in two identical rows of the table, which are kept by sample reconciliation
+  table = make_terra_table(["a", "a", "b", "c"])
+  output_prefix = os.path.join(tmp_path, "out", "mercury")
+  os.makedirs(os.path.dirname(output_prefix))
+  Submission(table, "sample_id", ["a", "b", "c"], os.path.join(tmp_path, "bucket"), skip_ncbi=True, write_files=True, shard_size=2,
+             output_prefix=output_prefix, cache_directory=os.path.join(tmp_path, "cache"), logger=logging.getLogger(__name__)).run()
+
+  metadata_shards = sorted(glob.glob(output_prefix + "_gisaid_metadata_shard*.csv"))
+  fasta_shards = sorted(glob.glob(output_prefix + "_gisaid_combined_shard*.fasta"))
+  assert len(metadata_shards) == len(fasta_shards) == 2
+  virus_names = []
+  for metadata_shard, fasta_shard in zip(metadata_shards, fasta_shards):
+    shard_names = pd.read_csv(metadata_shard)["covv_virus_name"].tolist()
+    assert shard_names == read_fasta_headers(fasta_shard)
+    virus_names.extend(shard_names)
+  assert [name.split("/")[2] for name in virus_names] == ["a", "b", "c"]
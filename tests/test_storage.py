@@ -0,0 +1,79 @@
+import subprocess
+import hashlib
+import base64
+import csv
+import os
+
+import pytest
+
+from Storage import GcloudStorage, LocalStorage, StorageBackend
+
+# the output of `gcloud storage ls -l -a` for an object with a noncurrent version, and one without
+VERSIONED_LISTING = """\
+     29020  2024-05-14T18:22:41Z  gs://bucket/assemblies/sample1.fasta#1715710961123456  metageneration=1
+     29104  2024-05-15T09:01:12Z  gs://bucket/assemblies/sample1.fasta#1715763672654321  metageneration=2
+      5120  2024-05-15T09:03:40Z  gs://bucket/assemblies/sample 2.fasta#1715763820000001  metageneration=1
+TOTAL: 3 objects, 63244 bytes (61.76kiB)
+"""
+
+LISTING = """\
+     29104  2024-05-15T09:01:12Z  gs://bucket/assemblies/sample1.fasta
+      5120  2024-05-15T09:03:40Z  gs://bucket/assemblies/sample 2.fasta
+TOTAL: 2 objects, 34224 bytes (33.42kiB)
+"""
+
+
+def test_parse_long_listing():
+  assert GcloudStorage().parse_long_listing(LISTING) == {"gs://bucket/assemblies/sample1.fasta": 29104, "gs://bucket/assemblies/sample 2.fasta": 5120}
+
+
+def test_parse_versioned_long_listing():
+  assert GcloudStorage().parse_long_listing(VERSIONED_LISTING) == {
+    "gs://bucket/assemblies/sample1.fasta#1715710961123456": 29020,
+    "gs://bucket/assemblies/sample1.fasta#1715763672654321": 29104,
+    "gs://bucket/assemblies/sample 2.fasta#1715763820000001": 5120,
+  }
+
+
+def test_versions_use_the_live_generation(monkeypatch):
+  monkeypatch.setattr(subprocess, "run", lambda *args, **kwargs: subprocess.CompletedProcess(args, 0, VERSIONED_LISTING))
+  assert GcloudStorage().versions(["gs://bucket/assemblies/sample1.fasta", "gs://bucket/assemblies/sample 2.fasta"]) == {
+    "gs://bucket/assemblies/sample1.fasta": "1715763672654321-29104",
+    "gs://bucket/assemblies/sample 2.fasta": "1715763820000001-5120",
+  }
+
+
+def test_batch_results_are_matched_to_their_files(tmp_path, monkeypatch):
+  transfers = []
+  for sample in ("a", "b", "c"):
+    (tmp_path / f"{sample}.fastq.gz").write_text(f"@{sample}\n")
+    transfers.append((str(tmp_path / f"{sample}.fastq.gz"), f"gs://bucket/reads/{sample}_R1.fastq.gz"))
+
+  def fake_run(command, input, **kwargs):
+    manifest_path = next(argument for argument in command if argument.startswith("--manifest-path=")).partition("=")[2]
+    # the links named after the destinations are uploaded
+    assert [os.path.basename(path) for path in input.split()] == ["a_R1.fastq.gz", "b_R1.fastq.gz", "c_R1.fastq.gz"]
+    # gcloud reports the files in the order they finished, and nothing about a file it did not get to
+    with open(manifest_path, "w", newline="") as manifest:
+      writer = csv.writer(manifest)
+      writer.writerow(["Source", "Destination", "Start", "End", "Md5", "UploadId", "Source Size", "Bytes Transferred", "Result", "Description"])
+      writer.writerow(["file://b", "gs://bucket/reads/b_R1.fastq.gz", "", "", "", "", "4", "0", "error", "403 Forbidden"])
+      writer.writerow(["file://a", "gs://bucket/reads/a_R1.fastq.gz", "", "", base64.b64encode(hashlib.md5(b"@a\n").digest()).decode(), "", "3", "3", "OK", ""])
+    return subprocess.CompletedProcess(command, 1, None, "Copying files\nERROR: (gcloud.storage.cp) 2 of 3 files failed\n")
+
+  monkeypatch.setattr(subprocess, "run", fake_run)
+  results, failures = GcloudStorage().copy_batch(transfers)
+  assert results == {transfers[0]: (3, hashlib.md5(b"@a\n").hexdigest())}
+  assert failures == {transfers[1]: "403 Forbidden", transfers[2]: "ERROR: (gcloud.storage.cp) 2 of 3 files failed"}
+
+
+def test_an_incomplete_backend_cannot_be_created():
+  class ListingOnlyStorage(StorageBackend):
+    def list(self, prefix):
+      return {}
+
+  with pytest.raises(TypeError, match="copy_object, get, put, stat"):
+    ListingOnlyStorage()
+  # the backends that come with Mercury implement every operation
+  GcloudStorage()
+  LocalStorage()
@@ -0,0 +1,15 @@
+import logging
+import os
+
+from SubmissionState import SubmissionState
+
+
+def test_creates_missing_cache_directory(tmp_path):
+  path = os.path.join(tmp_path, "new_cache", "nested", "submission_state.sqlite")
+  state = SubmissionState(logging.getLogger(__name__), path)
+  state.record("flu", {"sample1": "abc"})
+  state.close()
+  assert os.path.exists(path)
+  state = SubmissionState(logging.getLogger(__name__), path)
+  assert state.get_fingerprints("flu", ["sample1", "sample2"]) == {"sample1": "abc"}
+  state.close()
@@ -0,0 +1,124 @@
+import threading
+import logging
+import time
+import os
+import re
+
+import pytest
+
+import Transfer
+from Storage import LocalStorage
+from Submission import Submission
+from Table import TableError
+
+SAMPLES = [f"sample{number}" for number in range(6)]
+
+
+def run(tmp_path, table, **options):
+  """This function prepares the NCBI and GISAID submissions with a local directory as the bucket
+  """
+  return Submission(table, "sample_id", SAMPLES, os.path.join(tmp_path, "bucket"), cache_directory=os.path.join(tmp_path, "cache"),
+                    transfer_batch_size=0, logger=logging.getLogger(__name__), **options).run()
+
+
+def test_uploads_run_at_most_transfer_concurrency_at_once(tmp_path, make_terra_table, monkeypatch):
+  put = LocalStorage.put
+  running = []
+  peak = []
+  lock = threading.Lock()
+
+  def slow_put(self, path, uri):
+    with lock:
+      running.append(uri)
+      peak.append(len(running))
+    time.sleep(0.05)
+    with lock:
+      running.remove(uri)
+    return put(self, path, uri)
+
+  monkeypatch.setattr(LocalStorage, "put", slow_put)
+  result = run(tmp_path, make_terra_table(SAMPLES), transfer_concurrency=3)
+  assert max(peak) == 3
+  assert sorted(os.listdir(tmp_path / "bucket")) == sorted(f"{sample}_{read}.fastq.gz" for sample in SAMPLES for read in ("R1", "R2"))
+  assert result.run_report["transfers"][0]["files"] == 12
+
+
+def test_a_failed_upload_is_retried_with_backoff(tmp_path, make_terra_table, monkeypatch):
+  put = LocalStorage.put
+  attempts = []
+
+  def flaky_put(self, path, uri):
+    attempts.append(uri)
+    if uri.endswith("sample2_R1.fastq.gz") and attempts.count(uri) < 3:
+      raise OSError("connection reset")
+    return put(self, path, uri)
+
+  delays = []
+  monkeypatch.setattr(LocalStorage, "put", flaky_put)
+  monkeypatch.setattr(Transfer.time, "sleep", delays.append)
+  run(tmp_path, make_terra_table(SAMPLES), transfer_retries=3)
+  # the delay doubles after every failure
+  assert delays == [2.0, 4.0]
+  assert os.path.exists(tmp_path / "bucket" / "sample2_R1.fastq.gz")
+
+
+def test_the_first_failure_stops_new_uploads(tmp_path, make_terra_table, monkeypatch):
+  put = LocalStorage.put
+
+  def failing_put(self, path, uri):
+    if uri.endswith("sample1_R1.fastq.gz"):
+      raise OSError("permission denied")
+    return put(self, path, uri)
+
+  monkeypatch.setattr(LocalStorage, "put", failing_put)
+  with pytest.raises(TableError) as error:
+    run(tmp_path, make_terra_table(SAMPLES), transfer_concurrency=1, transfer_retries=0)
+  failed, completed, not_started = map(int, re.search(r"(\d+) transfer\(s\) failed; (\d+) completed and (\d+) were not started", str(error.value)).groups())
+  # with a single worker only the upload before the failed one completed, and every upload is reported as done,
+  # failed or not started
+  assert (failed, completed, not_started) == (1, 1, 10)
+  assert len(os.listdir(tmp_path / "bucket")) == completed
+
+
+def test_failed_transfers_are_retried_in_new_batches(monkeypatch):
+  delays = []
+  monkeypatch.setattr(Transfer.time, "sleep", delays.append)
+  transfers = [(f"source{number}", f"destination{number}") for number in range(5)]
+  batches = []
+
+  def copy_batch(batch):
+    batches.append(batch)
+    # the first attempt of source3 fails; the rest of its batch is copied
+    if len(batches) <= 2:
+      return {transfer: 10 for transfer in batch if transfer[0] != "source3"}, {transfer: OSError("timeout") for transfer in batch if transfer[0] == "source3"}
+    return {transfer: 10 for transfer in batch}, {}
+
+  scheduler = Transfer.TransferScheduler(logging.getLogger(__name__), concurrency=1, retries=2)
+  statistics = scheduler.run_batches(transfers, copy_batch, lambda batch: [batch[start:start + 3] for start in range(0, len(batch), 3)])
+  assert batches[2:] == [[("source3", "destination3")]]
+  assert delays == [2.0]
+  assert (statistics["files"], statistics["bytes"]) == (5, 50)
+
+
+def test_reads_in_the_bucket_are_only_sent_again_if_their_size_differs(tmp_path, make_terra_table, monkeypatch):
+  table = make_terra_table(SAMPLES)
+  bucket = tmp_path / "bucket"
+  bucket.mkdir()
+  # one read was uploaded completely and the other was cut short
+  with open(table["read1_dehosted"][0], "rb") as read_file:
+    (bucket / "sample0_R1.fastq.gz").write_bytes(read_file.read())
+  (bucket / "sample0_R2.fastq.gz").write_bytes(b"@sample0")
+
+  put = LocalStorage.put
+  sent = []
+
+  def recording_put(self, path, uri):
+    sent.append(os.path.basename(uri))
+    return put(self, path, uri)
+
+  monkeypatch.setattr(LocalStorage, "put", recording_put)
+  run(tmp_path, table)
+  assert "sample0_R1.fastq.gz" not in sent
+  assert "sample0_R2.fastq.gz" in sent
+  assert len(sent) == 11
+  assert os.path.getsize(bucket / "sample0_R2.fastq.gz") == os.path.getsize(table["read2_dehosted"][0])